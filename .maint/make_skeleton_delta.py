@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Generate deltas from earlier skeletons to templateflow-skel.zip.
+
+Clients that opted in (``TEMPLATEFLOW_SKELETON_DELTAS=on``) and keep an earlier
+skeleton with checksum ``<md5>`` look for ``templateflow-skel.<md5>.delta.zip``
+next to the latest skeleton, and only fetch the whole skeleton if it is missing.
+
+Clients rebuild the latest skeleton with its members sorted by name, so the
+skeleton is first rewritten that way, and each delta is checked to rebuild it
+exactly.
+This script must run after update_skeleton_manifest.py, and before the skeleton's
+checksum (templateflow-skel.md5) is generated.
+
+Usage: python .maint/make_skeleton_delta.py earlier-skel.zip [earlier-skel.zip ...]
+"""
+
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from zipfile import ZipFile
+
+repo_root = Path(__file__).parent.parent
+sys.path.insert(0, str(repo_root))
+
+from templateflow.conf._s3 import _file_md5, apply_delta, make_delta  # noqa: E402
+
+skel_zip = repo_root / 'templateflow' / 'conf' / 'templateflow-skel.zip'
+
+
+def sort_members(path):
+    """Rewrite a zip file with its members sorted by name."""
+    with ZipFile(path) as zipref:
+        members = sorted(
+            ((info, zipref.read(info)) for info in zipref.infolist()), key=lambda m: m[0].filename
+        )
+    with ZipFile(path, 'w') as zipref:
+        for info, data in members:
+            zipref.writestr(info, data)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('earlier', nargs='+', type=Path, help='skeletons published before')
+    parser.add_argument(
+        '--output-dir', type=Path, default=skel_zip.parent, help='where deltas are written'
+    )
+    opts = parser.parse_args()
+
+    sort_members(skel_zip)
+    latest = _file_md5(skel_zip)
+    with TemporaryDirectory() as tmpdir:
+        for earlier in opts.earlier:
+            delta = opts.output_dir / f'templateflow-skel.{_file_md5(earlier)}.delta.zip'
+            make_delta(earlier, skel_zip, delta)
+
+            rebuilt = Path(tmpdir) / 'rebuilt.zip'
+            apply_delta(earlier, delta, rebuilt)
+            if _file_md5(rebuilt) != latest:
+                delta.unlink()
+                sys.exit(f'The delta from <{earlier}> does not rebuild {skel_zip.name}.')
+            print(f'Wrote {delta.name} ({delta.stat().st_size} bytes).')
+
+
+if __name__ == '__main__':
+    main()
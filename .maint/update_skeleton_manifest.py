@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Embed an entity manifest into templateflow-skel.zip.
+
+The manifest lists every file of the skeleton with its parsed entities and,
+when available, its expected size and checksum, so that clients can build
+their query index without walking TEMPLATEFLOW_HOME.
+
+Sizes and checksums of files embedded in the skeleton are taken from the zip.
+For empty placeholders, they are read from the S3 bucket listing if
+``--s3-root`` is given (S3 ETags are MD5 sums unless the object was uploaded
+in parts, in which case no checksum is recorded).
+
+Releases must regenerate the manifest with ``--s3-root`` and ``--require-checksums``,
+which fails if any file is left without a checksum (clients otherwise fall back to
+the ETag of each download).
+
+This script must run before the skeleton's checksum (templateflow-skel.md5)
+is generated.
+
+Usage: python .maint/update_skeleton_manifest.py \
+    [--s3-root https://templateflow.s3.amazonaws.com] [--require-checksums]
+"""
+
+import json
+import sys
+from argparse import ArgumentParser
+from hashlib import md5
+from pathlib import Path
+from zipfile import ZIP_DEFLATED, ZipFile
+
+repo_root = Path(__file__).parent.parent
+sys.path.insert(0, str(repo_root))
+
+from templateflow.conf.index import MANIFEST, make_manifest  # noqa: E402
+
+skel_zip = repo_root / 'templateflow' / 'conf' / 'templateflow-skel.zip'
+
+
+def s3_listing(s3_root):
+    """Read sizes and MD5 checksums from a (public) S3 bucket listing."""
+    from xml.etree import ElementTree as ET
+
+    import requests
+
+    ns = {'s3': 'http://s3.amazonaws.com/doc/2006-03-01/'}
+    sizes, checksums = {}, {}
+    params = {'list-type': '2'}
+    while True:
+        r = requests.get(s3_root, params=params, timeout=30)
+        r.raise_for_status()
+        root = ET.fromstring(r.content)  # noqa: S314
+        for item in root.findall('s3:Contents', ns):
+            key = item.find('s3:Key', ns).text
+            sizes[key] = int(item.find('s3:Size', ns).text)
+            etag = item.find('s3:ETag', ns).text.strip('"')
+            if '-' not in etag:
+                checksums[key] = f'md5:{etag}'
+        token = root.find('s3:NextContinuationToken', ns)
+        if token is None:
+            return sizes, checksums
+        params['continuation-token'] = token.text
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--s3-root', help='read sizes and checksums from this bucket')
+    parser.add_argument(
+        '--require-checksums',
+        action='store_true',
+        help='fail, leaving the skeleton untouched, if any file lacks a checksum',
+    )
+    opts = parser.parse_args()
+
+    sizes, checksums = s3_listing(opts.s3_root) if opts.s3_root else ({}, {})
+
+    with ZipFile(skel_zip) as zipref:
+        members = [
+            (info, zipref.read(info)) for info in zipref.infolist() if info.filename != MANIFEST
+        ]
+
+    for info, data in members:
+        if info.file_size:
+            sizes[info.filename] = info.file_size
+            checksums[info.filename] = f'md5:{md5(data).hexdigest()}'  # noqa: S324
+
+    manifest = make_manifest(
+        [info.filename for info, _ in members], sizes=sizes, checksums=checksums
+    )
+    unchecked = sorted(path for path, entry in manifest['files'].items() if not entry['checksum'])
+    if unchecked:
+        print(
+            f'{len(unchecked)} of {len(manifest["files"])} entries have no checksum '
+            f'(e.g., {unchecked[0]}).',
+            file=sys.stderr,
+        )
+        if opts.require_checksums:
+            sys.exit(1)
+
+    with ZipFile(skel_zip, 'w', compression=ZIP_DEFLATED) as zipref:
+        for info, data in members:
+            zipref.writestr(info, data)
+        zipref.writestr(MANIFEST, json.dumps(manifest, separators=(',', ':')))
+    print(f'Added {len(manifest["files"])} entries to {MANIFEST} in {skel_zip.name}.')
+
+
+if __name__ == '__main__':
+    main()
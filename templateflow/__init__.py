@@ -39,14 +39,33 @@ except ModuleNotFoundError:
     del version
     del PackageNotFoundError
 
-from templateflow import api
-from templateflow.client import TemplateFlowClient
-from templateflow.conf import update
+
+def __getattr__(name: str):
+    # Submodules and clients are imported on first use, to keep importing templateflow fast
+    if name in ('api', 'client', 'conf'):
+        from importlib import import_module
+
+        return import_module(f'templateflow.{name}')
+    elif name in ('AsyncTemplateFlowClient', 'TemplateFlowClient'):
+        from templateflow import client
+
+        return getattr(client, name)
+    elif name == 'update':
+        from templateflow.conf import update
+
+        return update
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+def __dir__() -> list[str]:
+    return sorted(__all__)
+
 
 __all__ = [
     '__copyright__',
     '__packagename__',
     '__version__',
+    'AsyncTemplateFlowClient',
     'TemplateFlowClient',
     'api',
     'update',
@@ -38,6 +38,10 @@ while ``templateflow.api`` is only configurable through environment variables.
 
 .. autofunction:: ls
 
+.. autofunction:: get_many
+
+.. autofunction:: ls_many
+
 .. autofunction:: templates
 
 .. autofunction:: get_metadata
@@ -45,16 +49,39 @@ while ``templateflow.api`` is only configurable through environment variables.
 .. autofunction:: get_citations
 """
 
-from .client import TemplateFlowClient
-from .conf import _cache
+from __future__ import annotations
+
+from threading import Lock
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from .client import TemplateFlowClient
+
+# The global client is set up on first use (see _get_client)
+_CLIENT: TemplateFlowClient | None = None
+_CLIENT_LOCK = Lock()
+
+
+def _get_client() -> TemplateFlowClient:
+    """Return the client operating on the global cache."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            from .client import TemplateFlowClient
+            from .conf import _get_cache
 
-_client = TemplateFlowClient(cache=_cache)
+            _CLIENT = TemplateFlowClient(cache=_get_cache())
+        return _CLIENT
 
 
 def __getattr__(name: str):
+    if name.startswith('__'):  # Probes for special attributes do not set the client up
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    if name == '_client':
+        return _get_client()
     if name == 'TF_LAYOUT':
-        return _cache.layout
+        return _get_client().cache.layout
     try:
-        return getattr(_client, name)
+        return getattr(_get_client(), name)
     except AttributeError:
         raise AttributeError(f"module '{__name__}' has no attribute '{name}'") from None
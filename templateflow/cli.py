@@ -31,8 +31,11 @@ import click
 from acres import Loader as _Loader
 from click.decorators import FC, Option, _param_memo
 
-from templateflow.client import TemplateFlowClient
-from templateflow.conf import _cache
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from click.shell_completion import CompletionItem
+
+    from templateflow.client import TemplateFlowClient
 
 load_data = _Loader(__spec__.parent)
 
@@ -49,12 +52,75 @@ ENTITY_SHORTHANDS = {
 }
 ENTITY_EXCLUDE = {'template', 'description'}
 
-CLIENT = TemplateFlowClient(cache=_cache)
-CACHE = CLIENT.cache
-CONFIG = CACHE.config
-CACHE.ensure()
+# The client is set up when a command first needs it (see _get_client), so that
+# printing help or completing the command line does not touch the TemplateFlow home
+CLIENT: TemplateFlowClient | None = None
+
+
+def _get_client() -> TemplateFlowClient:
+    global CLIENT
+    if CLIENT is None:
+        from templateflow.api import _get_client as _get_api_client
+
+        CLIENT = _get_api_client()
+    return CLIENT
+
+
+def __getattr__(name: str):
+    if name == 'CACHE':
+        return _get_client().cache
+    elif name == 'CONFIG':
+        return _get_client().cache.config
+    elif name == 'TEMPLATE_LIST':
+        return _templates(_get_client().cache.config.root)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+def _templates(root: Path) -> list[str]:
+    return [d.name[4:] for d in root.iterdir() if d.name.startswith('tpl-')]
+
+
+def _completions() -> dict[str, dict[str, list[str]]]:
+    """Read the cached summary of the home folder, without setting it up."""
+    from templateflow.conf.env import get_templateflow_home
+    from templateflow.conf.index import load_completions
+
+    root = get_templateflow_home() if CLIENT is None else CLIENT.cache.config.root
+    return load_completions(root) if root.is_dir() else {}
+
+
+class TemplateType(click.ParamType):
+    """A template available in the TemplateFlow home."""
+
+    name = 'template'
+
+    def get_metavar(self, param, ctx=None) -> str:
+        return 'TEMPLATE'
 
-TEMPLATE_LIST = [d.name[4:] for d in CONFIG.root.iterdir() if d.name.startswith('tpl-')]
+    def convert(self, value, param, ctx):
+        if ctx is not None and ctx.resilient_parsing:  # Completing, do not set up the client
+            return value
+        choices = _templates(_get_client().cache.config.root)
+        if value not in choices:
+            self.fail(
+                f'{value!r} is not one of {", ".join(map(repr, sorted(choices)))}.', param, ctx
+            )
+        return value
+
+    def shell_complete(self, ctx, param, incomplete) -> list[CompletionItem]:
+        from click.shell_completion import CompletionItem
+
+        return [CompletionItem(t) for t in _completions() if t.startswith(incomplete)]
+
+
+def _complete_entity(ctx, param, incomplete) -> list[str]:
+    """Complete the values an entity takes (within the template, if given already)."""
+    completions = _completions()
+    # While completing an option's value, parsing stops early and leaves the template unparsed
+    template = ctx.params.get('template') or next(iter(ctx.args), None)
+    templates = [completions.get(template, {})] if template else completions.values()
+    values = {v for entities in templates for v in entities.get(param.name, ())}
+    return sorted((v for v in values if v.startswith(incomplete)), key=str.lower)
 
 
 def _nulls(s):
@@ -74,7 +140,16 @@ def entity_opts():
 
     def decorator(f: FC) -> FC:
         for arg in reversed(args):
-            _param_memo(f, Option(arg, type=str, default=[], multiple=True))
+            _param_memo(
+                f,
+                Option(
+                    arg,
+                    type=str,
+                    default=[],
+                    multiple=True,
+                    shell_complete=_complete_entity,
+                ),
+            )
         return f
 
     return decorator
@@ -90,68 +165,167 @@ def main():
 @main.command()
 def config():
     """Print-out configuration."""
+    settings = _get_client().cache.config
     click.echo(f"""Current TemplateFlow settings:
 
-    TEMPLATEFLOW_HOME={CONFIG.root}
-    TEMPLATEFLOW_USE_DATALAD={'on' if CONFIG.use_datalad else 'off'}
-    TEMPLATEFLOW_AUTOUPDATE={'on' if CONFIG.autoupdate else 'off'}
+    TEMPLATEFLOW_HOME={settings.root}
+    TEMPLATEFLOW_USE_DATALAD={'on' if settings.use_datalad else 'off'}
+    TEMPLATEFLOW_AUTOUPDATE={'on' if settings.autoupdate else 'off'}
 """)
 
 
 @main.command()
 def wipe():
     """Wipe out a local S3 (direct-download) TemplateFlow Archive."""
-    click.echo(f'This will wipe out all data downloaded into {CONFIG.root}.')
+    root = _get_client().cache.config.root
+    click.echo(f'This will wipe out all data downloaded into {root}.')
 
     if click.confirm('Do you want to continue?'):
         value = click.prompt(
-            f'Please write the path of your local archive ({CONFIG.root})',
+            f'Please write the path of your local archive ({root})',
             default='(abort)',
             show_default=False,
         )
-        if value.strip() == str(CONFIG.root):
+        if value.strip() == str(root):
             from templateflow.conf import wipe
 
             wipe()
-            click.echo(f'{CONFIG.root} was wiped out.')
+            click.echo(f'{root} was wiped out.')
             return
-    click.echo(f'Aborted! {CONFIG.root} WAS NOT wiped out.')
+    click.echo(f'Aborted! {root} WAS NOT wiped out.')
 
 
 @main.command()
 @click.option('--local', is_flag=True)
 @click.option('--overwrite/--no-overwrite', default=True)
-def update(local, overwrite):
+@click.option('--revalidate', is_flag=True, help='Download again the files that changed upstream.')
+def update(local, overwrite, revalidate):
     """Update the local TemplateFlow Archive."""
     from templateflow.conf import update as _update
 
+    client = _get_client()
     click.echo(
-        f'Successfully updated local TemplateFlow Archive: {CONFIG.root}.'
+        f'Successfully updated local TemplateFlow Archive: {client.cache.config.root}.'
         if _update(local=local, overwrite=overwrite)
         else 'TemplateFlow Archive not updated.'
     )
+    if revalidate:
+        changed = client.revalidate()
+        click.echo(f'{len(changed)} files changed upstream and were downloaded again.')
 
 
 @main.command()
 @entity_opts()
-@click.argument('template', type=click.Choice(TEMPLATE_LIST))
+@click.argument('template', type=TemplateType())
 def ls(template, **kwargs):
     """List the assets corresponding to template and optional filters."""
     entities = {k: _nulls(v) for k, v in kwargs.items() if v != ''}
-    click.echo('\n'.join(f'{match}' for match in CLIENT.ls(template, **entities)))
+    click.echo('\n'.join(f'{match}' for match in _get_client().ls(template, **entities)))
 
 
 @main.command()
 @entity_opts()
-@click.argument('template', type=click.Choice(TEMPLATE_LIST))
+@click.argument('template', type=TemplateType())
 def get(template, **kwargs):
     """Fetch the assets corresponding to template and optional filters."""
     entities = {k: _nulls(v) for k, v in kwargs.items() if v != ''}
-    paths = CLIENT.get(template, **entities)
+    paths = _get_client().get(template, **entities)
     filenames = [str(paths)] if isinstance(paths, Path) else [str(file) for file in paths]
     click.echo('\n'.join(filenames))
 
 
+@main.command()
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    '-j',
+    '--jobs',
+    type=click.IntRange(min=1),
+    default=None,
+    help='Number of files downloaded concurrently.',
+)
+@click.option('--dry-run', is_flag=True, help='List the files that would be downloaded.')
+def prefetch(manifest, jobs, dry_run):
+    """Fetch all the assets matching the queries listed in a manifest.
+
+    The MANIFEST is a JSON or YAML list of queries (mappings of a ``template``
+    and entity filters), or a TSV file with a ``template`` column and one column
+    per entity (empty cells are not filtered on, and ``null`` cells match files
+    without the entity).
+    YAML manifests require the ``yaml`` extra (``pip install "templateflow[yaml]"``).
+    """
+    from dataclasses import replace
+    from time import perf_counter
+
+    from templateflow.client import TemplateFlowClient
+    from templateflow.conf.cache import TemplateFlowCache
+
+    client = _get_client()
+    if jobs is not None:
+        # Download through a client of its own, leaving the shared one as configured
+        client = TemplateFlowClient(
+            cache=TemplateFlowCache(replace(client.cache.config, max_workers=jobs))
+        )
+    try:
+        queries = _load_queries(manifest)
+        paths = list(dict.fromkeys(p for result in client.ls_many(queries) for p in result))
+    except ValueError as exc:
+        raise click.UsageError(str(exc)) from exc
+
+    # Files held by read-only layers are located there
+    missing = [
+        p for p in map(client.cache.locate, paths) if not p.is_file() or not p.stat().st_size
+    ]
+    if dry_run:
+        click.echo('\n'.join(f'{path}' for path in missing))
+        return
+
+    start = perf_counter()
+    client.get_many(queries)
+    elapsed = perf_counter() - start
+
+    size = sum(p.stat().st_size for p in missing) / 2**20
+    click.echo(
+        f'{len(paths)} files matched by {len(queries)} queries, '
+        f'{len(paths) - len(missing)} already cached. '
+        f'Downloaded {len(missing)} files ({size:.1f} MiB) in {elapsed:.1f} s '
+        f'({size / max(elapsed, 1e-3):.1f} MiB/s).'
+    )
+
+
+def _load_queries(manifest: Path) -> list[dict]:
+    """Read a list of queries from a JSON, YAML or TSV manifest."""
+    suffix = manifest.suffix.lower()
+    if suffix == '.tsv':
+        import csv
+
+        with manifest.open(newline='') as f:
+            return [
+                {
+                    key: _nulls(value) if ',' not in value else value.split(',')
+                    for key, value in row.items()
+                    if value
+                }
+                for row in csv.DictReader(f, delimiter='\t')
+            ]
+
+    if suffix in ('.yml', '.yaml'):
+        try:
+            import yaml
+        except ImportError as exc:
+            raise ValueError(
+                'Reading YAML manifests requires PyYAML '
+                '(install it with: pip install "templateflow[yaml]").'
+            ) from exc
+
+        queries = yaml.safe_load(manifest.read_text())
+    else:
+        queries = json.loads(manifest.read_text())
+
+    if not isinstance(queries, list) or not all(isinstance(q, dict) for q in queries):
+        raise ValueError(f'Manifest <{manifest}> must hold a list of queries.')
+    return queries
+
+
 if __name__ == '__main__':
     """ Install entry-point """
     main()
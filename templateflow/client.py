@@ -24,12 +24,34 @@
 
 from __future__ import annotations
 
+import asyncio
 import os
 import sys
+from collections import OrderedDict, namedtuple
+from collections.abc import Iterable, Mapping
+from functools import lru_cache
 from json import loads
 from pathlib import Path
+from threading import Lock
+from typing import Any
 
-from templateflow.conf.cache import CacheConfig, TemplateFlowCache
+from templateflow.conf._http import DownloadError, MirrorSet, is_transient
+from templateflow.conf.cache import CacheConfig, RetryPolicy, TemplateFlowCache, _have_httpx
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing_extensions import Self
+
+    from templateflow.conf.progress import ProgressTracker
+
+# Size of the byte ranges large files are downloaded in
+MULTIPART_CHUNKSIZE = 16 * 2**20
+# Bytes read from responses at a time
+STREAM_CHUNKSIZE = 2**16
+# Bytes asynchronous downloads buffer before writing them out on a worker thread
+WRITE_BUFFERSIZE = 2**20
+
+QueryCacheInfo = namedtuple('QueryCacheInfo', ('hits', 'misses', 'maxsize', 'currsize'))
 
 
 class TemplateFlowClient:
@@ -65,13 +87,70 @@ class TemplateFlowClient:
         Whether to automatically update the cache on first load.
         Defaults to ``True`` or the value of the ``TEMPLATEFLOW_AUTOUPDATE``
         environment variable (1/True/on/yes to enable, 0/False/off/no to disable).
+    update_ttl: :class:`float`, optional
+        Seconds after checking for a newer skeleton during which updates do not check
+        again (``0`` always checks). Defaults to ``3600`` or the value of the
+        ``TEMPLATEFLOW_UPDATE_TTL`` environment variable.
+    skeleton_deltas: :class:`bool`, optional
+        Whether updates fetch only the changes since the last skeleton fetched, when
+        upstream publishes them. Defaults to ``False`` or the value of the
+        ``TEMPLATEFLOW_SKELETON_DELTAS`` environment variable.
     timeout: :class:`float`, optional
         Timeout in seconds for network operations. Default is ``10.0`` seconds.
+    layout_cache: :class:`bool`, optional
+        Whether to persist the layout index within the cache, so that other processes
+        can reuse it. Defaults to ``True`` or the value of the ``TEMPLATEFLOW_LAYOUT_CACHE``
+        environment variable (1/True/on/yes to enable, 0/False/off/no to disable).
+    query_engine: :class:`str`, optional
+        Index answering queries, either ``'pybids'`` (default) or ``'native'``, a lightweight
+        engine that does not require PyBIDS to index the cache.
+        Defaults to the value of the ``TEMPLATEFLOW_QUERY_ENGINE`` environment variable.
+    query_cache_size: :class:`int`, optional
+        Maximum number of query results memoized by the client (``0`` disables memoization).
+        Defaults to ``256`` or the value of the ``TEMPLATEFLOW_QUERY_CACHE_SIZE``
+        environment variable.
+    lazy_index: :class:`bool`, optional
+        Whether to index each template only when first queried (implies the native
+        query engine). Defaults to ``False`` or the value of the ``TEMPLATEFLOW_LAZY_INDEX``
+        environment variable (1/True/on/yes to enable, 0/False/off/no to disable).
+    max_workers: :class:`int`, optional
+        Maximum number of files downloaded concurrently. Defaults to ``8`` or the value
+        of the ``TEMPLATEFLOW_MAX_WORKERS`` environment variable.
+    multipart_threshold: :class:`int`, optional
+        Size in bytes above which files are downloaded as several byte ranges in parallel
+        (``0`` disables). Defaults to 64 MiB or the value of the
+        ``TEMPLATEFLOW_MULTIPART_THRESHOLD`` environment variable.
+    retry: :class:`~templateflow.conf.cache.RetryPolicy`, optional
+        How transiently failing network requests are retried. By default, requests are
+        retried up to three times (or ``TEMPLATEFLOW_RETRIES`` times) with exponential
+        backoff, for up to 300 seconds (or ``TEMPLATEFLOW_RETRY_DEADLINE`` seconds).
+    blob_store: :class:`os.PathLike`, optional
+        Folder storing downloads by checksum, to share them across TemplateFlow homes
+        as hardlinks. Disabled by default, unless the ``TEMPLATEFLOW_BLOB_STORE``
+        environment variable is set.
+    layers: :class:`list` of :class:`os.PathLike`, optional
+        Read-only TemplateFlow trees looked up, in order, before downloading files into
+        ``root``. Defaults to the ``TEMPLATEFLOW_LAYERS`` environment variable (paths
+        separated by :data:`os.pathsep`).
+    progress: :class:`bool` or callable, optional
+        How the progress of downloads is reported: ``True`` shows one progress bar per
+        batch of downloads, ``False`` reports nothing, and a callable receives
+        :class:`~templateflow.conf.progress.DownloadProgress` snapshots. Defaults to
+        ``True`` or the value of the ``TEMPLATEFLOW_PROGRESS`` environment variable.
     origin: :class:`str`, optional
         Git repository URL for DataLad installations. Default is
         <https://github.com/templateflow/templateflow.git>.
-    s3_root: :class:`str`, optional
+    s3_root: :class:`str` or :class:`list` of :class:`str`, optional
         Base URL for S3 downloads. Default is <https://templateflow.s3.amazonaws.com>.
+        A list of URLs sets the primary root followed by its mirrors.
+    s3_mirrors: :class:`list` of :class:`str`, optional
+        Base URLs of servers mirroring ``s3_root``. Files are downloaded from the fastest
+        mirror responding. Defaults to the ``TEMPLATEFLOW_S3_MIRRORS`` environment variable
+        (URLs separated by commas or spaces).
+    hedge_after: :class:`float`, optional
+        Seconds to wait for a mirror to answer before also asking the next one (``0``
+        disables). Defaults to ``0`` or the value of the ``TEMPLATEFLOW_HEDGE_AFTER``
+        environment variable.
     cache: :class:`TemplateFlowCache`, optional
         A pre-configured TemplateFlowCache instance. If provided, `root` and other
         configuration keyword arguments cannot be used.
@@ -93,6 +172,10 @@ class TemplateFlowClient:
                 'If `cache` is provided, `root` and other config kwargs cannot be used.'
             )
         self.cache = cache
+        self._queries = OrderedDict()
+        self._queries_lock = Lock()
+        self._queries_generation = cache.generation
+        self._hits = self._misses = 0
 
     def __repr__(self) -> str:
         cache_type = 'DataLad' if self.cache.config.use_datalad else 'S3'
@@ -101,8 +184,8 @@ class TemplateFlowClient:
     def __getattr__(self, name: str):
         name = name.replace('ls_', 'get_')
         try:
-            if name.startswith('get_') and name not in dir(self.cache.layout):
-                return getattr(self.cache.layout, name)
+            if name.startswith('get_') and name not in dir(self.cache.engine):
+                return getattr(self.cache.engine, name)
         except AttributeError:
             pass
         msg = f"'{self.__class__.__name__}' object has no attribute '{name}'"
@@ -158,18 +241,88 @@ class TemplateFlowClient:
         []
 
         """
-        from bids.layout import Query
-
         # Normalize extensions to always have leading dot
         if 'extension' in kwargs:
             kwargs['extension'] = _normalize_ext(kwargs['extension'])
 
-        return [
+        key = _query_key(template, kwargs)
+        result = self._cached_query(key)
+        if result is None:
+            result = self._query(template, **kwargs)
+            self._cache_query(key, result)
+        return list(result)
+
+    def query_cache_info(self) -> QueryCacheInfo:
+        """Report statistics of the memoized query results."""
+        with self._queries_lock:
+            return QueryCacheInfo(
+                self._hits, self._misses, self.cache.config.query_cache_size, len(self._queries)
+            )
+
+    def query_cache_clear(self) -> None:
+        """Drop all memoized query results and reset statistics."""
+        with self._queries_lock:
+            self._queries.clear()
+            self._hits = self._misses = 0
+
+    def _cached_query(self, key) -> tuple[Path, ...] | None:
+        with self._queries_lock:
+            # Indexes were dropped (e.g., after an update or a wipe)
+            if self._queries_generation != self.cache.generation:
+                self._queries.clear()
+                self._queries_generation = self.cache.generation
+
+            result = None if key is None else self._queries.get(key)
+            if result is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._queries.move_to_end(key)
+            return result
+
+    def _cache_query(self, key, result: tuple[Path, ...]) -> None:
+        maxsize = self.cache.config.query_cache_size
+        if key is None or maxsize <= 0:
+            return
+        with self._queries_lock:
+            self._queries[key] = result
+            self._queries.move_to_end(key)
+            while len(self._queries) > maxsize:
+                self._queries.popitem(last=False)
+
+    def _query(self, template, **kwargs) -> tuple[Path, ...]:
+        engine = self.cache.engine
+        if self.cache.config.query_engine == 'native':
+            from templateflow.conf.index import Query
+
+            # Metadata fields are only indexed by PyBIDS
+            if not engine.supports(kwargs):
+                engine = self.cache.layout
+        else:
+            from bids.layout import Query
+
+        return tuple(
             Path(p)
-            for p in self.cache.layout.get(
+            for p in engine.get(
                 template=Query.ANY if template is None else template, return_type='file', **kwargs
             )
-        ]
+        )
+
+    def _query_many(self, queries: list[tuple[Any, dict]]) -> list[tuple[Path, ...]]:
+        """Resolve several ``(template, filters)`` queries, together if the engine can."""
+        engine = self.cache.engine
+        if self.cache.config.query_engine != 'native' or not all(
+            engine.supports(filters) for _, filters in queries
+        ):
+            return [self._query(template, **filters) for template, filters in queries]
+
+        from templateflow.conf.index import Query
+
+        found = engine.get_many(
+            {'template': Query.ANY if template is None else template, **filters}
+            for template, filters in queries
+        )
+        return [tuple(Path(p) for p in files) for files in found]
 
     def get(self, template, raise_empty=False, **kwargs) -> list[Path]:
         """
@@ -234,22 +387,40 @@ class TemplateFlowClient:
         if raise_empty and not out_file:
             raise Exception('No results found')
 
+        out_file = self._fetch(out_file)
+
+        if len(out_file) == 1:
+            return out_file[0]
+        return out_file
+
+    def _fetch(self, filepaths: list[Path]) -> list[Path]:
+        """
+        Ensure ``filepaths`` are available locally, downloading them as necessary.
+
+        Returns the location of each file, which may be in a read-only layer
+        (see :meth:`~templateflow.conf.cache.TemplateFlowCache.locate`).
+        """
+        located = [self.cache.locate(p) for p in filepaths]
+        filepaths = [p for p, location in zip(filepaths, located, strict=True) if p == location]
+
         # Truncate possible S3 error files from previous attempts
-        _truncate_s3_errors(out_file)
+        _truncate_s3_errors(filepaths)
 
         # Try DataLad first
-        dl_missing = [p for p in out_file if not p.is_file()]
+        dl_missing = [p for p in filepaths if not p.is_file()]
         if self.cache.config.use_datalad and dl_missing:
-            for filepath in dl_missing:
+            for filepath in list(dl_missing):
                 _datalad_get(self.cache.config, filepath)
                 dl_missing.remove(filepath)
 
         # Fall-back to S3 if some files are still missing
-        s3_missing = [p for p in out_file if p.is_file() and p.stat().st_size == 0]
-        for filepath in s3_missing + dl_missing:
-            _s3_get(self.cache.config, filepath)
+        s3_missing = [p for p in filepaths if p.is_file() and p.stat().st_size == 0]
+        errors = _s3_get_all(self.cache, s3_missing + dl_missing)
 
-        not_fetched = [str(p) for p in out_file if not p.is_file() or p.stat().st_size == 0]
+        not_fetched = [str(p) for p in filepaths if not p.is_file() or p.stat().st_size == 0]
+
+        if errors:
+            raise _download_error(errors)
 
         if not_fetched:
             msg = 'Could not fetch template files: {}.'.format(', '.join(not_fetched))
@@ -262,16 +433,137 @@ class TemplateFlowClient:
 
             if s3_missing and self.cache.config.use_datalad:
                 msg += f"""\
-    The $TEMPLATEFLOW_HOME folder {self.cache.layout.root} seems to contain an plain \
+    The $TEMPLATEFLOW_HOME folder {self.cache.config.root} seems to contain an plain \
     dataset, but the environment variable $TEMPLATEFLOW_USE_DATALAD is \
     set to one of (true, on, 1). Please set $TEMPLATEFLOW_USE_DATALAD \
     off (possible values: false, off, 0)."""
 
             raise RuntimeError(msg)
 
-        if len(out_file) == 1:
-            return out_file[0]
-        return out_file
+        return located
+
+    def ls_many(self, queries: Iterable[Mapping[str, Any]]) -> list[list[Path]]:
+        """
+        List files for several queries at once.
+
+        Parameters
+        ----------
+        queries : iterable of mappings
+            Each query holds a ``template`` key and any entity filters accepted
+            by :meth:`ls`.
+
+        Returns
+        -------
+        list
+            The files matched by each query, in the order of ``queries``.
+
+        Notes
+        -----
+        With the native query engine, the queries not answered from the query cache
+        are resolved together, in a single pass over the index.
+
+        Examples
+        --------
+
+        .. testsetup::
+
+            >>> client = TemplateFlowClient()
+
+        >>> client.ls_many([
+        ...     {'template': 'MNI152Lin', 'resolution': 1, 'suffix': 'T1w', 'desc': None},
+        ...     {'template': 'fsLR', 'space': None, 'hemi': 'L', 'density': '32k',
+        ...      'suffix': 'sphere'},
+        ... ])
+        [[PosixPath('.../tpl-MNI152Lin/tpl-MNI152Lin_res-01_T1w.nii.gz')],
+         [PosixPath('.../tpl-fsLR_hemi-L_den-32k_sphere.surf.gii')]]
+
+        """
+        queries = [dict(query) for query in queries]
+        for query in queries:
+            if 'template' not in query:
+                raise ValueError(f'Query {query} does not specify a template.')
+            if 'extension' in query:
+                query['extension'] = _normalize_ext(query['extension'])
+
+        queries = [(query.pop('template'), query) for query in queries]
+        keys = [_query_key(template, filters) for template, filters in queries]
+        results = [self._cached_query(key) for key in keys]
+        pending = [i for i, result in enumerate(results) if result is None]
+        found = self._query_many([queries[i] for i in pending])
+        for i, result in zip(pending, found, strict=True):
+            self._cache_query(keys[i], result)
+            results[i] = result
+        return [list(result) for result in results]
+
+    def get_many(
+        self, queries: Iterable[Mapping[str, Any]], raise_empty: bool = False
+    ) -> list[Path | list[Path]]:
+        """
+        Pull files down for several queries at once.
+
+        All queries are resolved first, and the files missing from the union of
+        their results are then fetched together.
+
+        Parameters
+        ----------
+        queries : iterable of mappings
+            Each query holds a ``template`` key and any entity filters accepted
+            by :meth:`get`.
+        raise_empty : bool, optional
+            Raise exception if any of the queries matched no files
+
+        Returns
+        -------
+        list
+            The result of each query, in the order of ``queries`` and with the
+            same form as those returned by :meth:`get`.
+
+        """
+        results = self.ls_many(queries)
+
+        if raise_empty and not all(results):
+            raise Exception('No results found')
+
+        filepaths = list(dict.fromkeys(p for result in results for p in result))
+        located = dict(zip(filepaths, self._fetch(filepaths), strict=True))
+
+        results = [[located[p] for p in result] for result in results]
+        return [result[0] if len(result) == 1 else result for result in results]
+
+    def revalidate(self, template=None, **kwargs) -> list[Path]:
+        """
+        Download again the cached files that changed upstream.
+
+        Each file already downloaded (among those matching the query) is checked with
+        a conditional request to the server it was downloaded from, using the ``ETag``
+        and ``Last-Modified`` headers it was downloaded with, and only files reported
+        as modified are downloaded again.
+        Files in read-only layers are not revalidated.
+
+        Parameters
+        ----------
+        template : str, optional
+            A template identifier (e.g., ``MNI152NLin2009cAsym``). All templates are
+            revalidated by default.
+
+        Keyword Arguments
+        -----------------
+        Entity filters, as accepted by :meth:`ls`.
+
+        Returns
+        -------
+        list
+            The files that were downloaded again.
+
+        """
+        if self.cache.config.use_datalad:
+            raise RuntimeError('DataLad installations are revalidated by cache.update().')
+
+        cached = [p for p in self.ls(template, **kwargs) if _is_fetched(p)]
+        results, errors = _revalidate_all(self.cache, cached)
+        if errors:
+            raise _download_error(errors)
+        return [filepath for filepath, changed in results.items() if changed]
 
     def templates(self, **kwargs) -> list[str]:
         """
@@ -325,7 +617,7 @@ class TemplateFlowClient:
         'Linear ICBM Average Brain (ICBM152) Stereotaxic Registration Model'
 
         """
-        tf_home = Path(self.cache.layout.root)
+        tf_home = Path(self.cache.engine.root)
         filepath = tf_home / (f'tpl-{template}') / 'template_description.json'
 
         # Ensure that template is installed and file is available
@@ -353,7 +645,241 @@ class TemplateFlowClient:
         if not bibtex:
             return refs
 
-        return [_to_bibtex(ref, template, self.cache.config.timeout).rstrip() for ref in refs]
+        return [
+            _to_bibtex(
+                ref,
+                template,
+                self.cache.config.timeout,
+                session=self.cache.session,
+                retry=self.cache.config.retry,
+            ).rstrip()
+            for ref in refs
+        ]
+
+
+class AsyncTemplateFlowClient:
+    """Asynchronous counterpart of :class:`TemplateFlowClient`.
+
+    Methods mirror those of :class:`TemplateFlowClient`, but are coroutines that
+    never block the event loop.
+    Queries run on worker threads, and missing files are downloaded with non-blocking
+    HTTP requests (requires `httpx <https://www.python-httpx.org/>`__, otherwise
+    downloads fall back to worker threads).
+    At most ``max_workers`` files are downloaded at once, across all concurrent calls.
+
+    >>> import asyncio
+    >>> async def main():
+    ...     async with AsyncTemplateFlowClient() as client:
+    ...         return await client.ls('MNI152Lin', resolution=1, suffix='T1w', desc=None)
+    >>> asyncio.run(main())
+    [PosixPath('.../tpl-MNI152Lin/tpl-MNI152Lin_res-01_T1w.nii.gz')]
+
+    Parameters and keyword arguments are those of :class:`TemplateFlowClient`.
+    """
+
+    def __init__(
+        self,
+        root: os.PathLike[str] | str | None = None,
+        *,
+        cache: TemplateFlowCache | None = None,
+        **config_kwargs,
+    ):
+        self._client = TemplateFlowClient(root, cache=cache, **config_kwargs)
+        self.cache = self._client.cache
+        self._loop = None
+        self._http = None
+        self._semaphore = None
+        self._downloads = {}
+
+    def __repr__(self) -> str:
+        return f'<AsyncTemplateFlowClient[{self.cache.config.root}]>'
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the connections kept alive by the client."""
+        http, self._http, self._loop = self._http, None, None
+        if http is not None:
+            await http.aclose()
+
+    async def ls(self, template, **kwargs) -> list[Path]:
+        """List files pertaining to one or more templates (see :meth:`TemplateFlowClient.ls`)."""
+        return await asyncio.to_thread(self._client.ls, template, **kwargs)
+
+    async def ls_many(self, queries: Iterable[Mapping[str, Any]]) -> list[list[Path]]:
+        """List files for several queries at once (see :meth:`TemplateFlowClient.ls_many`)."""
+        return await asyncio.to_thread(self._client.ls_many, queries)
+
+    async def get(self, template, raise_empty=False, **kwargs) -> list[Path] | Path:
+        """Pull files down from one template (see :meth:`TemplateFlowClient.get`)."""
+        out_file = await self.ls(template, **kwargs)
+
+        if raise_empty and not out_file:
+            raise Exception('No results found')
+
+        out_file = await self._fetch(out_file)
+
+        if len(out_file) == 1:
+            return out_file[0]
+        return out_file
+
+    async def get_many(
+        self, queries: Iterable[Mapping[str, Any]], raise_empty: bool = False
+    ) -> list[Path | list[Path]]:
+        """Pull files down for several queries (see :meth:`TemplateFlowClient.get_many`)."""
+        results = await self.ls_many(queries)
+
+        if raise_empty and not all(results):
+            raise Exception('No results found')
+
+        filepaths = list(dict.fromkeys(p for result in results for p in result))
+        located = dict(zip(filepaths, await self._fetch(filepaths), strict=True))
+
+        results = [[located[p] for p in result] for result in results]
+        return [result[0] if len(result) == 1 else result for result in results]
+
+    async def templates(self, **kwargs) -> list[str]:
+        """Return a list of available templates (see :meth:`TemplateFlowClient.templates`)."""
+        return await asyncio.to_thread(self._client.templates, **kwargs)
+
+    async def get_metadata(self, template) -> dict[str, str]:
+        """Fetch the description of one template."""
+        return await asyncio.to_thread(self._client.get_metadata, template)
+
+    async def get_citations(self, template, bibtex=False) -> list[str]:
+        """Fetch template citations (see :meth:`TemplateFlowClient.get_citations`)."""
+        return await asyncio.to_thread(self._client.get_citations, template, bibtex=bibtex)
+
+    async def _fetch(self, filepaths: list[Path]) -> list[Path]:
+        """Ensure ``filepaths`` are available locally (see :meth:`TemplateFlowClient._fetch`)."""
+        if self.cache.config.use_datalad:
+            return await asyncio.to_thread(self._client._fetch, filepaths)
+
+        located, filepaths, s3_missing = await asyncio.to_thread(
+            _pending_downloads, self.cache, filepaths
+        )
+        if s3_missing:
+            progress = _track_progress(self.cache, s3_missing)
+
+            async def _download(filepath: Path) -> None:
+                try:
+                    await self._download(filepath, progress)
+                finally:
+                    if progress is not None:
+                        progress.file_done()
+
+            results = await asyncio.gather(*map(_download, s3_missing), return_exceptions=True)
+            errors = {
+                filepath: result
+                for filepath, result in zip(s3_missing, results, strict=True)
+                if isinstance(result, Exception)
+            }
+            if errors:
+                raise _download_error(errors)
+
+        not_fetched = await asyncio.to_thread(
+            lambda: [str(p) for p in filepaths if not _is_fetched(p)]
+        )
+        if not_fetched:
+            raise RuntimeError(
+                'Could not fetch template files: {}.'.format(', '.join(not_fetched))
+            )
+        return located
+
+    async def _download(self, filepath: Path, progress: ProgressTracker | None = None) -> None:
+        """Download one file, joining the download already in flight for it, if any."""
+        task = self._downloads.get(filepath)
+        if task is None:
+            task = asyncio.ensure_future(self._s3_get(filepath, progress))
+            self._downloads[filepath] = task
+            task.add_done_callback(lambda _: self._downloads.pop(filepath, None))
+        await asyncio.shield(task)
+
+    async def _s3_get(self, filepath: Path, progress: ProgressTracker | None = None) -> None:
+        from templateflow.conf._lock import download_lock
+
+        config = self.cache.config
+        lock = download_lock(config.root, filepath)
+        acquiring = asyncio.ensure_future(asyncio.to_thread(lock.acquire))
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            acquiring.add_done_callback(lambda _: lock.release())
+            raise
+
+        try:
+            if not await asyncio.to_thread(_is_fetched, filepath):
+                await self._s3_get_locked(filepath, progress)
+        finally:
+            lock.release()
+
+    async def _s3_get_locked(
+        self, filepath: Path, progress: ProgressTracker | None = None
+    ) -> None:
+        config = self.cache.config
+        checksum = (await asyncio.to_thread(self.cache.expected, filepath))[1]
+        if await asyncio.to_thread(_link_blob, config, filepath, checksum):
+            return
+
+        http, semaphore = await self._connect()
+        async with semaphore:
+            if http is None:
+                # Without httpx, block a worker thread instead (sessions are per thread,
+                # so the session must be looked up within the worker)
+                await asyncio.to_thread(
+                    lambda: config.retry.call(
+                        _s3_get,
+                        config,
+                        filepath,
+                        session=self.cache.session,
+                        checksum=checksum,
+                        mirrors=self.cache.mirrors,
+                        progress=progress,
+                    )
+                )
+            else:
+                await config.retry.acall(
+                    _s3_aget,
+                    http,
+                    config,
+                    filepath,
+                    checksum=checksum,
+                    mirrors=self.cache.mirrors,
+                    progress=progress,
+                )
+
+    async def _connect(self):
+        """Return the HTTP client and download semaphore bound to the running loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return self._http, self._semaphore
+
+        # Connections of the client bound to the previous loop cannot be reused
+        stale, self._http = self._http, None
+        config = self.cache.config
+        self._semaphore = asyncio.Semaphore(config.max_workers)
+        self._loop = loop
+        if _have_httpx():
+            import httpx
+
+            limits = httpx.Limits(
+                max_connections=config.max_workers,
+                max_keepalive_connections=config.max_workers,
+            )
+            self._http = httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(limits=limits),
+                timeout=config.timeout,
+                follow_redirects=True,
+            )
+
+        http, semaphore = self._http, self._semaphore
+        if stale is not None:
+            await stale.aclose()
+        return http, semaphore
 
 
 def _datalad_get(config: CacheConfig, filepath: Path) -> None:
@@ -373,48 +899,850 @@ def _datalad_get(config: CacheConfig, filepath: Path) -> None:
             raise
 
 
-def _s3_get(config: CacheConfig, filepath: Path) -> None:
-    from sys import stderr
+def _download_error(errors: dict[Path, Exception]) -> RuntimeError:
+    """Summarize the failures of several downloads in one exception."""
+    msg = 'Could not fetch template files:\n{}'.format(
+        '\n'.join(f'    {path}: {error}' for path, error in errors.items())
+    )
+    exc = RuntimeError(msg)
+    exc.__cause__ = next(iter(errors.values()))
+    return exc
+
+
+def _s3_get_all(cache: TemplateFlowCache, filepaths: list[Path]) -> dict[Path, Exception]:
+    """Download ``filepaths`` concurrently, returning the errors found for each file."""
+    from templateflow.conf._lock import download_lock
+
+    # Look the manifest up before fanning out, so that workers do not race to index it
+    expected = {filepath: cache.expected(filepath) for filepath in filepaths}
+    progress = _track_progress(cache, expected)
+
+    def _get(filepath: Path) -> None:
+        # Only one process downloads each file, the others wait and reuse the result
+        try:
+            with download_lock(cache.config.root, filepath):
+                checksum = expected[filepath][1]
+                if _is_fetched(filepath) or _link_blob(cache.config, filepath, checksum):
+                    return
+                # Sessions are per thread, so look the session up within the worker
+                cache.config.retry.call(
+                    _s3_get,
+                    cache.config,
+                    filepath,
+                    session=cache.session,
+                    checksum=checksum,
+                    mirrors=cache.mirrors,
+                    progress=progress,
+                )
+        finally:
+            if progress is not None:
+                progress.file_done()
+
+    return _map_files(_get, filepaths, cache.config.max_workers)[1]
+
+
+def _track_progress(
+    cache: TemplateFlowCache, expected: Mapping[Path, tuple[int | None, str | None]]
+) -> ProgressTracker | None:
+    """Start tracking downloads of the ``expected`` files, unless progress is not reported."""
+    report = cache.config.progress
+    if not report or not expected:
+        return None
+
+    from templateflow.conf.progress import ProgressTracker, TqdmReporter
+
+    return ProgressTracker(
+        {filepath: size for filepath, (size, _) in expected.items()},
+        TqdmReporter() if report is True else report,
+    )
+
+
+def _revalidate_all(cache: TemplateFlowCache, filepaths: list[Path]):
+    """Download ``filepaths`` again if they changed upstream, returning results and errors."""
+    from email.utils import formatdate
     from urllib.parse import quote
 
-    import requests
-    from tqdm import tqdm
+    from templateflow.conf._lock import download_lock
+    from templateflow.conf._validators import ValidatorStore
+
+    config = cache.config
+    validators = ValidatorStore(config.root)
+
+    def _revalidate(filepath: Path) -> bool:
+        relpath = filepath.relative_to(config.root).as_posix()
+        etag, last_modified, root = validators.get(relpath)
+        if root not in cache.mirrors.roots:
+            # Validators are specific to the server that produced them
+            etag = last_modified = None
+            root = cache.mirrors.ranked()[0]
+        # Files downloaded without validators are compared by modification time
+        headers = {
+            'If-Modified-Since': last_modified or formatdate(filepath.stat().st_mtime, usegmt=True)
+        }
+        if etag:
+            headers['If-None-Match'] = etag
+
+        url = f'{root}/{quote(relpath)}'
+        r = config.retry.request(
+            cache.session.head, url, headers=headers, timeout=config.timeout, allow_redirects=True
+        )
+        if r.status_code in (304, 404):  # Unchanged, or removed upstream
+            return False
+        if r.status_code != 200:
+            raise DownloadError(
+                f'Failed to revalidate {url} with status code {r.status_code}', r.status_code
+            )
+
+        # The manifest's checksum describes the previous version
+        with download_lock(config.root, filepath):
+            config.retry.call(
+                _s3_get, config, filepath, session=cache.session, mirrors=cache.mirrors
+            )
+        return True
+
+    return _map_files(_revalidate, filepaths, config.max_workers)
+
+
+def _map_files(func, filepaths: list[Path], max_workers: int):
+    """Call ``func`` on each file concurrently, returning the results and errors of each."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    results, errors = {}, {}
+    workers = min(max_workers, len(filepaths))
+    if workers < 2:
+        for filepath in filepaths:
+            try:
+                results[filepath] = func(filepath)
+            except Exception as exc:  # noqa: BLE001
+                errors[filepath] = exc
+        return results, errors
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {filepath: executor.submit(func, filepath) for filepath in filepaths}
+
+    for filepath, future in futures.items():
+        if future.exception() is None:
+            results[filepath] = future.result()
+        else:
+            errors[filepath] = future.exception()
+    return results, errors
+
+
+async def _s3_aget(
+    http,
+    config: CacheConfig,
+    filepath: Path,
+    checksum: str | None = None,
+    refetch: bool = True,
+    mirrors: MirrorSet | None = None,
+    progress: ProgressTracker | None = None,
+) -> None:
+    """Download one file without blocking the event loop (see :func:`_s3_get`)."""
+    from urllib.parse import quote
 
     path = quote(filepath.relative_to(config.root).as_posix())
-    url = f'{config.s3_root}/{path}'
+    part = _part_file(filepath)
+    offset, headers = await asyncio.to_thread(_resume_from, part)
+
+    url, r = await _mirror_aget(
+        http,
+        mirrors or MirrorSet([config.s3_root]),
+        path,
+        hedge_after=config.hedge_after,
+        resuming=bool(offset),
+        headers=headers,
+    )
+    try:
+        if r.status_code == 416 and offset:
+            # The partial download cannot be resumed, start over
+            await asyncio.to_thread(_discard_part, part)
+            if progress is not None:
+                progress.restart(filepath)
+        else:
+            if r.status_code not in (200, 206):
+                raise DownloadError(
+                    f'Failed to download {url} with status code {r.status_code}', r.status_code
+                )
+
+            if r.status_code == 200 and offset:
+                # The file changed since the partial download, or ranges are not supported
+                offset = 0
+                if progress is not None:
+                    progress.restart(filepath)
+            if not checksum:
+                checksum = _etag_checksum(r.headers)
+                if await asyncio.to_thread(_link_blob, config, filepath, checksum):
+                    await asyncio.to_thread(_discard_part, part)
+                    return
+            if not offset:
+                await asyncio.to_thread(_start_part, part, r.headers)
+            total_size = _expected_size(r.status_code, r.headers, offset)
+            if progress is not None:
+                progress.expect(filepath, total_size)
+            hasher = await asyncio.to_thread(_new_hasher, checksum, part, offset)
+            f = await asyncio.to_thread(part.open, 'ab' if offset else 'wb')
+            buffer = bytearray()
+            try:
+                async for data in r.aiter_bytes():
+                    buffer += data
+                    if len(buffer) >= WRITE_BUFFERSIZE:
+                        await _awrite_part(f, buffer, hasher, progress, filepath)
+            finally:
+                # Keep the bytes received so far, so interrupted downloads resume after them
+                try:
+                    await _awrite_part(f, buffer, hasher, progress, filepath)
+                finally:
+                    await asyncio.to_thread(f.close)
+            if await asyncio.to_thread(
+                _finalize_part,
+                config,
+                part,
+                filepath,
+                total_size,
+                hasher,
+                checksum,
+                r.headers,
+                url[: -len(path) - 1],
+            ):
+                return
+            if not refetch:
+                raise RuntimeError(f'Checksum of <{filepath}> still mismatched after refetching.')
+            refetch = False
+            if progress is not None:
+                progress.restart(filepath)  # The quarantined bytes do not count
+    finally:
+        await r.aclose()
+
+    await _s3_aget(
+        http,
+        config,
+        filepath,
+        checksum=checksum,
+        refetch=refetch,
+        mirrors=mirrors,
+        progress=progress,
+    )
+
+
+async def _mirror_aget(
+    http,
+    mirrors: MirrorSet,
+    path: str,
+    hedge_after: float | None = None,
+    resuming: bool = False,
+    **kwargs,
+):
+    """Request ``path`` without blocking the event loop (see :func:`_mirror_get`)."""
+    from time import monotonic
+
+    # Mirrors may be probed the first time they are ranked
+    roots = await asyncio.to_thread(mirrors.ranked)
+    if len(roots) == 1:
+        url = f'{roots[0]}/{path}'
+        return url, await http.send(http.build_request('GET', url, **kwargs), stream=True)
+
+    async def _request(root: str):
+        start = monotonic()
+        request = http.build_request('GET', f'{root}/{path}', **kwargs)
+        response = await http.send(request, stream=True)
+        return response, monotonic() - start
+
+    pending = {}
+    errors = []
+
+    def _next_mirror() -> None:
+        root = roots.pop(0)
+        pending[asyncio.ensure_future(_request(root))] = root
+
+    try:
+        _next_mirror()
+        while pending:
+            done, _ = await asyncio.wait(
+                pending,
+                timeout=hedge_after if hedge_after and roots else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                # Slow mirror, hedge the request with the next one
+                _next_mirror()
+                continue
+
+            for task in done:
+                root = pending.pop(task)
+                try:
+                    r, elapsed = task.result()
+                    if r.status_code not in (200, 206) and not (r.status_code == 416 and resuming):
+                        await r.aclose()
+                        raise DownloadError(
+                            f'Failed to download {root}/{path} with status code {r.status_code}',
+                            r.status_code,
+                        )
+                except Exception as exc:  # noqa: BLE001
+                    if is_transient(exc):
+                        mirrors.fail(root)
+                    errors.append(exc)
+                    continue
+
+                mirrors.record(root, elapsed)
+                return f'{root}/{path}', r
+
+            if not pending and roots:
+                _next_mirror()
+    finally:
+        # Requests that lost the race are abandoned
+        for task in pending:
+            task.cancel()
+            task.add_done_callback(_adiscard_response)
+
+    # Retrying may help if any of the mirrors failed transiently
+    raise next((exc for exc in errors if is_transient(exc)), errors[-1])
+
+
+def _adiscard_response(task) -> None:
+    """Close the response of an asynchronous request that lost a race."""
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(task.result()[0].aclose())
+
+
+def _s3_get(
+    config: CacheConfig,
+    filepath: Path,
+    session=None,
+    checksum: str | None = None,
+    refetch: bool = True,
+    mirrors: MirrorSet | None = None,
+    progress: ProgressTracker | None = None,
+) -> None:
+    """
+    Download one file from S3.
+
+    The file is hashed while it streams in and, if it does not match ``checksum``
+    (formatted as ``<algorithm>:<hexdigest>``), quarantined and downloaded again
+    (once, if ``refetch``).
+    Without ``checksum``, the file is checked against the MD5 in its ``ETag``, if any,
+    and materialized from the blob store instead when it holds the file already.
+    The file is requested from the best of ``mirrors`` (see :func:`_mirror_get`),
+    or from ``config.s3_root`` if no mirrors are given.
+    Bytes received are reported to ``progress``, if given.
+    """
+    from urllib.parse import quote
+
+    path = quote(filepath.relative_to(config.root).as_posix())
+    part = _part_file(filepath)
+    offset, headers = _resume_from(part)
 
-    print(f'Downloading {url}', file=stderr)
     # Streaming, so we can iterate over the response.
-    r = requests.get(url, stream=True, timeout=config.timeout)
-    if r.status_code != 200:
-        raise RuntimeError(f'Failed to download {url} with status code {r.status_code}')
+    url, r = _mirror_get(
+        mirrors or MirrorSet([config.s3_root]),
+        path,
+        session=session,
+        hedge_after=config.hedge_after,
+        resuming=bool(offset),
+        stream=True,
+        timeout=config.timeout,
+        headers=headers,
+    )
+    if r.status_code == 416 and offset:
+        # The partial download cannot be resumed, start over
+        r.close()
+        _discard_part(part)
+        if progress is not None:
+            progress.restart(filepath)
+        return _s3_get(
+            config,
+            filepath,
+            session=session,
+            checksum=checksum,
+            refetch=refetch,
+            mirrors=mirrors,
+            progress=progress,
+        )
+
+    if r.status_code not in (200, 206):
+        raise DownloadError(
+            f'Failed to download {url} with status code {r.status_code}', r.status_code
+        )
+
+    if r.status_code == 200 and offset:
+        # The file changed since the partial download, or ranges are not supported
+        offset = 0
+        if progress is not None:
+            progress.restart(filepath)
+
+    if not checksum:
+        # Not listed in the manifest, so go by the checksum S3 computed on upload
+        checksum = _etag_checksum(r.headers)
+        if _link_blob(config, filepath, checksum):
+            r.close()
+            _discard_part(part)
+            return
+
+    if not offset:
+        _start_part(part, r.headers)
 
     # Total size in bytes.
-    total_size = int(r.headers.get('content-length', 0))
-    block_size = 1024
-    wrote = 0
-    if not filepath.is_file():
-        filepath.unlink()
-
-    with filepath.open('wb') as f:
-        with tqdm(total=total_size, unit='B', unit_scale=True) as t:
-            for data in r.iter_content(block_size):
-                wrote = wrote + len(data)
+    total_size = _expected_size(r.status_code, r.headers, offset)
+    if progress is not None:
+        progress.expect(filepath, total_size)
+
+    if (
+        r.status_code == 200
+        and config.multipart_threshold
+        and (total_size or 0) >= config.multipart_threshold
+        and r.headers.get('accept-ranges') == 'bytes'
+    ):
+        # Large file, fetch the rest of it in pieces
+        _s3_get_ranges(
+            config,
+            url,
+            part,
+            total_size,
+            session=session,
+            progress=progress,
+            first=r,
+            filepath=filepath,
+        )
+        # Pieces arrive out of order, so the file must be hashed once assembled
+        hasher = _new_hasher(checksum, part, total_size)
+    else:
+        hasher = _new_hasher(checksum, part, offset)
+        with part.open('ab' if offset else 'wb') as f:
+            for data in r.iter_content(STREAM_CHUNKSIZE):
                 f.write(data)
-                t.update(len(data))
+                if hasher is not None:
+                    hasher.update(data)
+                if progress is not None:
+                    progress.update(len(data), filepath)
+
+    if _finalize_part(
+        config, part, filepath, total_size, hasher, checksum, r.headers, url[: -len(path) - 1]
+    ):
+        return
+    if not refetch:
+        raise RuntimeError(f'Checksum of <{filepath}> still mismatched after refetching.')
+    if progress is not None:
+        progress.restart(filepath)  # The quarantined bytes do not count
+    _s3_get(
+        config,
+        filepath,
+        session=session,
+        checksum=checksum,
+        refetch=False,
+        mirrors=mirrors,
+        progress=progress,
+    )
+
+
+def _mirror_get(
+    mirrors: MirrorSet,
+    path: str,
+    session=None,
+    hedge_after: float | None = None,
+    resuming: bool = False,
+    **kwargs,
+):
+    """
+    Request ``path`` from the best of ``mirrors``, returning the URL and the response.
+
+    Mirrors that cannot serve the file are skipped in favor of the next one.
+    If a mirror has not answered after ``hedge_after`` seconds, the next mirror is
+    asked as well and the first good answer wins.
+    With a single mirror, the response is returned whatever its status.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    from time import monotonic
+
+    import requests
+
+    roots = mirrors.ranked()
+    if len(roots) == 1:
+        url = f'{roots[0]}/{path}'
+        return url, (session or requests).get(url, **kwargs)
+
+    def _request(root: str):
+        start = monotonic()
+        response = _worker_session(session).get(f'{root}/{path}', **kwargs)
+        return response, monotonic() - start
+
+    executor = ThreadPoolExecutor(max_workers=len(roots))
+    pending = {}
+    errors = []
+
+    def _next_mirror() -> None:
+        root = roots.pop(0)
+        pending[executor.submit(_request, root)] = root
+
+    try:
+        _next_mirror()
+        while pending:
+            done, _ = wait(
+                pending,
+                timeout=hedge_after if hedge_after and roots else None,
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                # Slow mirror, hedge the request with the next one
+                _next_mirror()
+                continue
+
+            for future in done:
+                root = pending.pop(future)
+                try:
+                    r, elapsed = future.result()
+                    if r.status_code not in (200, 206) and not (r.status_code == 416 and resuming):
+                        r.close()
+                        raise DownloadError(
+                            f'Failed to download {root}/{path} with status code {r.status_code}',
+                            r.status_code,
+                        )
+                except Exception as exc:  # noqa: BLE001
+                    if is_transient(exc):
+                        mirrors.fail(root)
+                    errors.append(exc)
+                    continue
+
+                mirrors.record(root, elapsed)
+                for other in pending:
+                    other.add_done_callback(_discard_response)
+                return f'{root}/{path}', r
+
+            if not pending and roots:
+                _next_mirror()
+    finally:
+        executor.shutdown(wait=False)
+
+    # Retrying may help if any of the mirrors failed transiently
+    raise next((exc for exc in errors if is_transient(exc)), errors[-1])
+
+
+def _discard_response(future) -> None:
+    """Close the response of a request that lost a race."""
+    if not future.cancelled() and future.exception() is None:
+        future.result()[0].close()
+
+
+def _s3_get_ranges(
+    config: CacheConfig,
+    url: str,
+    part: Path,
+    total_size: int,
+    session=None,
+    progress: ProgressTracker | None = None,
+    first=None,
+    filepath: Path | None = None,
+) -> None:
+    """
+    Download ``url`` into ``part`` as byte ranges fetched in parallel.
+
+    The first range is read from ``first``, a response streaming the whole file, if given.
+    At most ``config.max_workers`` ranges are fetched at once, across all files.
+    Bytes received are reported to ``progress`` as part of ``filepath``.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    ranges = [
+        (start, min(start + MULTIPART_CHUNKSIZE, total_size) - 1)
+        for start in range(0, total_size, MULTIPART_CHUNKSIZE)
+    ]
+    with part.open('wb') as f:
+        f.truncate(total_size)
+    slots = _range_slots(config.max_workers)
+    # Pieces of another version of the file are refused (with a 200 response)
+    etag = first.headers.get('etag') if first is not None else None
+    if_range = {'If-Range': etag} if etag and not etag.startswith('W/') else {}
+
+    def _get_range(byte_range: tuple[int, int]) -> None:
+        start, end = byte_range
+        with slots:
+            if start == 0 and first is not None:
+                r = first
+            else:
+                r = _worker_session(session).get(
+                    url,
+                    stream=True,
+                    timeout=config.timeout,
+                    headers={'Range': f'bytes={start}-{end}', **if_range},
+                )
+                if r.status_code != 206:
+                    r.close()
+                    raise DownloadError(
+                        f'Failed to download bytes {start}-{end} of {url} '
+                        f'with status code {r.status_code}',
+                        r.status_code,
+                    )
+
+            wrote = 0
+            try:
+                with part.open('r+b') as f:
+                    f.seek(start)
+                    for data in r.iter_content(STREAM_CHUNKSIZE):
+                        data = data[: end + 1 - start - wrote]
+                        f.write(data)
+                        wrote += len(data)
+                        if progress is not None:
+                            progress.update(len(data), filepath)
+                        if wrote > end - start:
+                            break
+            finally:
+                r.close()
+        if wrote != end + 1 - start:
+            raise DownloadError(f'Downloaded {wrote} of bytes {start}-{end} of {url}.')
+
+    try:
+        with ThreadPoolExecutor(max_workers=min(config.max_workers, len(ranges))) as executor:
+            for _ in executor.map(_get_range, ranges):
+                pass
+    except BaseException:
+        # Preallocated files cannot be resumed
+        _discard_part(part)
+        if progress is not None and filepath is not None:
+            progress.restart(filepath)
+        raise
+    finally:
+        if first is not None:
+            first.close()
+
+
+@lru_cache
+def _range_slots(max_workers: int):
+    """Return the semaphore bounding the byte ranges fetched at once by this process."""
+    from threading import BoundedSemaphore
+
+    return BoundedSemaphore(max_workers)
+
+
+def _worker_session(session=None):
+    """Return a session for a worker thread, sharing the connections of ``session``."""
+    import requests
+
+    if not isinstance(session, requests.Session):
+        return session or requests
+
+    worker = requests.Session()
+    for prefix, adapter in session.adapters.items():
+        worker.mount(prefix, adapter)
+    return worker
 
-    if total_size != 0 and wrote != total_size:
-        raise RuntimeError('ERROR, something went wrong')
 
+def _is_fetched(filepath: Path) -> bool:
+    """Check whether ``filepath`` holds contents (rather than a skeleton placeholder)."""
+    return filepath.is_file() and filepath.stat().st_size > 0
 
-def _to_bibtex(doi: str, template: str, timeout: float) -> str:
+
+def _part_file(filepath: Path) -> Path:
+    """Return the file receiving the download of ``filepath``.
+
+    Partial downloads are hidden, so that indexes never pick them up.
+
+    >>> _part_file(Path('tpl-MNI152Lin/tpl-MNI152Lin_res-01_T1w.nii.gz'))
+    PosixPath('tpl-MNI152Lin/.tpl-MNI152Lin_res-01_T1w.nii.gz.part')
+
+    """
+    return filepath.parent / f'.{filepath.name}.part'
+
+
+def _part_etag(part: Path) -> Path:
+    """Return the file recording the ``ETag`` of the file a partial download is from."""
+    return part.with_name(f'{part.name}.etag')
+
+
+def _start_part(part: Path, headers: Mapping[str, str]) -> None:
+    """Record the ``ETag`` of a download starting, so that it is only resumed if unchanged."""
+    etag = headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        _part_etag(part).write_text(etag)
+    else:
+        _part_etag(part).unlink(missing_ok=True)
+
+
+def _discard_part(part: Path) -> None:
+    """Delete a partial download, which cannot be resumed."""
+    part.unlink(missing_ok=True)
+    _part_etag(part).unlink(missing_ok=True)
+
+
+def _resume_from(part: Path) -> tuple[int, dict[str, str]]:
+    """
+    Return the offset to resume a partial download from, and the request headers.
+
+    Downloads are resumed conditionally (``If-Range``), so that servers send the whole
+    file instead if it changed since.
+    Partial downloads of unknown origin are started over.
+    """
+    offset = part.stat().st_size if part.is_file() else 0
+    try:
+        etag = _part_etag(part).read_text()
+    except OSError:
+        return 0, {}
+    if not offset or not etag:
+        return 0, {}
+    return offset, {'Range': f'bytes={offset}-', 'If-Range': etag}
+
+
+def _expected_size(status_code: int, headers: Mapping[str, str], offset: int) -> int | None:
+    """Return the full size of the file being downloaded, if the server reports it.
+
+    >>> _expected_size(200, {'content-length': '1024'}, 0)
+    1024
+    >>> _expected_size(206, {'content-range': 'bytes 100-1023/1024'}, 100)
+    1024
+    >>> _expected_size(206, {'content-length': '924'}, 100)
+    1024
+    >>> _expected_size(200, {}, 0) is None
+    True
+
+    """
+    if status_code == 206:
+        total = headers.get('content-range', '').rpartition('/')[2]
+        if total.isdigit():
+            return int(total)
+    length = headers.get('content-length')
+    return offset + int(length) if length else None
+
+
+def _etag_checksum(headers: Mapping[str, str]) -> str | None:
+    """
+    Read the checksum of a file from its S3 ``ETag``, which is the MD5 of single-part uploads.
+
+    >>> _etag_checksum({'etag': '"0cc175b9c0f1b6a831c399e269772661"'})
+    'md5:0cc175b9c0f1b6a831c399e269772661'
+    >>> _etag_checksum({'etag': '"0cc175b9c0f1b6a831c399e269772661-2"'}) is None
+    True
+    >>> _etag_checksum({'etag': 'W/"0cc175b9c0f1b6a831c399e269772661"'}) is None
+    True
+    >>> _etag_checksum({}) is None
+    True
+
+    """
+    import re
+
+    match = re.fullmatch(r'"?([0-9a-fA-F]{32})"?', headers.get('etag') or '')
+    return f'md5:{match.group(1).lower()}' if match else None
+
+
+def _new_hasher(checksum: str | None, part: Path, offset: int):
+    """Start hashing a download, including the ``offset`` bytes already received."""
+    import hashlib
+
+    algorithm = (checksum or '').partition(':')[0]
+    if algorithm not in hashlib.algorithms_available:
+        return None
+
+    hasher = hashlib.new(algorithm)
+    if offset:
+        with part.open('rb') as f:
+            while block := f.read(1 << 20):
+                hasher.update(block)
+    return hasher
+
+
+def _write_part(f, data: bytes, hasher=None) -> None:
+    """Append received bytes to a partial download, and hash them."""
+    f.write(data)
+    if hasher is not None:
+        hasher.update(data)
+
+
+async def _awrite_part(
+    f,
+    buffer: bytearray,
+    hasher=None,
+    progress: ProgressTracker | None = None,
+    filepath: Path | None = None,
+) -> None:
+    """Empty the ``buffer`` of an asynchronous download into its part on a worker thread."""
+    if not buffer:
+        return
+    data = bytes(buffer)
+    buffer.clear()
+    await asyncio.to_thread(_write_part, f, data, hasher)
+    if progress is not None:
+        progress.update(len(data), filepath)
+
+
+def _finalize_part(
+    config: CacheConfig,
+    part: Path,
+    filepath: Path,
+    total_size: int | None,
+    hasher=None,
+    checksum: str | None = None,
+    headers: Mapping[str, str] | None = None,
+    source: str | None = None,
+) -> bool:
+    """
+    Move a complete download into place, atomically.
+
+    Returns ``False`` if the download did not match its checksum, in which case it
+    is moved into the quarantine folder instead.
+    The validators among the response ``headers`` are recorded, along with the S3 root
+    the file came from (``source``), to revalidate the file later
+    (see :meth:`TemplateFlowClient.revalidate`).
+    """
+    wrote = part.stat().st_size
+    if total_size is not None and wrote != total_size:
+        if wrote > total_size:
+            _discard_part(part)  # Cannot be resumed
+        raise DownloadError(f'Downloaded {wrote} of {total_size} bytes of <{filepath}>.')
+
+    if hasher is not None and hasher.hexdigest() != checksum.partition(':')[2].lower():
+        from warnings import warn
+
+        from templateflow.conf.cache import STATE_DIR
+
+        quarantined = config.root / STATE_DIR / 'quarantine' / filepath.relative_to(config.root)
+        quarantined.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(part, quarantined)
+        _part_etag(part).unlink(missing_ok=True)
+        warn(
+            f'Checksum of <{filepath}> does not match {checksum}, moved to <{quarantined}>.',
+            stacklevel=3,
+        )
+        return False
+
+    if config.blob_store is not None and checksum:
+        from templateflow.conf._blobs import BlobStore
+
+        try:
+            BlobStore(config.blob_store).add(part, checksum)
+        except OSError as exc:
+            from warnings import warn
+
+            warn(f'Could not add <{filepath}> to the blob store: {exc}', stacklevel=3)
+
+    os.replace(part, filepath)
+    _part_etag(part).unlink(missing_ok=True)
+    if headers and (headers.get('etag') or headers.get('last-modified')):
+        from templateflow.conf._validators import ValidatorStore
+
+        ValidatorStore(config.root).set(
+            filepath.relative_to(config.root).as_posix(),
+            headers.get('etag'),
+            headers.get('last-modified'),
+            source,
+        )
+    return True
+
+
+def _link_blob(config: CacheConfig, filepath: Path, checksum: str | None) -> bool:
+    """Materialize ``filepath`` from the blob store, if configured and holding it."""
+    if config.blob_store is None or not checksum:
+        return False
+
+    from templateflow.conf._blobs import BlobStore
+
+    return BlobStore(config.blob_store).link(checksum, filepath)
+
+
+def _to_bibtex(doi: str, template: str, timeout: float, session=None, retry=None) -> str:
     if 'doi.org' not in doi:
         return doi
 
     # Is a DOI URL
     import requests
 
-    response = requests.post(
+    response = (retry or RetryPolicy(retries=0)).request(
+        (session or requests).post,
         doi,
         headers={'Accept': 'application/x-bibtex; charset=utf-8'},
         timeout=timeout,
@@ -463,6 +1791,52 @@ def _normalize_ext(value):
     return [_normalize_ext(v) for v in value]
 
 
+def _query_key(template, filters):
+    """
+    Normalize a query into a hashable key, or ``None`` if it cannot be memoized.
+
+    Examples
+    --------
+    >>> _query_key('MNI152Lin', {'suffix': ['T2w', 'T1w'], 'desc': None})
+    ('MNI152Lin', (('desc', None), ('suffix', ('T1w', 'T2w'))))
+    >>> _query_key('MNI152Lin', {'suffix': 'T1w'}) == _query_key('MNI152Lin', {'suffix': ['T1w']})
+    True
+    >>> _query_key(['fsLR', 'MNI152Lin'], {}) == _query_key(('MNI152Lin', 'fsLR'), {})
+    True
+    >>> _query_key('MNI152Lin', {'label': [{'GM': 1}]}) is None
+    True
+
+    """
+
+    def _freeze(value):
+        if isinstance(value, (list, tuple, set, frozenset)):
+            values = {_freeze(v) for v in value}
+            return values.pop() if len(values) == 1 else tuple(sorted(values, key=repr))
+        return value
+
+    try:
+        key = (_freeze(template), tuple(sorted((k, _freeze(v)) for k, v in filters.items())))
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _pending_downloads(
+    cache: TemplateFlowCache, filepaths: list[Path]
+) -> tuple[list[Path], list[Path], dict[Path, tuple[int | None, str | None]]]:
+    """Sort out which ``filepaths`` must be downloaded into the cache.
+
+    Returns the location of each file, the files that live in the cache,
+    and the expected size and checksum of those that are skeleton placeholders.
+    """
+    located = [cache.locate(p) for p in filepaths]
+    filepaths = [p for p, location in zip(filepaths, located, strict=True) if p == location]
+    _truncate_s3_errors(filepaths)
+    missing = [p for p in filepaths if p.is_file() and p.stat().st_size == 0]
+    return located, filepaths, {p: cache.expected(p) for p in missing}
+
+
 def _truncate_s3_errors(filepaths):
     """
     Truncate XML error bodies saved by previous versions of TemplateFlow.
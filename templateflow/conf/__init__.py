@@ -1,55 +1,68 @@
 """Configuration and settings."""
 
 from functools import wraps
+from threading import Lock
 from warnings import warn
 
 from acres import Loader
 
-from templateflow.conf.cache import CacheConfig, TemplateFlowCache
+from templateflow.conf.cache import CacheConfig, TemplateFlowCache, _stacklevel
 
 load_data = Loader(__spec__.name)
 
-_cache = TemplateFlowCache(config=CacheConfig())
+# The global cache is set up on first use (see _get_cache)
+_CACHE: TemplateFlowCache | None = None
+_CACHE_LOCK = Lock()
+
+
+def _get_cache() -> TemplateFlowCache:
+    """Return the global cache, populating the TemplateFlow home if necessary."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            cache = TemplateFlowCache(config=CacheConfig())
+            if not cache.precached:
+                warn(
+                    f"""\
+TemplateFlow: repository not found at <{cache.config.root}>. Populating a new TemplateFlow stub.
+If the path reported above is not the desired location for TemplateFlow, \
+please set the TEMPLATEFLOW_HOME environment variable.""",
+                    ResourceWarning,
+                    stacklevel=_stacklevel(),
+                )
+                cache.ensure()
+            _CACHE = cache
+        return _CACHE
 
 
 def __getattr__(name: str):
-    if name == 'TF_HOME':
-        return _cache.config.root
+    if name == '_cache':
+        return _get_cache()
+    elif name == 'TF_HOME':
+        return _get_cache().config.root
     elif name == 'TF_GITHUB_SOURCE':
-        return _cache.config.origin
+        return _get_cache().config.origin
     elif name == 'TF_S3_ROOT':
-        return _cache.config.s3_root
+        return _get_cache().config.s3_root
     elif name == 'TF_USE_DATALAD':
-        return _cache.config.use_datalad
+        return _get_cache().config.use_datalad
     elif name == 'TF_AUTOUPDATE':
-        return _cache.config.autoupdate
+        return _get_cache().config.autoupdate
     elif name == 'TF_CACHED':
-        return _cache.precached
+        return _get_cache().precached
     elif name == 'TF_GET_TIMEOUT':
-        return _cache.config.timeout
+        return _get_cache().config.timeout
     elif name == 'TF_LAYOUT':
-        return _cache.layout
+        return _get_cache().layout
     raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
 
 
-if not _cache.precached:
-    warn(
-        f"""\
-TemplateFlow: repository not found at <{_cache.config.root}>. Populating a new TemplateFlow stub.
-If the path reported above is not the desired location for TemplateFlow, \
-please set the TEMPLATEFLOW_HOME environment variable.""",
-        ResourceWarning,
-        stacklevel=2,
-    )
-    _cache.ensure()
-
-
 def requires_layout(func):
     """Decorate function to ensure ``TF_LAYOUT`` is correctly initiated."""
 
     @wraps(func)
     def wrapper(*args, **kwargs):
-        if _cache.layout is None:
+        if _get_cache().layout is None:
             from bids import __version__
 
             raise RuntimeError(f'A layout with PyBIDS <{__version__}> could not be initiated')
@@ -58,17 +71,24 @@ def requires_layout(func):
     return wrapper
 
 
-update = _cache.update
-wipe = _cache.wipe
+def update(local: bool = False, overwrite: bool = True, silent: bool = False) -> bool:
+    """Update the TemplateFlow home (see :class:`~templateflow.conf.cache.TemplateFlowCache`)."""
+    return _get_cache().update(local=local, overwrite=overwrite, silent=silent)
+
+
+def wipe() -> None:
+    """Clear the TemplateFlow home (see :class:`~templateflow.conf.cache.TemplateFlowCache`)."""
+    _get_cache().wipe()
 
 
 def setup_home(force=False):
     """Initialize/update TF's home if necessary."""
-    if not force and not _cache.precached:
+    cache = _get_cache()
+    if not force and not cache.precached:
         print(
             f"""\
-TemplateFlow was not cached (TEMPLATEFLOW_HOME={_cache.config.root}), \
+TemplateFlow was not cached (TEMPLATEFLOW_HOME={cache.config.root}), \
 a fresh initialization was done."""
         )
         return False
-    return _cache.update(local=True, overwrite=False)
+    return cache.update(local=True, overwrite=False)
@@ -0,0 +1,133 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright 2025 The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""A content-addressed store sharing downloads across TemplateFlow homes."""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+# ioctl cloning a file into another one (Linux)
+FICLONE = 0x40049409
+
+
+class BlobStore:
+    """
+    Files keyed by their checksum, linked into any number of TemplateFlow homes.
+
+    Blobs are stored as ``<root>/<algorithm>/<digest[:2]>/<digest>``, and appear in
+    TemplateFlow homes as hardlinks (or as copy-on-write clones, where hardlinks are
+    not possible), so that each file is downloaded and stored once per file system.
+    Homes on other file systems get copies.
+
+    >>> from tempfile import mkdtemp
+    >>> store = BlobStore(mkdtemp())
+    >>> src = Path(mkdtemp()) / 'file.txt'
+    >>> _ = src.write_text('data')
+    >>> store.add(src, 'md5:8D777F385D3DFEC8815D20F7496026DC')
+    >>> store.path('md5:8d777f385d3dfec8815d20f7496026dc').relative_to(store.root).as_posix()
+    'md5/8d/8d777f385d3dfec8815d20f7496026dc'
+    >>> dest = src.with_name('link.txt')
+    >>> store.link('md5:8d777f385d3dfec8815d20f7496026dc', dest)
+    True
+    >>> dest.read_text()
+    'data'
+    >>> store.link('md5:00000000000000000000000000000000', dest)
+    False
+
+    """
+
+    def __init__(self, root: os.PathLike[str] | str):
+        self.root = Path(root)
+
+    def __repr__(self) -> str:
+        return f'<BlobStore {self.root}>'
+
+    def path(self, checksum: str) -> Path:
+        """Return where the blob with ``checksum`` (``<algorithm>:<hexdigest>``) is stored."""
+        algorithm, _, digest = checksum.lower().partition(':')
+        return self.root / algorithm / digest[:2] / digest
+
+    def add(self, filepath: Path, checksum: str) -> None:
+        """Store (a link to) ``filepath``, whose contents match ``checksum``."""
+        blob = self.path(checksum)
+        if blob.is_file():
+            return
+
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        _place(filepath, blob)
+
+    def link(self, checksum: str, filepath: Path) -> bool:
+        """Make ``filepath`` a link to the blob with ``checksum``, if stored."""
+        blob = self.path(checksum)
+        if not blob.is_file():
+            return False
+
+        _place(blob, filepath)
+        return True
+
+
+def _place(src: Path, dest: Path) -> None:
+    """Link ``src`` to ``dest`` atomically, replacing ``dest`` if it exists."""
+    from tempfile import mkstemp
+
+    fd, tmp = mkstemp(dir=dest.parent, prefix=f'.{dest.name}.', suffix='.tmp')
+    os.close(fd)
+    tmp = Path(tmp)
+    try:
+        _link(src, tmp)
+        os.replace(tmp, dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _link(src: Path, dest: Path) -> None:
+    """Make ``dest`` a hardlink, a clone, or, failing those, a copy of ``src``."""
+    from shutil import copyfile
+
+    dest.unlink(missing_ok=True)
+    try:
+        os.link(src, dest)
+        return
+    except OSError:
+        pass
+
+    try:
+        _reflink(src, dest)
+    except OSError:
+        copyfile(src, dest)
+
+
+def _reflink(src: Path, dest: Path) -> None:
+    """Clone ``src`` into ``dest``, sharing their blocks until either is modified."""
+    try:
+        from fcntl import ioctl
+    except ImportError as exc:  # Windows
+        raise OSError('Cloning files is not supported') from exc
+
+    try:
+        with src.open('rb') as fsrc, dest.open('wb') as fdest:
+            ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        dest.unlink(missing_ok=True)
+        raise
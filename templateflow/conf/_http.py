@@ -0,0 +1,247 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright 2024 The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""Pooled HTTP connections and mirrors shared by all network operations."""
+
+from __future__ import annotations
+
+from math import inf
+from threading import Lock, local
+from time import monotonic
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from requests import Session
+    from requests.adapters import HTTPAdapter
+
+    from .cache import RetryPolicy
+
+# Transient responses worth retrying
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class DownloadError(RuntimeError):
+    """A download failed, possibly due to a transient condition (see :attr:`transient`)."""
+
+    def __init__(self, msg: str, status: int | None = None):
+        super().__init__(msg)
+        self.status = status
+
+    @property
+    def transient(self) -> bool:
+        """Whether trying again may succeed (truncated transfers, throttling, server errors)."""
+        return self.status is None or self.status in RETRY_STATUS
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Check whether a failed request is worth trying again."""
+    import requests
+
+    if isinstance(exc, DownloadError):
+        return exc.transient
+    if isinstance(
+        exc,
+        (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ),
+    ):
+        return True
+
+    from .cache import _have_httpx
+
+    if _have_httpx():
+        import httpx
+
+        return isinstance(exc, httpx.TransportError)
+    return False
+
+
+class SessionPool:
+    """
+    Hand out :class:`requests.Session` objects backed by one pool of connections.
+
+    :class:`requests.Session` is not guaranteed to be thread-safe, so each thread
+    gets its own session.
+    All sessions mount the same adapter, so that keep-alive connections are reused
+    across threads (and across downloads).
+    Sessions do not retry failed requests, see :class:`~templateflow.conf.cache.RetryPolicy`.
+
+    Parameters
+    ----------
+    pool_maxsize : :obj:`int`
+        Maximum number of connections kept alive for each host.
+
+    """
+
+    def __init__(self, pool_maxsize: int = 10):
+        self.pool_maxsize = pool_maxsize
+        self._adapter: HTTPAdapter | None = None
+        self._local = local()
+        self._lock = Lock()
+
+    def __repr__(self) -> str:
+        return f'<SessionPool pool_maxsize={self.pool_maxsize}>'
+
+    @property
+    def adapter(self) -> HTTPAdapter:
+        """The transport adapter shared by all sessions."""
+        with self._lock:
+            if self._adapter is None:
+                from requests.adapters import HTTPAdapter
+
+                self._adapter = HTTPAdapter(
+                    pool_connections=self.pool_maxsize, pool_maxsize=self.pool_maxsize
+                )
+            return self._adapter
+
+    def get(self) -> Session:
+        """Return the calling thread's session."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            from requests import Session
+
+            session = Session()
+            session.mount('https://', self.adapter)
+            session.mount('http://', self.adapter)
+            self._local.session = session
+        return session
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        with self._lock:
+            adapter, self._adapter = self._adapter, None
+        if adapter is not None:
+            adapter.close()
+        self._local = local()
+
+
+class MirrorSet:
+    """
+    Rank equivalent S3 roots, preferring the fastest healthy one.
+
+    Latencies are first measured with a ``HEAD`` request to each mirror not timed yet
+    (the first time mirrors are ranked), then updated with the time each download took
+    to get answered.
+    Probes are sent through the sessions of ``sessions`` (if given), and retried
+    according to ``retry``.
+    Mirrors failing with transient errors are ranked last for :attr:`cooldown` seconds.
+
+    >>> mirrors = MirrorSet(['https://a.org/', 'https://b.org'])
+    >>> mirrors.record('https://a.org', 0.5)
+    >>> mirrors.record('https://b.org', 0.1)
+    >>> mirrors.ranked()
+    ['https://b.org', 'https://a.org']
+    >>> mirrors.fail('https://b.org')
+    >>> mirrors.ranked()
+    ['https://a.org', 'https://b.org']
+
+    """
+
+    # Weight of the latest latency in the moving average
+    smoothing = 0.3
+
+    def __init__(
+        self,
+        roots,
+        cooldown: float = 60.0,
+        timeout: float = 5.0,
+        sessions: SessionPool | None = None,
+        retry: RetryPolicy | None = None,
+    ):
+        self.roots = list(dict.fromkeys(root.rstrip('/') for root in roots))
+        self.cooldown = cooldown
+        self.timeout = timeout
+        self.sessions = sessions
+        self.retry = retry
+        self._latency: dict[str, float] = {}
+        self._failed: dict[str, float] = {}
+        self._lock = Lock()
+        self._probe_lock = Lock()
+        self._probed = len(self.roots) < 2
+
+    def __repr__(self) -> str:
+        return f'<MirrorSet {self.ranked() if self._probed else self.roots}>'
+
+    def probe(self) -> None:
+        """Measure the latency of the mirrors not timed yet."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        import requests
+
+        from .cache import RetryPolicy
+
+        retry = self.retry or RetryPolicy(retries=0)
+
+        def _probe(root: str) -> None:
+            http = self.sessions.get() if self.sessions is not None else requests
+            start = monotonic()
+            try:
+                r = retry.request(http.head, f'{root}/', timeout=self.timeout)
+                r.close()
+            except Exception as exc:  # noqa: BLE001
+                if is_transient(exc):
+                    self.fail(root)
+                return
+
+            if r.status_code in RETRY_STATUS:
+                self.fail(root)
+            else:
+                # Any other answer (even an error status) tells how fast the mirror responds
+                self.record(root, monotonic() - start)
+
+        untimed = [root for root in self.roots if root not in self._latency]
+        if untimed:
+            with ThreadPoolExecutor(max_workers=len(untimed)) as executor:
+                for _ in executor.map(_probe, untimed):
+                    pass
+        self._probed = True
+
+    def ranked(self) -> list[str]:
+        """Return the mirrors, best first."""
+        if not self._probed:
+            with self._probe_lock:
+                if not self._probed:
+                    self.probe()
+
+        now = monotonic()
+        with self._lock:
+            return sorted(
+                self.roots,
+                key=lambda root: (
+                    now - self._failed.get(root, -inf) < self.cooldown,
+                    self._latency.get(root, inf),
+                ),
+            )
+
+    def record(self, root: str, latency: float) -> None:
+        """Account for a successful request to ``root`` answered within ``latency`` seconds."""
+        with self._lock:
+            previous = self._latency.get(root, latency)
+            self._latency[root] = previous + self.smoothing * (latency - previous)
+            self._failed.pop(root, None)
+
+    def fail(self, root: str) -> None:
+        """Rank ``root`` last for a while."""
+        with self._lock:
+            self._failed[root] = monotonic()
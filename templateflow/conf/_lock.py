@@ -0,0 +1,160 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright 2024 The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""Advisory locks coordinating processes that share a TemplateFlow home."""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+from .cache import STATE_DIR
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing_extensions import Self
+
+if os.name == 'nt':
+    import errno
+    import msvcrt
+
+    def _lock(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                # Gives up after retrying for ~10 seconds
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            except OSError as exc:
+                if exc.errno != errno.EDEADLOCK:  # Other than still held by someone else
+                    raise
+                continue
+            return
+
+    def _unlock(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class FileLock:
+    """
+    An exclusive, advisory lock held through a lock file.
+
+    Locks are held by the operating system on behalf of the process that acquired
+    them, and released when it exits, so that a crashed process never leaves a stale
+    lock behind.
+    Acquiring the lock blocks until it is released.
+    Locks cannot be acquired on read-only file systems, in which case :meth:`acquire`
+    returns ``False`` and the caller proceeds unprotected.
+    Lock files are removed when released (except on Windows, where files cannot be
+    removed while open).
+
+    >>> from tempfile import mkdtemp
+    >>> lock = FileLock(Path(mkdtemp()) / 'file.lock')
+    >>> with lock:
+    ...     lock.locked
+    True
+    >>> lock.locked
+    False
+    >>> lock.path.exists()
+    False
+
+    """
+
+    def __init__(self, path: os.PathLike[str] | str):
+        self.path = Path(path)
+        self._fd: int | None = None
+
+    def __repr__(self) -> str:
+        return f'<FileLock[{self.path}] locked={self.locked}>'
+
+    def __enter__(self) -> Self:
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+    @property
+    def locked(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self) -> bool:
+        """Wait for the lock, returning ``False`` if the lock file cannot be created."""
+        while True:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError:
+                return False
+
+            try:
+                _lock(fd)
+                held = _same_file(fd, self.path)
+            except BaseException:
+                os.close(fd)
+                raise
+            if held:
+                break
+            # The previous holder removed the file while we waited, lock the new one
+            os.close(fd)
+
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            # Removed while still held, so that waiters notice they locked a stale file
+            self.path.unlink(missing_ok=True)
+        except OSError:
+            pass
+        try:
+            _unlock(fd)
+        finally:
+            os.close(fd)
+
+
+def _same_file(fd: int, path: Path) -> bool:
+    """Check whether ``path`` still refers to the file open as ``fd``."""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return False
+    fstat = os.fstat(fd)
+    return (stat.st_dev, stat.st_ino) == (fstat.st_dev, fstat.st_ino)
+
+
+def download_lock(root: Path, filepath: Path) -> FileLock:
+    """Return the lock guarding the download of ``filepath``."""
+    relpath = filepath.relative_to(root).as_posix()
+    return FileLock(root / STATE_DIR / 'locks' / f'{relpath}.lock')
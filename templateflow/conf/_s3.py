@@ -27,74 +27,317 @@ from tempfile import mkstemp
 
 from acres import Loader
 
+from .cache import STATE_DIR
+
 load_data = Loader(__spec__.parent)
 
+SKELETON = f'{STATE_DIR}/skeleton.zip'
+SKELETON_BASE = f'{STATE_DIR}/skeleton.base.md5'
+SKELETON_STATE = f'{STATE_DIR}/skeleton.json'
+DELTA_INDEX = f'{STATE_DIR}/delta.json'
+UPDATE_CHECK = f'{STATE_DIR}/update-check.json'
+SKELETON_STATE_VERSION = 1
+
 TF_SKEL_URL = (
     'https://raw.githubusercontent.com/templateflow/python-client/'
     '{release}/templateflow/conf/templateflow-skel.{ext}'
 ).format
 
 
-def update(dest, local=True, overwrite=True, silent=False, *, timeout: int):
-    """Update an S3-backed TEMPLATEFLOW_HOME repository."""
-    skel_zip = load_data('templateflow-skel.zip')
-    skel_file = Path((_get_skeleton_file(timeout) if not local else None) or skel_zip)
+def update(
+    dest,
+    local=True,
+    overwrite=True,
+    silent=False,
+    *,
+    timeout: int,
+    session=None,
+    retry=None,
+    ttl: float = 0,
+    deltas: bool = False,
+):
+    """
+    Update an S3-backed TEMPLATEFLOW_HOME repository.
+
+    Upstream is not checked for a newer skeleton if it was checked less than
+    ``ttl`` seconds ago.
+    With ``deltas``, only the changes since the skeleton kept in ``dest`` are fetched,
+    when upstream publishes them.
+    """
+    dest = Path(dest)
+    skel_file = (
+        None
+        if local
+        else _get_skeleton_file(timeout, session, retry, dest=dest, ttl=ttl, deltas=deltas)
+    )
+    if skel_file is None:
+        skel_file = _cached_skeleton(dest)[0] or load_data('templateflow-skel.zip')
+
+    return _update_skeleton(skel_file, dest, overwrite=overwrite, silent=silent)
+
 
-    retval = _update_skeleton(skel_file, dest, overwrite=overwrite, silent=silent)
-    if skel_file != skel_zip:
-        skel_file.unlink()
-    return retval
+def _get_skeleton_file(timeout: int, session=None, retry=None, dest=None, ttl=0, deltas=False):
+    """
+    Fetch the latest skeleton, if it differs from the last one applied.
 
+    With ``dest``, the skeleton is kept within it (see :data:`SKELETON`), and with
+    ``deltas``, only the changes since the one kept before are fetched, when upstream
+    provides them (see :func:`_patch_skeleton`).
+    Otherwise, the skeleton is written to a temporary file.
+
+    The outcome of checking upstream is recorded in ``dest`` too (see :data:`UPDATE_CHECK`),
+    so that no request is sent within ``ttl`` seconds of the last check, and the checksum
+    is requested conditionally afterwards.
+    """
+    from os import close, replace
+    from time import time
 
-def _get_skeleton_file(timeout: int):
     import requests
 
+    from .cache import RetryPolicy
+
+    bundled = load_data.readable('templateflow-skel.md5').read_bytes()
+    cached, md5 = (None, None) if dest is None else _cached_skeleton(dest, bundled)
+    md5 = md5 or bundled
+
+    check = {} if dest is None else _load_json(Path(dest) / UPDATE_CHECK)
+    if check.get('md5', '').encode() == md5 and 0 <= time() - check.get('checked', 0) < ttl:
+        return  # Checked recently, and up-to-date
+
+    http = session or requests
+    retry = retry or RetryPolicy(retries=0)
     try:
-        r = requests.get(
+        r = retry.request(
+            http.get,
             TF_SKEL_URL(release='master', ext='md5'),
             allow_redirects=True,
             timeout=timeout,
+            headers={'If-None-Match': check['etag']} if check.get('etag') else None,
         )
     except requests.exceptions.ConnectionError:
         return
 
-    if not r.ok:
+    if r.status_code == 304 and 'md5' in check:
+        latest = check['md5'].encode()
+    elif r.ok:
+        latest = r.content
+    else:
         return
 
-    md5 = load_data.readable('templateflow-skel.md5').read_bytes()
-    if r.content != md5:
-        r = requests.get(
-            TF_SKEL_URL(release='master', ext='zip'),
-            allow_redirects=True,
-            timeout=timeout,
+    if dest is not None:
+        _write_json(
+            Path(dest) / UPDATE_CHECK,
+            {'checked': time(), 'md5': latest.decode(), 'etag': r.headers.get('ETag')},
+        )
+    if latest == md5:
+        return
+
+    target = None if dest is None else Path(dest) / SKELETON
+    if target is not None:
+        target.parent.mkdir(exist_ok=True, parents=True)
+    fh, skel_file = mkstemp(suffix='.zip', dir=None if target is None else target.parent)
+    close(fh)
+    skel_file = Path(skel_file)
+    try:
+        patched = (
+            deltas
+            and cached is not None
+            and _patch_skeleton(cached, md5, latest, skel_file, http, retry, timeout)
         )
-        if r.ok:
-            from os import close
+        if not patched and not _download(
+            TF_SKEL_URL(release='master', ext='zip'), skel_file, http, retry, timeout
+        ):
+            skel_file.unlink()
+            return
+    except BaseException:
+        skel_file.unlink(missing_ok=True)
+        raise
+
+    if target is None:
+        return skel_file
+
+    replace(skel_file, target)
+    target.with_suffix('.md5').write_bytes(latest)
+    (Path(dest) / SKELETON_BASE).write_bytes(bundled)
+    return target
+
+
+def _cached_skeleton(dest, bundled=None):
+    """
+    Return the skeleton kept in ``dest`` and its checksum, or ``(None, None)``.
+
+    Kept skeletons are newer than the one distributed with the package, unless the
+    package was upgraded after fetching them (see :data:`SKELETON_BASE`).
+    """
+    cached = Path(dest) / SKELETON
+    try:
+        md5 = cached.with_suffix('.md5').read_bytes()
+        base = (Path(dest) / SKELETON_BASE).read_bytes()
+    except OSError:
+        return None, None
+
+    if bundled is None:
+        bundled = load_data.readable('templateflow-skel.md5').read_bytes()
+    if not cached.is_file() or bundled not in (md5, base):
+        return None, None
+    return cached, md5
+
+
+def _patch_skeleton(cached, old_md5, new_md5, target, http, retry, timeout):
+    """
+    Rebuild the latest skeleton into ``target`` from a cached one and a delta.
+
+    Deltas (``templateflow-skel.<old md5>.delta.zip``, see :func:`make_delta`) hold the
+    members added or changed since the skeleton with checksum ``<old md5>``, along with
+    an index (:data:`DELTA_INDEX`) listing the members removed.
+    Returns ``False`` if no (valid) delta is available, or if the rebuilt skeleton does
+    not match ``new_md5``.
+    """
+    from os import close
+    from zipfile import BadZipFile
+
+    import requests
+
+    old, new = _md5(old_md5), _md5(new_md5)
+    fh, delta = mkstemp(suffix='.zip', dir=target.parent)
+    close(fh)
+    delta = Path(delta)
+    try:
+        if not _download(
+            TF_SKEL_URL(release='master', ext=f'{old}.delta.zip'), delta, http, retry, timeout
+        ):
+            return False
+        apply_delta(cached, delta, target, old, new)
+    except (requests.RequestException, BadZipFile, KeyError, ValueError):
+        return False
+    finally:
+        delta.unlink(missing_ok=True)
+    return _file_md5(target) == new
+
+
+def make_delta(base, latest, target):
+    """
+    Write the delta from skeleton ``base`` to ``latest`` into ``target``.
+
+    Members of ``latest`` must be sorted by name, as :func:`apply_delta` writes them,
+    so that skeletons rebuilt from the delta match the checksum of ``latest``.
+    """
+    from json import dumps
+    from zipfile import ZipFile
+
+    def _key(info):
+        return info.CRC, info.file_size, info.date_time, info.compress_type, info.external_attr
+
+    with ZipFile(base) as old, ZipFile(latest) as new, ZipFile(target, 'w') as delta:
+        before = {info.filename: _key(info) for info in old.infolist()}
+        names = new.namelist()
+        if names != sorted(names):
+            raise ValueError(f'Members of <{latest}> are not sorted by name.')
+
+        index = {
+            'from': _file_md5(base),
+            'to': _file_md5(latest),
+            'removed': sorted(set(before) - set(names)),
+        }
+        delta.writestr(DELTA_INDEX, dumps(index))
+        for info in new.infolist():
+            if before.get(info.filename) != _key(info):
+                delta.writestr(info, new.read(info))
+
+
+def apply_delta(base, delta, target, old=None, new=None):
+    """
+    Write the skeleton resulting from applying ``delta`` onto ``base`` into ``target``.
+
+    Members are written sorted by name, so that the same skeleton is rebuilt from
+    the deltas of any earlier one.
+    Raises :obj:`ValueError` if the delta does not lead from checksum ``old`` to ``new``.
+    """
+    from json import loads
+    from zipfile import ZipFile
+
+    with ZipFile(delta) as dzip, ZipFile(base) as src, ZipFile(target, 'w') as dst:
+        index = loads(dzip.read(DELTA_INDEX))
+        if old is not None and (index.get('from'), index.get('to')) != (old, new):
+            raise ValueError('The delta does not apply to this skeleton.')
+
+        removed = set(index.get('removed', ()))
+        members = {info.filename: (src, info) for info in src.infolist()}
+        members.update((info.filename, (dzip, info)) for info in dzip.infolist())
+        members.pop(DELTA_INDEX)
+        for name in sorted(set(members) - removed):
+            zipref, info = members[name]
+            dst.writestr(info, zipref.read(info))
+
 
-            fh, skel_file = mkstemp(suffix='.zip')
-            Path(skel_file).write_bytes(r.content)
-            close(fh)
-            return skel_file
+def _file_md5(path):
+    """Compute the checksum of a file, as found in ``.md5`` files."""
+    from hashlib import md5
+
+    digest = md5()  # noqa: S324
+    with Path(path).open('rb') as f:
+        while chunk := f.read(2**20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _download(url, target, http, retry, timeout):
+    """Stream ``url`` into ``target``, returning whether it was found."""
+    r = retry.request(http.get, url, allow_redirects=True, timeout=timeout, stream=True)
+    if not r.ok:
+        r.close()
+        return False
+
+    with Path(target).open('wb') as f:
+        f.writelines(r.iter_content(chunk_size=2**16))
+    return True
+
+
+def _md5(content):
+    """Extract the checksum from the contents of a ``.md5`` file."""
+    return content.decode().split()[0] if content.strip() else ''
 
 
 def _update_skeleton(skel_file, dest, overwrite=True, silent=False):
+    """
+    Apply a skeleton to ``dest``, only touching what changed since the last one.
+
+    The members of the last skeleton applied (with their CRC and size) and the
+    modification times of their folders are recorded in ``dest``.
+    The manifest is only extracted again if it changed.
+    Members added to the skeleton are extracted if absent, and so are those missing
+    from folders modified since (e.g., because files were deleted), while folders
+    left untouched are not even listed.
+    Members removed from the skeleton are deleted, unless downloaded already.
+    With ``overwrite``, members whose contents changed replace the local files,
+    and ``True`` is always returned so that indexes are refreshed.
+    """
     from zipfile import ZipFile
 
+    from .index import MANIFEST
+
     dest = Path(dest)
     dest.mkdir(exist_ok=True, parents=True)
+    state = _load_state(dest)
+    applied = state.get('members', {})
     with ZipFile(skel_file, 'r') as zipref:
-        allfiles = sorted(zipref.namelist())
+        members = {info.filename: [info.CRC, info.file_size] for info in zipref.infolist()}
+        manifest = members.pop(MANIFEST, None)
 
-        if overwrite:
-            newfiles = allfiles
-        else:
-            current_files = [s.relative_to(dest) for s in dest.glob('**/*')]
-            existing = sorted({f'{s.parent}/' for s in current_files}) + [
-                str(s) for s in current_files
-            ]
-            newfiles = sorted(set(allfiles) - set(existing))
+        # The manifest always describes the last skeleton applied
+        if manifest is None:
+            (dest / MANIFEST).unlink(missing_ok=True)
+        elif manifest != state.get('manifest') or not (dest / MANIFEST).is_file():
+            # Left untouched otherwise, so that indexes loaded from it remain valid
+            _extract_replace(zipref, MANIFEST, dest)
+
+        newfiles = sorted(_missing(dest, members, applied, state.get('dirs', {})))
+        changed = sorted(
+            {m for m in members if m in applied and applied[m] != members[m]} - set(newfiles)
+        )
+        removed = sorted(set(applied) - set(members), reverse=True)
 
-        if newfiles:
+        if newfiles or (overwrite and changed):
             if not silent:
                 print('Updating TEMPLATEFLOW_HOME using S3. Adding:')
 
@@ -109,7 +352,144 @@ def _update_skeleton(skel_file, dest, overwrite=True, silent=False):
                 except FileExistsError:
                     # If there is a conflict, do not clobber
                     pass
-            return True
+
+            if overwrite:
+                for fl in changed:
+                    if not silent:
+                        print(fl)
+                    if not fl.endswith('/'):
+                        _extract_replace(zipref, fl, dest)
+
+    removed = [fl for fl in removed if _remove(dest / fl, applied[fl][1])]
+    if removed and not silent:
+        print('Removing:')
+        print('\n'.join(removed))
+
+    if not overwrite:  # Changed members are still to be applied
+        members.update((m, applied[m]) for m in changed)
+    _save_state(dest, members, manifest)
+    if overwrite or newfiles or removed:
+        return True
     if not silent:
         print('TEMPLATEFLOW_HOME directory (S3 type) was up-to-date.')
     return False
+
+
+def _load_state(dest):
+    """Read what the last skeleton applied to ``dest`` held."""
+    state = _load_json(dest / SKELETON_STATE)
+    return state if state.get('version') == SKELETON_STATE_VERSION else {}
+
+
+def _save_state(dest, members, manifest=None):
+    """Record the skeleton just applied, and the modification times of its folders."""
+    target = dest / SKELETON_STATE
+    try:
+        # Created first, so that recorded modification times are final
+        target.parent.mkdir(exist_ok=True, parents=True)
+    except OSError:  # Read-only homes
+        return
+
+    dirs = {}
+    for parent in {m.rstrip('/').rpartition('/')[0] for m in members}:
+        try:
+            dirs[parent] = (dest / parent).stat().st_mtime_ns
+        except OSError:
+            continue
+
+    # Otherwise, the next update will check all folders
+    _write_json(
+        target,
+        {
+            'version': SKELETON_STATE_VERSION,
+            'members': members,
+            'manifest': manifest,
+            'dirs': dirs,
+        },
+    )
+
+
+def _load_json(path):
+    """Read a JSON object, or an empty one if unavailable."""
+    from json import loads
+
+    try:
+        data = loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _write_json(target, data):
+    """Write a JSON object atomically, giving up silently (e.g., in read-only homes)."""
+    from json import dumps
+    from os import close, replace
+
+    try:
+        target.parent.mkdir(exist_ok=True, parents=True)
+        fh, tmpfile = mkstemp(prefix=f'.{target.name}-', dir=target.parent)
+    except OSError:
+        return
+
+    close(fh)
+    try:
+        Path(tmpfile).write_text(dumps(data))
+        replace(tmpfile, target)
+    except OSError:
+        Path(tmpfile).unlink(missing_ok=True)
+
+
+def _missing(dest, members, applied, dirs):
+    """Find the members absent from ``dest``, only listing folders that may lack some."""
+    from os import listdir
+
+    modified = {}
+    listings = {}
+    missing = []
+    for member in members:
+        parent, _, name = member.rstrip('/').rpartition('/')
+        path = dest / parent
+        if parent not in modified:
+            try:
+                modified[parent] = path.stat().st_mtime_ns != dirs.get(parent)
+            except OSError:
+                modified[parent] = True
+
+        # Members applied before are only looked for in folders modified since
+        if member in applied and not modified[parent]:
+            continue
+        if parent not in listings:
+            try:
+                listings[parent] = set(listdir(path))
+            except OSError:
+                listings[parent] = set()
+        if name not in listings[parent]:
+            missing.append(member)
+    return missing
+
+
+def _remove(path, size):
+    """Delete a file (or empty folder) dropped from the skeleton, unless downloaded since."""
+    try:
+        if path.is_dir():
+            path.rmdir()
+        elif path.stat().st_size == size:
+            path.unlink()
+        else:
+            return False
+    except OSError:
+        return False
+    return True
+
+
+def _extract_replace(zipref, member, dest):
+    """Extract one member, atomically replacing any existing file."""
+    from os import close, replace
+
+    target = Path(dest) / member
+    target.parent.mkdir(exist_ok=True, parents=True)
+    fh, tmpfile = mkstemp(prefix=f'.{target.name}-', dir=target.parent)
+    close(fh)
+    Path(tmpfile).write_bytes(zipref.read(member))
+    Path(tmpfile).chmod(0o644)
+    replace(tmpfile, target)
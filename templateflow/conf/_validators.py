@@ -0,0 +1,113 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright 2025 The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""HTTP validators of downloaded files, to check whether they changed upstream."""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from warnings import warn
+
+from .cache import STATE_DIR
+
+VALIDATORS = f'{STATE_DIR}/validators'
+# Bumped whenever the records change, discarding validators recorded before
+SCHEMA_VERSION = 1
+
+
+class ValidatorStore:
+    """
+    The ``ETag`` and ``Last-Modified`` headers each file was downloaded with.
+
+    Validators are only meaningful to the server that produced them, so the S3 root
+    (or mirror) each file was downloaded from is recorded as well.
+    Each file's validators are kept in a JSON sidecar within the TemplateFlow home,
+    replaced atomically so that concurrent processes (also on network file systems)
+    never read partial records.
+    Files without validators are revalidated by modification time, so failing to
+    read or write sidecars (e.g., on read-only file systems) only issues a warning.
+
+    >>> from tempfile import mkdtemp
+    >>> store = ValidatorStore(mkdtemp())
+    >>> store.get('tpl-MNI152Lin/template_description.json')
+    (None, None, None)
+    >>> store.set('tpl-MNI152Lin/template_description.json', '"abc"', None, 'https://a.org')
+    >>> store.get('tpl-MNI152Lin/template_description.json')
+    ('"abc"', None, 'https://a.org')
+
+    """
+
+    def __init__(self, root: Path | str):
+        self.path = Path(root) / VALIDATORS
+
+    def __repr__(self) -> str:
+        return f'<ValidatorStore {self.path}>'
+
+    def _sidecar(self, relpath: str) -> Path:
+        return self.path / f'{relpath}.json'
+
+    def get(self, relpath: str) -> tuple[str | None, str | None, str | None]:
+        """Return the ``ETag``, ``Last-Modified`` and S3 root recorded for ``relpath``."""
+        from json import loads
+
+        try:
+            record = loads(self._sidecar(relpath).read_text())
+        except FileNotFoundError:
+            return None, None, None
+        except (OSError, ValueError) as exc:
+            warn(f'Could not read the validators of <{relpath}>: {exc}', stacklevel=2)
+            return None, None, None
+        if not isinstance(record, dict) or record.get('version') != SCHEMA_VERSION:
+            return None, None, None
+        return record.get('etag'), record.get('last_modified'), record.get('root')
+
+    def set(
+        self,
+        relpath: str,
+        etag: str | None,
+        last_modified: str | None,
+        root: str | None = None,
+    ) -> None:
+        """Record the validators of ``relpath``, as downloaded from ``root``."""
+        from json import dumps
+        from tempfile import mkstemp
+
+        sidecar = self._sidecar(relpath)
+        record = {
+            'version': SCHEMA_VERSION,
+            'etag': etag,
+            'last_modified': last_modified,
+            'root': root,
+        }
+        try:
+            sidecar.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = mkstemp(dir=sidecar.parent, prefix=f'.{sidecar.name}.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(dumps(record))
+                os.replace(tmp, sidecar)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as exc:
+            warn(f'Could not record the validators of <{relpath}>: {exc}', stacklevel=2)
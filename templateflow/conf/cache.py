@@ -22,22 +22,60 @@
 #
 from __future__ import annotations
 
+import os
+import random
+import sys
 from dataclasses import dataclass, field
 from functools import cache, cached_property
 from pathlib import Path
+from threading import Lock
+from time import monotonic, sleep
 from warnings import warn
 
-from templateflow.conf.env import env_to_bool, get_templateflow_home
+from acres import Loader
+
+from templateflow.conf._http import RETRY_STATUS, MirrorSet, SessionPool, is_transient
+from templateflow.conf.env import (
+    env_to_bool,
+    env_to_float,
+    env_to_int,
+    env_to_list,
+    env_to_str,
+    get_templateflow_home,
+)
 
 TYPE_CHECKING = False
 if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+    from typing import Any
+
     from bids.layout import BIDSLayout
+    from requests import Response, Session
+
+    from templateflow.conf.index import ShardedIndex, TemplateFlowIndex
+    from templateflow.conf.progress import ProgressCallback
+
+load_data = Loader(__spec__.parent)
+
+# Hidden folder within TEMPLATEFLOW_HOME where the client keeps its own state
+STATE_DIR = '.templateflow'
+
+QUERY_ENGINES = ('pybids', 'native')
 
 
-# The first CacheConfig is initialized during import, so we need a higher
-# level of indirection for warnings to point to the user code.
-# After that, we will set the stack level to point to the CacheConfig() caller.
-STACKLEVEL = 6
+def _stacklevel() -> int:
+    """Return the stack level of the first caller outside TemplateFlow, for warnings.
+
+    The global cache is set up on first use, from whichever function needs it,
+    so warnings cannot point at user code with a fixed stack level.
+    """
+    frame, level = sys._getframe(1), 1
+    while frame.f_back is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.partition('.')[0] != 'templateflow' or module.startswith('templateflow.tests'):
+            break
+        frame, level = frame.f_back, level + 1
+    return level
 
 
 @cache
@@ -47,6 +85,104 @@ def _have_datalad() -> bool:
     return importlib.util.find_spec('datalad') is not None
 
 
+@cache
+def _have_httpx() -> bool:
+    import importlib.util
+
+    return importlib.util.find_spec('httpx') is not None
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    How failed network requests are retried.
+
+    Only transient failures (dropped connections, timeouts, truncated transfers,
+    throttling and server errors) are retried.
+    Retries wait for a random delay of up to ``backoff * 2 ** (n - 1)`` seconds
+    (exponential backoff with full jitter), capped at ``max_backoff``.
+
+    Parameters
+    ----------
+    retries : :obj:`int`
+        Maximum number of times a request is tried again (``0`` disables retries).
+    backoff : :obj:`float`
+        Base delay in seconds.
+    max_backoff : :obj:`float`
+        Longest delay in seconds between two attempts.
+    deadline : :obj:`float` or ``None``
+        Seconds since the first attempt after which no retries are started.
+
+    """
+
+    retries: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 30.0
+    deadline: float | None = 300.0
+
+    @classmethod
+    def from_env(cls) -> RetryPolicy:
+        """Read the policy from ``TEMPLATEFLOW_RETRIES`` and ``TEMPLATEFLOW_RETRY_DEADLINE``."""
+        return cls(
+            retries=max(env_to_int('TEMPLATEFLOW_RETRIES', cls.retries)(), 0),
+            deadline=env_to_int('TEMPLATEFLOW_RETRY_DEADLINE', int(cls.deadline))() or None,
+        )
+
+    def delay(self, attempt: int, start: float) -> float | None:
+        """Return the delay before retry number ``attempt``, or ``None`` to give up."""
+        if attempt > self.retries:
+            return None
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        if self.deadline is not None and monotonic() - start + delay > self.deadline:
+            return None
+        return delay
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call ``func``, retrying if it fails transiently."""
+        start = monotonic()
+        for attempt in range(1, self.retries + 2):
+            try:
+                return func(*args, **kwargs)
+            except Exception as exc:
+                if not is_transient(exc) or (delay := self.delay(attempt, start)) is None:
+                    raise
+            sleep(delay)
+
+    async def acall(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Await ``func``, retrying if it fails transiently."""
+        import asyncio
+
+        start = monotonic()
+        for attempt in range(1, self.retries + 2):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as exc:
+                if not is_transient(exc) or (delay := self.delay(attempt, start)) is None:
+                    raise
+            await asyncio.sleep(delay)
+
+    def request(self, method: Callable[..., Response], url: str, **kwargs) -> Response:
+        """
+        Send a request with ``method`` (e.g., ``session.get``), retrying if it fails transiently.
+
+        Responses with transient error codes are retried too, and the last one is
+        returned if all attempts fail.
+        """
+        start = monotonic()
+        for attempt in range(1, self.retries + 2):
+            try:
+                response = method(url, **kwargs)
+            except Exception as exc:
+                if not is_transient(exc) or (delay := self.delay(attempt, start)) is None:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    return response
+                if (delay := self.delay(attempt, start)) is None:
+                    return response
+            sleep(delay)
+
+
 @dataclass
 class CacheConfig:
     root: Path = field(default_factory=get_templateflow_home)
@@ -55,18 +191,58 @@ class CacheConfig:
     use_datalad: bool = field(default_factory=env_to_bool('TEMPLATEFLOW_USE_DATALAD', False))
     autoupdate: bool = field(default_factory=env_to_bool('TEMPLATEFLOW_AUTOUPDATE', True))
     timeout: int = field(default=10)
+    # New settings go last, so that positional arguments keep their meaning
+    s3_mirrors: list[str] = field(default_factory=env_to_list('TEMPLATEFLOW_S3_MIRRORS'))
+    hedge_after: float = field(default_factory=env_to_float('TEMPLATEFLOW_HEDGE_AFTER', 0))
+    update_ttl: float = field(default_factory=env_to_float('TEMPLATEFLOW_UPDATE_TTL', 3600))
+    skeleton_deltas: bool = field(
+        default_factory=env_to_bool('TEMPLATEFLOW_SKELETON_DELTAS', False)
+    )
+    layout_cache: bool = field(default_factory=env_to_bool('TEMPLATEFLOW_LAYOUT_CACHE', True))
+    query_engine: str = field(default_factory=env_to_str('TEMPLATEFLOW_QUERY_ENGINE', 'pybids'))
+    query_cache_size: int = field(default_factory=env_to_int('TEMPLATEFLOW_QUERY_CACHE_SIZE', 256))
+    lazy_index: bool = field(default_factory=env_to_bool('TEMPLATEFLOW_LAZY_INDEX', False))
+    max_workers: int = field(default_factory=env_to_int('TEMPLATEFLOW_MAX_WORKERS', 8))
+    multipart_threshold: int = field(
+        default_factory=env_to_int('TEMPLATEFLOW_MULTIPART_THRESHOLD', 64 * 2**20)
+    )
+    retry: RetryPolicy = field(default_factory=RetryPolicy.from_env)
+    blob_store: Path | None = field(default_factory=env_to_str('TEMPLATEFLOW_BLOB_STORE', ''))
+    layers: list[Path] = field(default_factory=env_to_list('TEMPLATEFLOW_LAYERS', os.pathsep))
+    progress: bool | ProgressCallback = field(
+        default_factory=env_to_bool('TEMPLATEFLOW_PROGRESS', True)
+    )
 
     def __post_init__(self) -> None:
-        global STACKLEVEL
         if self.use_datalad and not _have_datalad():
             self.use_datalad = False
-            warn('DataLad is not installed ➔ disabled.', stacklevel=STACKLEVEL)
-        STACKLEVEL = 3
+            warn('DataLad is not installed ➔ disabled.', stacklevel=_stacklevel())
+        self.query_engine = self.query_engine.lower()
+        if self.query_engine not in QUERY_ENGINES:
+            warn(
+                f'Unknown query engine <{self.query_engine}> ➔ using PyBIDS.',
+                stacklevel=_stacklevel(),
+            )
+            self.query_engine = 'pybids'
+        if self.lazy_index:
+            # Only the native engine can be indexed per template
+            self.query_engine = 'native'
+        self.max_workers = max(self.max_workers, 1)
+        self.blob_store = Path(self.blob_store).absolute() if self.blob_store else None
+        self.layers = [Path(layer).absolute() for layer in self.layers]
+        if not isinstance(self.s3_root, str):
+            # A list of equivalent roots, the first one being the primary
+            self.s3_root, *mirrors = self.s3_root
+            self.s3_mirrors = [*mirrors, *self.s3_mirrors]
 
 
 @dataclass
 class S3Manager:
     s3_root: str
+    sessions: SessionPool | None = None
+    retry: RetryPolicy | None = None
+    ttl: float = 0
+    deltas: bool = False
 
     def install(self, path: Path, overwrite: bool, timeout: int) -> None:
         from ._s3 import update
@@ -76,7 +252,17 @@ class S3Manager:
     def update(self, path: Path, local: bool, overwrite: bool, silent: bool, timeout: int) -> bool:
         from ._s3 import update as _update_s3
 
-        return _update_s3(path, local=local, overwrite=overwrite, silent=silent, timeout=timeout)
+        return _update_s3(
+            path,
+            local=local,
+            overwrite=overwrite,
+            silent=silent,
+            timeout=timeout,
+            session=self.sessions.get() if self.sessions else None,
+            retry=self.retry,
+            ttl=self.ttl,
+            deltas=self.deltas,
+        )
 
     def wipe(self, path: Path) -> None:
         from shutil import rmtree
@@ -122,19 +308,54 @@ class TemplateFlowCache:
     config: CacheConfig
     precached: bool = field(init=False)
     manager: DataladManager | S3Manager = field(init=False)
+    sessions: SessionPool = field(init=False)
+    mirrors: MirrorSet = field(init=False)
+    # Incremented whenever indexes are dropped, so that derived results can be invalidated
+    generation: int = field(init=False, default=0)
+    # Serializes building the indexes, which threads may race to use first
+    _lock: Lock = field(init=False, default_factory=Lock, repr=False, compare=False)
 
     def __post_init__(self) -> None:
+        # Keep connections to every host the downloader threads may talk to
+        self.sessions = SessionPool(pool_maxsize=max(self.config.max_workers, 10))
+        self.mirrors = MirrorSet(
+            [self.config.s3_root, *self.config.s3_mirrors],
+            timeout=self.config.timeout,
+            sessions=self.sessions,
+            retry=self.config.retry,
+        )
         self.manager = (
             DataladManager(self.config.origin)
             if self.config.use_datalad
-            else S3Manager(self.config.s3_root)
+            else S3Manager(
+                self.config.s3_root,
+                self.sessions,
+                self.config.retry,
+                self.config.update_ttl,
+                self.config.skeleton_deltas,
+            )
         )
         # cache.cached checks live, precached stores state at init
         self.precached = self.cached
 
     @property
     def cached(self) -> bool:
-        return self.config.root.is_dir() and any(self.config.root.iterdir())
+        # The state folder alone (e.g., shell completions) does not make a home installed
+        return self.config.root.is_dir() and any(
+            p.name != STATE_DIR for p in self.config.root.iterdir()
+        )
+
+    @property
+    def session(self) -> Session:
+        """An HTTP session for the calling thread, drawing on pooled connections."""
+        return self.sessions.get()
+
+    @property
+    def layout_db(self) -> Path | None:
+        """Location of the persistent layout index, if enabled."""
+        if not self.config.layout_cache or self.config.use_datalad:
+            return None
+        return self.config.root / STATE_DIR / f'layout-{_layout_key(self.config.root)}'
 
     @cached_property
     def layout(self) -> BIDSLayout:
@@ -145,7 +366,14 @@ class TemplateFlowCache:
         from .bids import Layout
 
         self.ensure()
-        return Layout(
+        database_path = self.layout_db
+        if database_path is not None and (database_path / 'layout_index.sqlite').is_file():
+            try:
+                return Layout(database_path=database_path, validate=False)
+            except Exception as exc:  # noqa: BLE001
+                warn(f'Rebuilding TemplateFlow layout index ({exc}).', stacklevel=2)
+
+        layout = Layout(
             self.config.root,
             validate=False,
             config='templateflow',
@@ -154,6 +382,81 @@ class TemplateFlowCache:
                 ignore=(re.compile(r'scripts/'), re.compile(r'/\.'), re.compile(r'^\.')),
             ),
         )
+        if database_path is not None:
+            _save_layout(layout, database_path)
+        return layout
+
+    @cached_property
+    def index(self) -> TemplateFlowIndex | ShardedIndex:
+        from .index import ShardedIndex, load_index
+
+        with self._lock:
+            if 'index' in self.__dict__:  # Built by another thread meanwhile
+                return self.__dict__['index']
+            self.ensure()
+            if self.config.lazy_index:
+                return ShardedIndex(self.config.root)
+            return load_index(self.config.root)
+
+    @cached_property
+    def declared(self) -> dict[str, tuple[int | None, str | None]]:
+        """Size and checksum of each file listed by the skeleton's manifest, if any."""
+        from .index import load_manifest
+
+        with self._lock:
+            if 'declared' in self.__dict__:  # Read by another thread meanwhile
+                return self.__dict__['declared']
+            self.ensure()
+            manifest = load_manifest(self.config.root) or {'files': {}}
+            return {
+                path: (f.get('size'), f.get('checksum')) for path, f in manifest['files'].items()
+            }
+
+    @property
+    def engine(self) -> BIDSLayout | TemplateFlowIndex | ShardedIndex:
+        """The index answering queries, as selected by ``config.query_engine``."""
+        return self.index if self.config.query_engine == 'native' else self.layout
+
+    def locate(self, path: Path) -> Path:
+        """
+        Return where the contents of ``path`` (a file under ``config.root``) are found.
+
+        Read-only layers are looked up in order, and the first one holding the file
+        (rather than a skeleton placeholder) wins.
+        Otherwise, ``path`` is returned, and the file is downloaded there.
+        """
+        if self.config.layers:
+            relpath = path.relative_to(self.config.root)
+            for layer in self.config.layers:
+                candidate = layer / relpath
+                if candidate.is_file() and candidate.stat().st_size > 0:
+                    return candidate
+        return path
+
+    def expected(self, path: Path) -> tuple[int | None, str | None]:
+        """
+        Return the size and checksum the skeleton's manifest declares for ``path``.
+
+        The native index holds them already, otherwise only the manifest is read.
+        """
+        if self.config.query_engine == 'native':
+            return self.index.expected(path)
+        relpath = Path(path).absolute().relative_to(self.config.root.absolute()).as_posix()
+        return self.declared.get(relpath, (None, None))
+
+    def clear_layout(self) -> None:
+        """Drop the in-memory indexes and any persisted layout or completions."""
+        from shutil import rmtree
+
+        from .index import COMPLETIONS
+
+        self.__dict__.pop('layout', None)  # Uncache property
+        self.__dict__.pop('index', None)
+        self.__dict__.pop('declared', None)
+        self.generation += 1
+        for database_path in (self.config.root / STATE_DIR).glob('layout-*'):
+            rmtree(database_path, ignore_errors=True)
+        (self.config.root / COMPLETIONS).unlink(missing_ok=True)
 
     def ensure(self) -> None:
         if not self.cached:
@@ -169,10 +472,69 @@ class TemplateFlowCache:
             silent=silent,
             timeout=self.config.timeout,
         ):
-            self.__dict__.pop('layout', None)  # Uncache property
+            self.clear_layout()
             return True
         return False
 
     def wipe(self) -> None:
-        self.__dict__.pop('layout', None)  # Uncache property
+        self.clear_layout()
         self.manager.wipe(self.config.root)
+
+
+def _layout_key(root: Path) -> str:
+    """
+    Identify a layout index by the skeleton applied, the template folders found,
+    PyBIDS version and location.
+
+    Template folders are stamped with their modification times, so that folders
+    added or edited by hand are indexed too.
+    """
+    from hashlib import sha256
+    from json import dumps
+
+    from bids import __version__
+
+    from ._s3 import SKELETON_STATE
+    from .index import tree_stamp
+
+    try:
+        skeleton = (root / SKELETON_STATE).read_bytes()
+    except OSError:  # Homes set up before skeleton states were recorded
+        skeleton = load_data.readable('templateflow-skel.md5').read_bytes()
+    key = b'\0'.join(
+        (
+            sha256(skeleton).digest(),
+            dumps(tree_stamp(root)).encode(),
+            __version__.encode(),
+            str(root).encode(),
+        )
+    )
+    return sha256(key).hexdigest()[:16]
+
+
+def _save_layout(layout: BIDSLayout, database_path: Path) -> None:
+    """Persist a layout index atomically, so concurrent processes never see partial files."""
+    from shutil import rmtree
+    from tempfile import mkdtemp
+
+    try:
+        database_path.parent.mkdir(parents=True, exist_ok=True)
+        tmpdir = Path(mkdtemp(prefix=f'.{database_path.name}-', dir=database_path.parent))
+    except OSError:
+        # Read-only cache, just keep the layout in memory
+        return
+
+    try:
+        layout.save(tmpdir, replace_connection=False)
+        tmpdir.chmod(0o755)
+        tmpdir.replace(database_path)
+    except OSError:
+        # Another process persisted the index first
+        pass
+    finally:
+        rmtree(tmpdir, ignore_errors=True)
+
+    # Indexes of earlier states of the tree are never used again
+    for stale in database_path.parent.glob('layout-*'):
+        if stale != database_path:
+            rmtree(stale, ignore_errors=True)
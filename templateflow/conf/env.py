@@ -51,9 +51,47 @@ def _env_to_bool(envvar: str, default: bool) -> bool:
     return bool(val)
 
 
+def _env_to_number(envvar: str, default: float, cast: Callable[[str], float] = int) -> float:
+    """Read a numeric setting from the environment."""
+    val = os.getenv(envvar)
+    if val is None:
+        return default
+    try:
+        return cast(val)
+    except ValueError:
+        print(
+            f'{envvar} is set to unknown value <{val}>. Falling back to default value <{default}>'
+        )
+        return default
+
+
+def _env_to_list(envvar: str, sep: str | None = None) -> list[str]:
+    """Read a list of values separated by ``sep`` (commas or whitespace by default)."""
+    val = os.getenv(envvar, '')
+    if sep is None:
+        return val.replace(',', ' ').split()
+    return [item for item in val.split(sep) if item]
+
+
 def get_templateflow_home() -> Path:
     return Path(os.getenv('TEMPLATEFLOW_HOME', user_cache_dir('templateflow'))).absolute()
 
 
 def env_to_bool(envvar: str, default: bool) -> Callable[[], bool]:
     return partial(_env_to_bool, envvar, default)
+
+
+def env_to_int(envvar: str, default: int) -> Callable[[], int]:
+    return partial(_env_to_number, envvar, default, int)
+
+
+def env_to_float(envvar: str, default: float) -> Callable[[], float]:
+    return partial(_env_to_number, envvar, default, float)
+
+
+def env_to_list(envvar: str, sep: str | None = None) -> Callable[[], list[str]]:
+    return partial(_env_to_list, envvar, sep)
+
+
+def env_to_str(envvar: str, default: str) -> Callable[[], str]:
+    return partial(os.getenv, envvar, default)
@@ -0,0 +1,618 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright 2025 The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""A PyBIDS-free query engine for TemplateFlow's home folder.
+
+The entities defined in ``config.json`` are compiled once, every file name is
+parsed in a single pass, and queries are answered by intersecting per-entity
+inverted indexes (entity value → set of file ids).
+Results mirror those of :meth:`bids.layout.BIDSLayout.get` for the TemplateFlow
+configuration.
+
+When the skeleton carries a manifest (``.templateflow/manifest.json``) with the
+pre-parsed entities of every file, the index is loaded from it without walking
+the home folder.
+Only template folders the manifest does not list (e.g., added by hand) are walked.
+
+>>> parse_path('tpl-MNI152Lin/tpl-MNI152Lin_res-01_T1w.nii.gz')
+{'template': 'MNI152Lin', 'resolution': 1, 'suffix': 'T1w', 'extension': '.nii.gz'}
+
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from enum import Enum
+from functools import cache, partial
+from pathlib import Path
+
+from acres import Loader
+
+from templateflow.conf.cache import STATE_DIR
+
+load_data = Loader(__spec__.parent)
+
+MANIFEST = f'{STATE_DIR}/manifest.json'
+MANIFEST_VERSION = 1
+COMPLETIONS = f'{STATE_DIR}/completions.json'
+
+# Same rules applied by the PyBIDS indexer, matched against root-anchored paths
+IGNORE = (
+    re.compile(r'scripts/'),
+    re.compile(r'/\.'),
+    re.compile(r'^/(code|models|sourcedata|stimuli)'),
+)
+
+
+class Query(Enum):
+    """Special query values, equivalent to :class:`bids.layout.Query`."""
+
+    NONE = 1  # Entity must not be present
+    REQUIRED = ANY = 2  # Entity must be defined, with unspecified value
+    OPTIONAL = 3  # Entity may or may not be defined
+
+
+@dataclass(frozen=True)
+class Entity:
+    name: str
+    regex: re.Pattern
+    mandatory: bool = False
+    dtype: type = str
+
+    def match(self, path: str) -> str | int | None:
+        m = self.regex.search(path)
+        return None if m is None else self.dtype(m.group(1))
+
+
+@cache
+def load_entities() -> tuple[Entity, ...]:
+    """Compile the entities defined in TemplateFlow's ``config.json``."""
+    from json import loads
+
+    config = loads(load_data('config.json').read_text())
+    return tuple(
+        Entity(
+            name=e['name'],
+            regex=re.compile(e['pattern']),
+            mandatory=e.get('mandatory', False),
+            dtype=int if e.get('dtype') == 'int' else str,
+        )
+        for e in config['entities']
+    )
+
+
+@cache
+def config_digest() -> str:
+    """Fingerprint the entity configuration manifests were parsed with."""
+    from hashlib import sha256
+
+    return sha256(load_data('config.json').read_bytes()).hexdigest()[:16]
+
+
+def parse_path(relpath: str) -> dict[str, str | int]:
+    """Extract the entities of a path, relative to TemplateFlow's home."""
+    path = f'/{relpath}'
+    entities = {}
+    for entity in load_entities():
+        value = entity.match(path)
+        if value is None:
+            if entity.mandatory:
+                break
+            continue
+        entities[entity.name] = value
+    return entities
+
+
+def walk(root: Path) -> Iterable[str]:
+    """Yield indexable files under ``root`` as relative POSIX paths."""
+    root = str(root)
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+        reldir = os.path.relpath(dirpath, root).replace(os.sep, '/')
+        prefix = '' if reldir == '.' else f'{reldir}/'
+        dirnames[:] = [d for d in dirnames if not _ignored(f'{prefix}{d}')]
+        for fname in filenames:
+            relpath = f'{prefix}{fname}'
+            if not _ignored(relpath):
+                yield relpath
+
+
+def make_manifest(
+    paths: Iterable[str],
+    sizes: Mapping[str, int] | None = None,
+    checksums: Mapping[str, str] | None = None,
+) -> dict:
+    """
+    Precompute the entities of the skeleton's files.
+
+    Parameters
+    ----------
+    paths : iterable of str
+        POSIX paths relative to TemplateFlow's home, as listed in the skeleton.
+    sizes : mapping, optional
+        Expected size in bytes of each file.
+    checksums : mapping, optional
+        Expected checksum of each file, formatted as ``<algorithm>:<hexdigest>``.
+
+    """
+    sizes = sizes or {}
+    checksums = checksums or {}
+    return {
+        'version': MANIFEST_VERSION,
+        'config': config_digest(),
+        'files': {
+            path: {
+                'entities': parse_path(path),
+                'size': sizes.get(path),
+                'checksum': checksums.get(path),
+            }
+            for path in sorted(paths)
+            if not path.endswith('/') and not _ignored(path)
+        },
+    }
+
+
+def load_manifest(root: os.PathLike[str] | str) -> dict | None:
+    """Read the manifest of the last skeleton applied to ``root``, if usable."""
+    from json import loads
+
+    try:
+        manifest = loads((Path(root) / MANIFEST).read_text())
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def load_index(root: os.PathLike[str] | str) -> TemplateFlowIndex:
+    """Load the index from the skeleton's manifest, or walk the tree if unavailable."""
+    manifest = load_manifest(root)
+    if manifest is None:
+        return TemplateFlowIndex.from_root(root)
+    return TemplateFlowIndex.from_manifest(root, manifest)
+
+
+def load_completions(root: os.PathLike[str] | str) -> dict[str, dict[str, list[str]]]:
+    """
+    Map each template onto the values each of its entities takes.
+
+    This summary is all shell completion needs, and is cached within the home
+    folder so that completing does not require indexing it.
+    The cache is rebuilt whenever the manifest or any template folder changes.
+    """
+    from json import dumps, loads
+
+    root = Path(root)
+    stamp = _stamp(root)
+    if stamp == [None, []]:
+        # Not populated yet: writing the cache would make the home look installed
+        return {}
+
+    try:
+        cached = loads((root / COMPLETIONS).read_text())
+        if cached.get('stamp') == stamp:
+            return cached['templates']
+    except (OSError, ValueError):
+        pass
+
+    index = load_index(root)
+    values: dict[str, dict[str, set[str]]] = {}
+    for entities in index._values:
+        if 'template' not in entities:
+            continue
+        template = values.setdefault(entities['template'], {})
+        for name, value in entities.items():
+            if name != 'template':
+                template.setdefault(name, set()).add(str(value))
+    templates = {
+        tpl: {name: sorted(v, key=_natural_key) for name, v in sorted(entities.items())}
+        for tpl, entities in sorted(values.items(), key=lambda item: _natural_key(item[0]))
+    }
+
+    try:  # Homes may be read-only
+        tmp = root / f'{COMPLETIONS}.{os.getpid()}.tmp'
+        tmp.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(dumps({'stamp': stamp, 'templates': templates}))
+        os.replace(tmp, root / COMPLETIONS)
+    except OSError:
+        pass
+    return templates
+
+
+def _stamp(root: Path) -> list:
+    """Fingerprint the home folder by the modification times of its template folders."""
+    try:
+        manifest = (root / MANIFEST).stat().st_mtime_ns
+    except OSError:
+        manifest = None
+    return [manifest, tree_stamp(root)]
+
+
+def tree_stamp(root: os.PathLike[str] | str) -> list[list]:
+    """List the template folders of ``root`` with their modification times."""
+    try:
+        with os.scandir(root) as entries:
+            return sorted(
+                [e.name, e.stat().st_mtime_ns]
+                for e in entries
+                if e.name.startswith('tpl-') and e.is_dir()
+            )
+    except OSError:
+        return []
+
+
+def _template_dirs(root: os.PathLike[str] | str) -> set[str]:
+    """List the template folders found on disk under ``root``."""
+    try:
+        with os.scandir(root) as entries:
+            return {
+                e.name
+                for e in entries
+                if e.name.startswith('tpl-') and not _ignored(e.name) and e.is_dir()
+            }
+    except OSError:
+        return set()
+
+
+def _ignored(relpath: str) -> bool:
+    path = f'/{relpath}'
+    return any(patt.search(path) for patt in IGNORE)
+
+
+def _natural_key(text: str) -> list[str | int]:
+    return [int(c) if c.isdigit() else c.lower() for c in re.split(r'([0-9]+)', str(text))]
+
+
+class TemplateFlowIndex:
+    """In-memory index of the files under TemplateFlow's home folder."""
+
+    def __init__(
+        self,
+        root: os.PathLike[str] | str,
+        files: Mapping[str, Mapping[str, str | int]],
+        expected: Mapping[str, tuple[int | None, str | None]] | None = None,
+    ):
+        self._root = Path(root).absolute()
+        self._expected = expected or {}
+        self._names = {e.name: e for e in load_entities()}
+        self._paths: list[str] = []
+        self._inverted: dict[str, dict[str | int, set[int]]] = {name: {} for name in self._names}
+        self._values: list[Mapping[str, str | int]] = []
+        for fid, (relpath, entities) in enumerate(files.items()):
+            self._paths.append(relpath)
+            self._values.append(entities)
+            for name, value in entities.items():
+                self._inverted[name].setdefault(value, set()).add(fid)
+        self._all = set(range(len(self._paths)))
+        self._defined = {
+            name: set().union(*index.values()) for name, index in self._inverted.items()
+        }
+
+    @classmethod
+    def from_root(
+        cls, root: os.PathLike[str] | str, subdir: str | None = None
+    ) -> TemplateFlowIndex:
+        """Index the tree under ``root`` (or only its ``subdir`` folder)."""
+        if subdir is None:
+            relpaths = walk(root)
+        else:
+            relpaths = (f'{subdir}/{relpath}' for relpath in walk(Path(root) / subdir))
+        return cls(root, {relpath: parse_path(relpath) for relpath in relpaths})
+
+    @classmethod
+    def from_manifest(
+        cls, root: os.PathLike[str] | str, manifest: Mapping, subdir: str | None = None
+    ) -> TemplateFlowIndex:
+        """Build the index from a skeleton manifest (see :func:`make_manifest`)."""
+        files = manifest['files']
+        if subdir is not None:
+            files = {path: f for path, f in files.items() if path.startswith(f'{subdir}/')}
+        # Entities are parsed again if the manifest was generated with another configuration
+        reparse = manifest.get('config') != config_digest()
+        entities = {
+            path: parse_path(path) if reparse else f['entities'] for path, f in files.items()
+        }
+        if subdir is None:
+            # Template folders not listed by the manifest (e.g., added by hand) are walked
+            for tpl in sorted(_template_dirs(root) - _listed(files)):
+                for relpath in walk(Path(root) / tpl):
+                    entities[f'{tpl}/{relpath}'] = parse_path(f'{tpl}/{relpath}')
+        return cls(
+            root,
+            entities,
+            expected={path: (f.get('size'), f.get('checksum')) for path, f in files.items()},
+        )
+
+    @property
+    def root(self) -> str:
+        return str(self._root)
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def __repr__(self) -> str:
+        return f"""\
+TemplateFlow Index
+ - Home: {self.root}
+ - Templates: {', '.join(sorted(self.get_templates()))}."""
+
+    def __getattr__(self, name: str):
+        if name.startswith('get_'):
+            target = _singular(name[4:], self._names)
+            if target is not None:
+                return partial(self.get, return_type='id', target=target)
+        raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
+
+    def expected(self, path: os.PathLike[str] | str) -> tuple[int | None, str | None]:
+        """Return the size and checksum the manifest declares for ``path``, if any."""
+        relpath = Path(path).absolute().relative_to(self._root).as_posix()
+        return self._expected.get(relpath, (None, None))
+
+    def get_entities(self) -> list[str]:
+        """Return the names of the entities that can be queried."""
+        return list(self._names)
+
+    def supports(self, filters: Iterable[str]) -> bool:
+        """Check whether all ``filters`` are file-name entities."""
+        return all(f in self._names for f in filters)
+
+    def get(self, return_type: str = 'file', target: str | None = None, **filters):
+        """
+        Query the index (see :meth:`bids.layout.BIDSLayout.get`).
+
+        Parameters
+        ----------
+        return_type : {'file', 'id'}
+            Return matching file paths, or the unique values of ``target``.
+        target : str or None
+            Entity whose values are returned when ``return_type='id'``.
+
+        """
+        _check_entities(filters, self._names)
+
+        fids = self._all
+        for name, value in filters.items():
+            fids = self._filter(fids, name, value)
+            if not fids:
+                break
+
+        if return_type.startswith('file'):
+            return self._files(fids)
+        if return_type == 'id':
+            if target not in self._names:
+                raise ValueError(f"Unknown target '{target}'.")
+            values = {self._values[fid].get(target) for fid in fids} - {None}
+            return sorted(values, key=_natural_key)
+        raise ValueError(f'Unsupported return type <{return_type}>.')
+
+    def get_many(self, queries: Iterable[Mapping]) -> list[list[str]]:
+        """
+        Return the files matching each of several sets of filters (see :meth:`get`).
+
+        Queries are resolved together, so that filters they share (e.g., on the same
+        template) are only looked up in the index once.
+        """
+        queries = list(queries)
+        for filters in queries:
+            _check_entities(filters, self._names)
+
+        matched: dict[tuple, set[int]] = {}
+        results = []
+        for filters in queries:
+            fids = self._all
+            for name, value in filters.items():
+                values = value if isinstance(value, (list, tuple, set)) else [value]
+                key = (name, tuple((type(v), v) for v in values))
+                if key not in matched:
+                    matched[key] = self._filter(self._all, name, value)
+                fids = fids & matched[key]
+                if not fids:
+                    break
+            results.append(self._files(fids))
+        return results
+
+    def _files(self, fids: set[int]) -> list[str]:
+        return sorted((str(self._root / self._paths[fid]) for fid in fids), key=_natural_key)
+
+    def _filter(self, fids: set[int], name: str, value) -> set[int]:
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        if not values or any(_query(v) is Query.OPTIONAL for v in values):
+            return fids
+
+        index = self._inverted[name]
+        matched = set()
+        for v in values:
+            q = _query(v)
+            if q is Query.NONE:
+                matched |= fids - self._defined[name]
+            elif q is Query.REQUIRED:
+                matched |= fids & self._defined[name]
+            else:
+                for key in self._keys(name, v):
+                    matched |= fids & index[key]
+        return matched
+
+    def _keys(self, name: str, value) -> list[str | int]:
+        """Find the index keys matching a query value, with PyBIDS' casting rules."""
+        index = self._inverted[name]
+        dtype = self._names[name].dtype
+        if dtype is int or (isinstance(value, int) and not isinstance(value, bool)):
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                return []
+            if dtype is int:
+                return [value] if value in index else []
+            return [k for k in index if k.isdigit() and int(k) == value]
+        return [value] if value in index else []
+
+
+class ShardedIndex:
+    """
+    An index split by template, where each shard is only built when first queried.
+
+    Queries naming one or more templates build just those shards, and listing the
+    available templates only requires listing the home folder.
+    Otherwise, this class behaves as :class:`TemplateFlowIndex`.
+    """
+
+    def __init__(self, root: os.PathLike[str] | str):
+        from threading import Lock
+
+        self._root = Path(root).absolute()
+        self._names = {e.name: e for e in load_entities()}
+        self._shards: dict[str, TemplateFlowIndex] = {}
+        self._lock = Lock()
+        self._manifest = load_manifest(self._root)
+        self._listed = _listed(self._manifest['files']) if self._manifest is not None else set()
+
+    @property
+    def root(self) -> str:
+        return str(self._root)
+
+    def __len__(self) -> int:
+        return sum(len(self.shard(t)) for t in self.templates())
+
+    def __repr__(self) -> str:
+        return f"""\
+TemplateFlow Index (lazy)
+ - Home: {self.root}
+ - Templates: {', '.join(self.templates())}."""
+
+    def __getattr__(self, name: str):
+        if name.startswith('get_'):
+            target = _singular(name[4:], self._names)
+            if target == 'template':
+                return self._get_templates
+            if target is not None:
+                return partial(self.get, return_type='id', target=target)
+        raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
+
+    def templates(self) -> list[str]:
+        """List available templates from the manifest and the home folder's contents."""
+        dirs = _template_dirs(self._root) | self._listed
+        return sorted(
+            (d[4:] for d in dirs if d.startswith('tpl-') and not _ignored(d)), key=_natural_key
+        )
+
+    @property
+    def loaded(self) -> list[str]:
+        """Templates whose shard has been built."""
+        return sorted(self._shards)
+
+    def shard(self, template: str) -> TemplateFlowIndex:
+        """Return the index of one template, building it if necessary."""
+        with self._lock:
+            if template not in self._shards:
+                subdir = f'tpl-{template}'
+                if subdir in self._listed:
+                    shard = TemplateFlowIndex.from_manifest(self._root, self._manifest, subdir)
+                elif (self._root / subdir).is_dir():
+                    shard = TemplateFlowIndex.from_root(self._root, subdir)
+                else:
+                    shard = TemplateFlowIndex(self._root, {})
+                self._shards[template] = shard
+            return self._shards[template]
+
+    def expected(self, path: os.PathLike[str] | str) -> tuple[int | None, str | None]:
+        """Return the size and checksum the manifest declares for ``path``, if any."""
+        relpath = Path(path).absolute().relative_to(self._root)
+        if not relpath.parts[0].startswith('tpl-'):
+            return None, None
+        return self.shard(relpath.parts[0][4:]).expected(path)
+
+    def get_entities(self) -> list[str]:
+        """Return the names of the entities that can be queried."""
+        return list(self._names)
+
+    def supports(self, filters: Iterable[str]) -> bool:
+        """Check whether all ``filters`` are file-name entities."""
+        return all(f in self._names for f in filters)
+
+    def _get_templates(self, **filters) -> list[str]:
+        """List templates, only building shards when filtering by other entities."""
+        if not filters:
+            return self.templates()
+        return self.get(return_type='id', target='template', **filters)
+
+    def get(self, return_type: str = 'file', target: str | None = None, **filters):
+        """Query the shards of the templates selected by ``filters``."""
+        _check_entities(filters, self._names)
+
+        results = set()
+        for tpl in self._selected(filters):
+            results.update(self.shard(tpl).get(return_type=return_type, target=target, **filters))
+        return sorted(results, key=_natural_key)
+
+    def get_many(self, queries: Iterable[Mapping]) -> list[list[str]]:
+        """Resolve several queries, shard by shard (see :meth:`TemplateFlowIndex.get_many`)."""
+        queries = list(queries)
+        by_shard: dict[str, list[int]] = {}
+        for i, filters in enumerate(queries):
+            _check_entities(filters, self._names)
+            for tpl in self._selected(filters):
+                by_shard.setdefault(tpl, []).append(i)
+
+        results = [set() for _ in queries]
+        for tpl, indices in by_shard.items():
+            found = self.shard(tpl).get_many(queries[i] for i in indices)
+            for i, files in zip(indices, found, strict=True):
+                results[i].update(files)
+        return [sorted(files, key=_natural_key) for files in results]
+
+    def _selected(self, filters: Mapping) -> list[str]:
+        """List the templates whose shards may hold files matching ``filters``."""
+        template = filters.get('template', Query.OPTIONAL)
+        values = list(template) if isinstance(template, (list, tuple, set)) else [template]
+        if any(v is None or isinstance(v, Enum) for v in values) or not values:
+            # Only files within template folders are indexed, so all shards are needed
+            return self.templates()
+        return [str(v) for v in values]
+
+
+def _listed(files: Iterable[str]) -> set[str]:
+    """List the top-level folders of the files in a manifest."""
+    return {path.split('/', 1)[0] for path in files if '/' in path}
+
+
+def _check_entities(filters: Iterable[str], entities: Iterable[str]) -> None:
+    unknown = sorted(set(filters) - set(entities))
+    if unknown:
+        raise ValueError(f"'{unknown[0]}' is not a recognized entity.")
+
+
+def _query(value) -> Query | None:
+    """Map :class:`bids.layout.Query` and ``None`` onto :class:`Query`."""
+    if value is None:
+        return Query.NONE
+    if isinstance(value, Enum):
+        return Query[value.name]
+    return None
+
+
+def _singular(name: str, entities: Iterable[str]) -> str | None:
+    """Resolve plural entity names (e.g., ``atlases`` → ``atlas``)."""
+    for candidate in (name, name[:-1], name[:-2], f'{name[:-3]}y'):
+        if candidate in entities:
+            return candidate
+    return None
@@ -0,0 +1,193 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright 2025 The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""Progress of batches of downloads, reported to pluggable callbacks."""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+
+
+@dataclass(frozen=True)
+class DownloadProgress:
+    """
+    A snapshot of the progress of a batch of downloads.
+
+    >>> progress = DownloadProgress(1, 4, 2**20, 4 * 2**20, 2.0)
+    >>> progress.rate
+    524288.0
+    >>> progress.eta
+    6.0
+    >>> progress.finished
+    False
+
+    """
+
+    files_done: int
+    files_total: int
+    bytes_done: int
+    bytes_total: int | None
+    elapsed: float
+
+    @property
+    def rate(self) -> float:
+        """Bytes downloaded per second."""
+        return self.bytes_done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float | None:
+        """Seconds left, if the total size is known."""
+        if self.bytes_total is None or not self.rate:
+            return None
+        return max(self.bytes_total - self.bytes_done, 0) / self.rate
+
+    @property
+    def finished(self) -> bool:
+        """Whether all files have been processed."""
+        return self.files_done >= self.files_total
+
+
+ProgressCallback = Callable[[DownloadProgress], None]
+
+
+class ProgressTracker:
+    """
+    Aggregate the progress of several (possibly concurrent) downloads.
+
+    ``callback`` receives a :class:`DownloadProgress` when tracking starts, then at
+    most every ``interval`` seconds, and once more when all files are done.
+    Callbacks are called one at a time, in order, and should return quickly.
+
+    Parameters
+    ----------
+    sizes : :obj:`~collections.abc.Mapping`
+        The files to download, mapped to their size in bytes (``None`` if unknown,
+        in which case it is learned from the server's response).
+    callback : callable
+        The function progress is reported to.
+    interval : :obj:`float`
+        Minimum number of seconds between reports.
+
+    >>> reports = []
+    >>> tracker = ProgressTracker({Path('a'): 10, Path('b'): None}, reports.append, interval=60)
+    >>> tracker.expect(Path('b'), 5)
+    >>> tracker.update(10, Path('a'))
+    >>> tracker.file_done()
+    >>> tracker.update(3, Path('b'))
+    >>> tracker.restart(Path('b'))
+    >>> tracker.update(5, Path('b'))
+    >>> tracker.file_done()
+    >>> [(r.files_done, r.bytes_done, r.bytes_total) for r in reports]
+    [(0, 0, None), (2, 15, 15)]
+
+    """
+
+    def __init__(
+        self,
+        sizes: Mapping[Path, int | None],
+        callback: ProgressCallback,
+        interval: float = 0.1,
+    ):
+        self.callback = callback
+        self.interval = interval
+        self._sizes = dict(sizes)
+        self._files_done = 0
+        self._bytes_done = 0
+        self._file_bytes: dict[Path, int] = {}
+        self._lock = Lock()
+        self._start = self._reported = monotonic()
+        self.callback(self._snapshot(self._start))
+
+    def __repr__(self) -> str:
+        return f'<ProgressTracker {self._files_done}/{len(self._sizes)} files>'
+
+    def expect(self, filepath: Path, size: int | None) -> None:
+        """Set the size of ``filepath``, unless known already."""
+        if size is None:
+            return
+        with self._lock:
+            if self._sizes.get(filepath) is None:
+                self._sizes[filepath] = size
+
+    def update(self, nbytes: int, filepath: Path | None = None) -> None:
+        """Account for ``nbytes`` more bytes downloaded (of ``filepath``, if given)."""
+        with self._lock:
+            self._bytes_done += nbytes
+            if filepath is not None:
+                self._file_bytes[filepath] = self._file_bytes.get(filepath, 0) + nbytes
+            now = monotonic()
+            if now - self._reported < self.interval:
+                return
+            self._reported = now
+            self.callback(self._snapshot(now))
+
+    def restart(self, filepath: Path) -> None:
+        """Take back the bytes of ``filepath`` received so far, as it is downloaded again."""
+        with self._lock:
+            self._bytes_done -= self._file_bytes.pop(filepath, 0)
+
+    def file_done(self) -> None:
+        """Account for one more file downloaded (or failed)."""
+        with self._lock:
+            self._files_done += 1
+            now = monotonic()
+            if self._files_done < len(self._sizes) and now - self._reported < self.interval:
+                return
+            self._reported = now
+            self.callback(self._snapshot(now))
+
+    def _snapshot(self, now: float) -> DownloadProgress:
+        sizes = self._sizes.values()
+        return DownloadProgress(
+            files_done=self._files_done,
+            files_total=len(self._sizes),
+            bytes_done=self._bytes_done,
+            bytes_total=None if None in sizes else sum(sizes),
+            elapsed=now - self._start,
+        )
+
+
+class TqdmReporter:
+    """Report progress with one :mod:`tqdm` bar per batch of downloads (the default)."""
+
+    def __init__(self, **tqdm_kwargs):
+        self.tqdm_kwargs = tqdm_kwargs
+        self._bar = None
+
+    def __call__(self, progress: DownloadProgress) -> None:
+        if self._bar is None:
+            from tqdm import tqdm
+
+            self._bar = tqdm(
+                **{'unit': 'B', 'unit_scale': True, 'desc': 'Downloading', **self.tqdm_kwargs}
+            )
+
+        self._bar.total = progress.bytes_total
+        self._bar.n = progress.bytes_done
+        self._bar.set_postfix_str(f'{progress.files_done}/{progress.files_total} files')
+        if progress.finished:
+            self._bar.close()
+            self._bar = None
@@ -0,0 +1,154 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright 2024 The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""Fixtures shared across tests."""
+
+from functools import partial
+from hashlib import md5
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+from threading import Thread
+from time import sleep
+from types import SimpleNamespace
+
+import pytest
+
+
+class _S3Handler(SimpleHTTPRequestHandler):
+    """Serve static files, honoring ``Range``, ``If-Range`` and ``If-None-Match`` as S3 does."""
+
+    state: SimpleNamespace
+
+    def log_message(self, *args):
+        pass
+
+    def send_head(self):
+        self.state.requests.append((self.path, self.headers.get('Range')))
+        sleep(self.state.delay)
+        if self.state.status is not None:
+            self.send_error(self.state.status)
+            return None
+
+        path = Path(self.translate_path(self.path))
+        if not path.is_file():
+            self.send_error(404)
+            return None
+
+        data = path.read_bytes()
+        etag = f'"{md5(data, usedforsecurity=False).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+
+        start, end = 0, len(data) - 1
+        byte_range = self.headers.get('Range')
+        if self.headers.get('If-Range', etag) != etag:
+            byte_range = None  # Changed since, the whole file is sent
+        if byte_range is not None:
+            first, _, last = byte_range.removeprefix('bytes=').partition('-')
+            start, end = int(first), min(int(last or end), end)
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        else:
+            self.send_response(200)
+
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(end + 1 - start))
+        self.end_headers()
+        # Drop the connection after ``limit`` bytes to simulate interrupted transfers
+        return BytesIO(data[start : end + 1][: self.state.limit])
+
+
+def _publish(root: Path, files: dict, home: Path | None = None) -> None:
+    """Write ``files`` (paths, relative to ``home`` if given, onto contents) under ``root``."""
+    for path, data in files.items():
+        served = root / (Path(path).relative_to(home) if home is not None else path)
+        served.parent.mkdir(parents=True, exist_ok=True)
+        served.write_bytes(data)
+
+
+def _serve(root: Path):
+    """Start serving ``root``, returning the server and its state."""
+    state = SimpleNamespace(root=root, url=None, requests=[], limit=None, delay=0, status=None)
+    state.serve = partial(_publish, root)
+    state.root.mkdir()
+    handler = type('S3Handler', (_S3Handler,), {'state': state})
+
+    def _handler(*args, **kwargs):
+        return handler(*args, directory=str(state.root), **kwargs)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _handler)
+    state.url = f'http://127.0.0.1:{server.server_address[1]}'
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+@pytest.fixture
+def s3_server(tmp_path):
+    """Serve a folder mimicking the S3 bucket over HTTP.
+
+    The fixture holds the served folder (``root``), the base ``url``, a log of
+    ``(path, range)`` ``requests``, a ``limit`` on the bytes sent per response,
+    a ``delay`` in seconds before responding, and an error ``status`` to respond
+    with instead of the files.
+    Files are published with ``serve(files, home)``, mapping their paths within the
+    TemplateFlow ``home`` onto their contents.
+    """
+    server, state = _serve(tmp_path / 's3')
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def s3_mirror(tmp_path):
+    """Serve a second folder, like :func:`s3_server`, to act as a mirror."""
+    server, state = _serve(tmp_path / 's3-mirror')
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def s3_client(tmp_path, s3_server):
+    """Create S3-backed clients of the native engine, downloading from :func:`s3_server`.
+
+    The fixture is a factory taking the name of the home folder (within ``tmp_path``),
+    the client class (``cls``), and any settings overriding the defaults.
+    """
+    from templateflow.client import TemplateFlowClient
+
+    def _client(home='home', cls=TemplateFlowClient, **kwargs):
+        settings = {'use_datalad': False, 'query_engine': 'native', 's3_root': s3_server.url}
+        return cls(root=tmp_path / home, **{**settings, **kwargs})
+
+    return _client
@@ -218,3 +218,47 @@ def test_pybids_magic_get():
     # (that means, raise an AttributeError instead of a BIDSEntityError)
     with pytest.raises(AttributeError):
         _ = api.get_fieldmap
+
+
+def test_query_cache(monkeypatch):
+    """Check query results are memoized and invalidated on updates."""
+    from templateflow.client import TemplateFlowClient
+    from templateflow.conf import _cache
+
+    client = TemplateFlowClient(cache=_cache)
+    query = {'resolution': 1, 'desc': 'brain', 'suffix': 'mask'}
+    expected = client.ls('MNI152NLin2009cAsym', **query)
+    assert client.query_cache_info()[:2] == (0, 1)
+
+    calls = []
+    engine_get = _cache.engine.get
+
+    def _get(*args, **kwargs):
+        calls.append(kwargs)
+        return engine_get(*args, **kwargs)
+
+    monkeypatch.setattr(_cache.engine, 'get', _get)
+
+    # Equivalent queries are answered from memory, and the results are copies
+    result = client.ls('MNI152NLin2009cAsym', suffix=['mask'], desc='brain', resolution=1)
+    assert result == expected
+    result.clear()
+    assert client.ls('MNI152NLin2009cAsym', **query) == expected
+    assert not calls
+    assert client.query_cache_info() == (2, 1, _cache.config.query_cache_size, 1)
+
+    # Updating the cache invalidates results
+    monkeypatch.setattr(_cache, 'generation', _cache.generation + 1)
+    assert client.ls('MNI152NLin2009cAsym', **query) == expected
+    assert len(calls) == 1
+    assert client.query_cache_info()[1:] == (2, _cache.config.query_cache_size, 1)
+
+    # The number of memoized results is bounded
+    monkeypatch.setattr(_cache.config, 'query_cache_size', 2)
+    for res in (1, 2, 1):
+        client.ls('MNI152Lin', resolution=res, suffix='T1w')
+    assert client.query_cache_info().currsize == 2
+    assert len(calls) == 3
+
+    client.query_cache_clear()
+    assert client.query_cache_info() == (0, 0, 2, 0)
@@ -0,0 +1,154 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright 2024 The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""Check the asynchronous client."""
+
+import asyncio
+import threading
+
+import pytest
+
+from templateflow import client as tfc_client
+from templateflow import conf as tfc
+from templateflow.client import AsyncTemplateFlowClient
+from templateflow.conf.cache import RetryPolicy
+
+
+@pytest.mark.parametrize('httpx', [True, False])
+def test_async_get(monkeypatch, s3_server, s3_client, httpx):
+    """Check concurrent coroutines share the event loop and the download limit."""
+    if httpx:
+        pytest.importorskip('httpx')
+    monkeypatch.setattr('templateflow.client._have_httpx', lambda: httpx)
+
+    client = s3_client(cls=AsyncTemplateFlowClient, retry=RetryPolicy(retries=1, backoff=0.01))
+    query = {'resolution': 1, 'suffix': ['T1w', 'T2w', 'PD'], 'desc': None}
+    paths = client._client.ls('MNI152Lin', **query)
+    s3_server.serve({p: p.name.encode() for p in paths}, client.cache.config.root)
+
+    # File system work runs off the event loop
+    blocking = []
+
+    def recorded(name):
+        func = getattr(tfc_client, name)
+
+        def record(*args):
+            blocking.append((name, threading.current_thread() is threading.main_thread()))
+            return func(*args)
+
+        return record
+
+    for name in ('_pending_downloads', '_write_part'):
+        monkeypatch.setattr(tfc_client, name, recorded(name))
+
+    async def main():
+        async with client:
+            return await asyncio.gather(
+                client.get('MNI152Lin', **query),
+                client.get('MNI152Lin', resolution=1, suffix='T1w', desc=None),
+                client.templates(suffix='PD'),
+                client.ls_many([{'template': 'MNI152Lin', 'suffix': 'madeup'}]),
+            )
+
+    got, t1w, templates, listed = asyncio.run(main())
+    assert got == paths
+    assert t1w in paths
+    assert all(p.read_bytes() == p.name.encode() for p in paths)
+    assert 'MNI152Lin' in templates
+    assert listed == [[]]
+    assert {name for name, _ in blocking} == (
+        {'_pending_downloads', '_write_part'} if httpx else {'_pending_downloads'}
+    )
+    assert not any(on_loop for _, on_loop in blocking)
+
+    # Failures are reported together
+    missing = client._client.ls('MNI152Lin', resolution=2, suffix=['T1w', 'T2w'], desc=None)
+
+    async def fail():
+        async with client:
+            return await client.get_many([{'template': 'MNI152Lin', 'resolution': 2}])
+
+    with pytest.raises(RuntimeError, match='Could not fetch') as excinfo:
+        asyncio.run(fail())
+    assert all(str(p) in str(excinfo.value) for p in missing)
+    assert 'code 404' in str(excinfo.value)
+
+    # Interrupted downloads are resumed (once by the retry policy, then by the next call)
+    path = t1w
+    path.write_bytes(b'')
+    s3_server.limit = 5
+    with pytest.raises(RuntimeError, match='Could not fetch'):
+        asyncio.run(client.get('MNI152Lin', resolution=1, suffix='T1w', desc=None))
+    assert path.read_bytes() == b''
+
+    s3_server.limit = None
+    assert asyncio.run(client.get('MNI152Lin', resolution=1, suffix='T1w', desc=None)) == path
+    assert path.read_bytes() == path.name.encode()
+    if httpx:  # Requests drops the incomplete chunk
+        assert [r for _, r in s3_server.requests[-3:]] == [None, 'bytes=5-', 'bytes=10-']
+
+    # Clients left over from previous event loops are closed
+    if httpx:
+        stale = client._http
+        path.write_bytes(b'')
+        assert asyncio.run(client.get('MNI152Lin', resolution=1, suffix='T1w', desc=None)) == path
+        assert stale.is_closed
+        asyncio.run(client.aclose())
+
+
+def test_async_client():
+    """Check the client mirrors the synchronous one."""
+    client = AsyncTemplateFlowClient(cache=tfc._cache)
+    assert client.cache is tfc._cache
+    assert repr(client).startswith('<AsyncTemplateFlowClient[')
+
+    metadata = asyncio.run(client.get_metadata('MNI152Lin'))
+    assert metadata['Name'].startswith('Linear ICBM Average Brain')
+
+    with pytest.raises(Exception, match='No results found'):
+        asyncio.run(client.get('MNI152Lin', suffix='madeup', raise_empty=True))
+
+
+def test_async_mirrors(s3_server, s3_mirror, s3_client):
+    """Check asynchronous downloads fail over to mirrors and hedge slow requests."""
+    pytest.importorskip('httpx')
+
+    client = s3_client(
+        cls=AsyncTemplateFlowClient,
+        s3_root=[s3_server.url, s3_mirror.url],
+        retry=RetryPolicy(retries=0),
+        hedge_after=0.1,
+    )
+    query = {'resolution': 1, 'desc': None}
+    t1w, t2w = (client._client.ls('MNI152Lin', suffix=s, **query)[0] for s in ('T1w', 'T2w'))
+    s3_mirror.serve({t1w: b'mirrored', t2w: b'hedged'}, client.cache.config.root)
+    client.cache.mirrors.record(s3_server.url, 0.01)
+    client.cache.mirrors.record(s3_mirror.url, 0.02)
+
+    # Files missing from the primary are fetched from the mirror
+    assert asyncio.run(client.get('MNI152Lin', suffix='T1w', **query)) == t1w
+    assert t1w.read_bytes() == b'mirrored'
+    assert s3_server.requests[-1][0].endswith(t1w.name)
+
+    s3_server.delay = 2
+    assert asyncio.run(client.get('MNI152Lin', suffix='T2w', **query)) == t2w
+    assert t2w.read_bytes() == b'hedged'
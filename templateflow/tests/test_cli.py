@@ -1,9 +1,11 @@
+import sys
 from pathlib import Path
 
 import click.testing
 import pytest
 
 from .. import cli
+from .. import client as tfclient
 
 
 @pytest.fixture
@@ -67,3 +69,136 @@ def test_get_multi(runner):
 
     stats = [path.stat() for path in paths]
     assert [stat_res.st_size for stat_res in stats] == [10669511, 10096230]
+
+
+@pytest.mark.parametrize('fmt', ['json', 'yaml', 'tsv'])
+def test_prefetch(runner, tmp_path, monkeypatch, s3_server, fmt):
+    from templateflow.client import TemplateFlowClient
+
+    if fmt == 'yaml':
+        pytest.importorskip('yaml')
+
+    client = TemplateFlowClient(
+        root=tmp_path / 'home', use_datalad=False, query_engine='native', s3_root=s3_server.url
+    )
+    monkeypatch.setattr(cli, 'CLIENT', client)
+    paths = client.ls('MNI152Lin', resolution=1, suffix=['T1w', 'T2w'], desc=None)
+    for path in paths:
+        served = s3_server.root / path.relative_to(client.cache.config.root)
+        served.parent.mkdir(parents=True, exist_ok=True)
+        served.write_bytes(b'template')
+
+    manifest = tmp_path / f'queries.{fmt}'
+    manifest.write_text(
+        {
+            'json': """[
+                {"template": "MNI152Lin", "resolution": 1, "suffix": "T1w", "desc": null},
+                {"template": "MNI152Lin", "resolution": 1, "suffix": ["T1w", "T2w"], "desc": null}
+            ]""",
+            'yaml': """
+                - {template: MNI152Lin, resolution: 1, suffix: T1w, desc: null}
+                - {template: MNI152Lin, resolution: 1, suffix: [T1w, T2w], desc: null}
+            """,
+            'tsv': 'template\tresolution\tsuffix\tdesc\n'
+            'MNI152Lin\t1\tT1w\tnull\n'
+            'MNI152Lin\t1\tT1w,T2w\tnull\n',
+        }[fmt]
+    )
+
+    result = runner.invoke(cli.main, ['prefetch', '--dry-run', str(manifest)])
+    assert result.exit_code == 0
+    assert result.stdout.split() == [str(p) for p in paths]
+
+    # Downloads use as many workers as requested, without reconfiguring the shared client
+    workers = []
+    map_files = tfclient._map_files
+
+    def _map_files(func, filepaths, max_workers):
+        workers.append(max_workers)
+        return map_files(func, filepaths, max_workers)
+
+    monkeypatch.setattr(tfclient, '_map_files', _map_files)
+    max_workers = client.cache.config.max_workers
+    result = runner.invoke(cli.main, ['prefetch', '-j', '2', str(manifest)])
+    assert result.exit_code == 0, result.output
+    assert '2 files matched by 2 queries, 0 already cached' in result.stdout
+    assert 'Downloaded 2 files' in result.stdout
+    assert workers == [2]
+    assert client.cache.config.max_workers == max_workers
+    assert all(p.read_bytes() == b'template' for p in paths)
+    assert len(s3_server.requests) == 2
+
+    result = runner.invoke(cli.main, ['prefetch', str(manifest)])
+    assert '2 already cached. Downloaded 0 files' in result.stdout
+    assert len(s3_server.requests) == 2
+
+    manifest.write_text('{"template": "MNI152Lin"}' if fmt != 'tsv' else 'suffix\nT1w\n')
+    result = runner.invoke(cli.main, ['prefetch', str(manifest)])
+    assert result.exit_code == 2
+
+
+def test_prefetch_without_yaml(runner, tmp_path, monkeypatch):
+    """YAML manifests point to the extra installing PyYAML when it is missing."""
+    monkeypatch.setitem(sys.modules, 'yaml', None)
+    manifest = tmp_path / 'manifest.yml'
+    manifest.write_text('- template: MNI152Lin\n')
+    result = runner.invoke(cli.main, ['prefetch', str(manifest)])
+    assert result.exit_code == 2
+    assert 'templateflow[yaml]' in result.output
+
+
+def test_completion(tmp_path, monkeypatch):
+    from click.shell_completion import ShellComplete
+
+    from templateflow.conf import _s3
+
+    home = tmp_path / 'home'
+    _s3.update(home, local=True, overwrite=True, silent=True, timeout=10)
+    monkeypatch.setenv('TEMPLATEFLOW_HOME', str(home))
+    monkeypatch.setattr(cli, 'CLIENT', None)
+
+    def _complete(args, incomplete):
+        complete = ShellComplete(cli.main, {}, 'templateflow', '_TEMPLATEFLOW_COMPLETE')
+        return [item.value for item in complete.get_completions(args, incomplete)]
+
+    assert 'MNI152Lin' in _complete(['ls'], 'MNI152')
+    assert all(t.startswith('MNI152') for t in _complete(['ls'], 'MNI152'))
+    assert _complete(['ls', 'MNI152Lin', '--res'], '') == ['1', '2']
+    assert _complete(['get', '-d', 'brain', 'MNI152Lin', '-s'], 'T') == ['T1w', 'T2w']
+    assert 'mask' in _complete(['ls', '-s'], 'm')
+
+    # Completing did not set the client up
+    assert cli.CLIENT is None
+
+
+def test_completion_empty_home(tmp_path, monkeypatch, runner):
+    """Completing in an empty home does not prevent installing it."""
+    from click.shell_completion import ShellComplete
+
+    from templateflow.client import TemplateFlowClient
+    from templateflow.conf.index import COMPLETIONS
+
+    home = tmp_path / 'home'
+    home.mkdir()
+    monkeypatch.setenv('TEMPLATEFLOW_HOME', str(home))
+    monkeypatch.setattr(cli, 'CLIENT', None)
+
+    complete = ShellComplete(cli.main, {}, 'templateflow', '_TEMPLATEFLOW_COMPLETE')
+    assert complete.get_completions(['ls'], 'MNI') == []
+    assert not (home / COMPLETIONS).exists()
+
+    # A home holding only state is not considered installed
+    (home / COMPLETIONS).parent.mkdir()
+    monkeypatch.setattr(cli, 'CLIENT', TemplateFlowClient(root=home, query_engine='native'))
+    assert not cli.CLIENT.cache.precached
+    cli.CLIENT.cache.ensure()
+
+    result = runner.invoke(cli.main, ['ls', 'MNI152Lin', '--res', '1', '-s', 'T1w'])
+    assert result.exit_code == 0, result.output
+    assert 'tpl-MNI152Lin_res-01_T1w.nii.gz' in result.stdout
+
+
+def test_unknown_template(runner):
+    result = runner.invoke(cli.main, ['ls', 'Madeup'])
+    assert result.exit_code == 2
+    assert "'Madeup' is not one of" in result.output
@@ -60,6 +60,41 @@ def test_conf_init(monkeypatch, tmp_path, use_datalad):
     assert str(tfc.TF_HOME) == str(home)
 
 
+def test_config_positional(tmp_path):
+    """Check settings added over time do not shift positional arguments."""
+    from templateflow.conf.cache import CacheConfig
+
+    config = CacheConfig(tmp_path, 'origin', 'https://s3.example.org', False, False, 5)
+    assert (config.s3_root, config.use_datalad, config.autoupdate, config.timeout) == (
+        'https://s3.example.org',
+        False,
+        False,
+        5,
+    )
+
+
+def test_config_warnings(monkeypatch, tmp_path):
+    """Check configuration warnings point at the code setting TemplateFlow up."""
+    from templateflow.client import TemplateFlowClient
+    from templateflow.conf.cache import CacheConfig
+
+    with pytest.warns(UserWarning, match='Unknown query engine') as record:
+        CacheConfig(tmp_path, query_engine='madeup')
+    assert record[0].filename == __file__
+
+    with pytest.warns(UserWarning, match='Unknown query engine') as record:
+        TemplateFlowClient(tmp_path, query_engine='madeup')
+    assert record[0].filename == __file__
+
+    # Also when the global cache is set up on first use
+    monkeypatch.setenv('TEMPLATEFLOW_HOME', str(tmp_path / 'home'))
+    monkeypatch.setenv('TEMPLATEFLOW_QUERY_ENGINE', 'madeup')
+    reload(tfc)
+    with pytest.warns(UserWarning, match='Unknown query engine') as record:
+        tfc.update(local=True)
+    assert {w.filename for w in record} == {__file__}
+
+
 @pytest.mark.parametrize('use_datalad', ['on', 'off'])
 def test_setup_home(monkeypatch, tmp_path, capsys, use_datalad):
     """Check the correct functioning of the installation hook."""
@@ -163,3 +198,117 @@ def test_layout_errors(monkeypatch):
         m.setattr(builtins, '__import__', mock_import)
         with pytest.raises(ImportError):
             myfunc()
+
+
+def test_layout_cache(monkeypatch, tmp_path):
+    """Check the layout index is persisted, reused and invalidated."""
+    from bids.layout import index
+
+    from templateflow.conf._s3 import SKELETON_STATE
+    from templateflow.conf.cache import CacheConfig, TemplateFlowCache
+
+    home = tmp_path / 'layout-cache'
+    cache = TemplateFlowCache(CacheConfig(root=home, use_datalad=False))
+    assert cache.layout_db.parent == home / '.templateflow'
+    templates = cache.layout.get_templates()
+    assert (cache.layout_db / 'layout_index.sqlite').is_file()
+
+    # A new cache must load the index without walking the tree again
+    def _noindex(*args, **kwargs):
+        raise AssertionError('The layout should not be indexed again')
+
+    with monkeypatch.context() as m:
+        m.setattr(index.BIDSLayoutIndexer, '__call__', _noindex)
+        other = TemplateFlowCache(CacheConfig(root=home, use_datalad=False))
+        assert sorted(other.layout.get_templates()) == sorted(templates)
+
+    # Templates added by hand are indexed, and replace the outdated index
+    layout_db = other.layout_db
+    (home / 'tpl-Custom').mkdir()
+    (home / 'tpl-Custom' / 'tpl-Custom_T1w.nii.gz').write_bytes(b'')
+    custom = TemplateFlowCache(CacheConfig(root=home, use_datalad=False))
+    assert 'Custom' in custom.layout.get_templates()
+    assert custom.layout_db != layout_db
+    assert not layout_db.exists()
+
+    # Updating the tree discards persisted indexes
+    assert other.update(local=True, overwrite=True, silent=True)
+    assert 'layout' not in other.__dict__
+    assert not cache.layout_db.exists()
+
+    # Indexes are keyed on the skeleton applied, rather than the one distributed
+    state = home / SKELETON_STATE
+    layout_db = other.layout_db
+    state.write_text(state.read_text().replace('"version"', '"stale": true, "version"'))
+    assert other.layout_db != layout_db
+
+    nocache = TemplateFlowCache(CacheConfig(root=home, use_datalad=False, layout_cache=False))
+    assert nocache.layout_db is None
+
+
+def test_retry_policy(monkeypatch):
+    """Check only transient failures are retried, within the policy's budget."""
+    import asyncio
+    from types import SimpleNamespace
+
+    import requests
+
+    from templateflow.conf._http import DownloadError
+    from templateflow.conf.cache import CacheConfig, RetryPolicy
+
+    monkeypatch.setenv('TEMPLATEFLOW_RETRIES', '5')
+    monkeypatch.setenv('TEMPLATEFLOW_RETRY_DEADLINE', '0')
+    assert CacheConfig().retry == RetryPolicy(retries=5, deadline=None)
+
+    policy = RetryPolicy(retries=3, backoff=0)
+    calls = []
+
+    def _fail(*errors):
+        def _call(value):
+            calls.append(value)
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+            return value
+
+        return _call
+
+    assert policy.call(_fail(DownloadError('503', 503), requests.ConnectionError()), 1) == 1
+    assert len(calls) == 3
+
+    for error in (DownloadError('404', 404), ValueError('not transient')):
+        calls.clear()
+        with pytest.raises(type(error)):
+            policy.call(_fail(error), 1)
+        assert len(calls) == 1
+
+    # Retries are bounded by the number of attempts and the deadline
+    calls.clear()
+    with pytest.raises(DownloadError):
+        policy.call(_fail(*[DownloadError('truncated')] * 4), 1)
+    assert len(calls) == 4
+
+    calls.clear()
+    with monkeypatch.context() as m:
+        m.setattr('random.uniform', lambda a, b: b)  # Longest delays, deterministically
+        with pytest.raises(DownloadError):
+            RetryPolicy(backoff=10, deadline=1).call(_fail(DownloadError('503', 503)), 1)
+    assert len(calls) == 1
+
+    calls.clear()
+
+    async def _afail(value):
+        return _fail(requests.Timeout())(value)
+
+    assert asyncio.run(policy.acall(_afail, 2)) == 2
+    assert len(calls) == 2
+
+    # Transient responses are retried, and the last one returned if all attempts fail
+    statuses = [503, 429, 200]
+
+    def _get(url, **kwargs):
+        return SimpleNamespace(status_code=statuses.pop(0))
+
+    assert policy.request(_get, 'https://example.com').status_code == 200
+    statuses = [503] * 5
+    assert policy.request(_get, 'https://example.com').status_code == 503
+    assert len(statuses) == 1
@@ -0,0 +1,103 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright 2025 The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""Test that importing templateflow is fast and free of side effects."""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Generous, to absorb slow CI runners; a regression (e.g., importing pybids) takes several times
+IMPORT_BUDGET = 0.5
+
+_SCRIPT = """\
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed, 'modules': sorted(sys.modules)}}))
+"""
+
+
+def _import(module, env):
+    """Import ``module`` in a fresh interpreter, returning the time and modules loaded."""
+    result = subprocess.run(
+        [sys.executable, '-c', _SCRIPT.format(module=module)],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout)
+
+
+@pytest.mark.parametrize(
+    'module', ['templateflow', 'templateflow.api', 'templateflow.conf', 'templateflow.cli']
+)
+def test_import(tmp_path, monkeypatch, module):
+    """Importing does not touch the TemplateFlow home or load heavy dependencies."""
+    home = tmp_path / 'tf_home'
+    monkeypatch.setenv('TEMPLATEFLOW_HOME', str(home))
+
+    # Take the best of a few runs, so that a busy machine does not fail the test
+    runs = [_import(module, dict(os.environ)) for _ in range(3)]
+
+    assert not home.exists()
+    assert not {'bids', 'requests', 'tqdm', 'httpx', 'asyncio'} & set(runs[0]['modules'])
+    assert 'templateflow.client' not in runs[0]['modules']
+    assert min(run['elapsed'] for run in runs) < IMPORT_BUDGET
+
+
+def test_submodules():
+    """Submodules are reachable as attributes of the package, as when imported eagerly."""
+    import templateflow
+
+    for name in ('api', 'client', 'conf'):
+        assert getattr(templateflow, name).__name__ == f'templateflow.{name}'
+    with pytest.raises(AttributeError):
+        _ = templateflow.madeup
+
+
+def test_first_use(tmp_path, monkeypatch):
+    """The TemplateFlow home is set up when first needed."""
+    from importlib import reload
+
+    import templateflow.api
+    import templateflow.conf
+
+    home = tmp_path / 'tf_home'
+    monkeypatch.setenv('TEMPLATEFLOW_HOME', str(home))
+    reload(templateflow.conf)
+    reload(templateflow.api)
+    assert not home.exists()
+
+    with pytest.warns(ResourceWarning, match='repository not found'):
+        assert templateflow.conf.TF_HOME == home
+    assert (home / 'tpl-MNI152Lin').is_dir()
+    assert templateflow.api._client.cache is templateflow.conf._cache
+
+    monkeypatch.undo()
+    reload(templateflow.conf)
+    reload(templateflow.api)
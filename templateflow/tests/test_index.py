@@ -0,0 +1,311 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+#
+# Copyright 2025 The NiPreps Developers <nipreps@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# We support and encourage derived works from this project, please read
+# about our expectations at
+#
+#     https://www.nipreps.org/community/licensing/
+#
+"""Check the native query engine against PyBIDS."""
+
+import pytest
+from bids.layout import Query
+
+from templateflow.client import TemplateFlowClient
+from templateflow.conf import _cache
+from templateflow.conf.index import TemplateFlowIndex
+
+QUERIES = [
+    {'template': 'MNI152Lin', 'resolution': 1, 'suffix': 'T1w', 'desc': None},
+    {'template': 'MNI152Lin', 'resolution': '02', 'suffix': 'T1w', 'desc': None},
+    {'template': 'fsLR', 'space': None, 'hemi': 'L', 'density': '32k', 'suffix': 'sphere'},
+    {'template': 'fsLR', 'space': 'madeup'},
+    {
+        'template': ['MNI152Lin', 'MNI152NLin2009cAsym'],
+        'suffix': ['T1w', 'mask'],
+        'desc': [None, 'brain'],
+    },
+    {'template': Query.ANY, 'suffix': 'PD'},
+    {'template': 'MNI152NLin2009cAsym', 'atlas': Query.ANY},
+    {'template': 'MNI152NLin2009cAsym', 'atlas': Query.NONE, 'resolution': [1, 2]},
+    {'template': 'MNI152NLin2009cAsym', 'atlas': Query.OPTIONAL},
+    {'template': 'MNI152NLin2009cAsym', 'extension': ['.nii.gz'], 'desc': []},
+    {'scale': 2},
+    {'resolution': 'foo'},
+    {},
+]
+
+
+@pytest.fixture(scope='module')
+def index():
+    return TemplateFlowIndex.from_root(_cache.config.root)
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_files(index, query):
+    """Check file queries match those of PyBIDS."""
+    assert index.get(return_type='file', **query) == _cache.layout.get(return_type='file', **query)
+
+
+@pytest.mark.parametrize('filters', [{}, {'template': 'MNI152NLin6Asym'}, {'suffix': 'dseg'}])
+def test_entities(index, filters):
+    """Check entity accessors match those of PyBIDS."""
+    for entity in index.get_entities():
+        assert index.get(return_type='id', target=entity, **filters) == _cache.layout.get(
+            return_type='id', target=entity, **filters
+        )
+
+    assert index.get_atlases(**filters) == _cache.layout.get_atlases(**filters)
+    assert index.get_densities(**filters) == _cache.layout.get_densities(**filters)
+
+
+def test_many(index, monkeypatch):
+    """Check several queries are resolved together, looking each filter up once."""
+    from templateflow.conf import index as tfindex
+
+    filtered = []
+    _filter = TemplateFlowIndex._filter
+    with monkeypatch.context() as m:
+        m.setattr(
+            TemplateFlowIndex,
+            '_filter',
+            lambda self, fids, name, value: (
+                filtered.append(name) or _filter(self, fids, name, value)
+            ),
+        )
+        results = index.get_many(QUERIES)
+    assert results == [index.get(**query) for query in QUERIES]
+    # Once per distinct template filter, rather than once per query naming a template
+    assert filtered.count('template') == 5
+
+    sharded = tfindex.ShardedIndex(index.root)
+    assert sharded.get_many(QUERIES) == results
+
+    with pytest.raises(ValueError, match='not a recognized entity'):
+        index.get_many([{'template': 'MNI152Lin'}, {'subject': '01'}])
+
+
+def test_errors(index):
+    with pytest.raises(ValueError, match='not a recognized entity'):
+        index.get(subject='01')
+
+    with pytest.raises(TypeError):
+        index.get_atlases('MNI152NLin6ASym')
+
+    with pytest.raises(AttributeError):
+        _ = index.get_fieldmap
+
+
+def test_client(tmp_path):
+    """Exercise the client with the native engine."""
+    client = TemplateFlowClient(cache=_cache)
+    native = TemplateFlowClient(root=_cache.config.root, query_engine='native')
+
+    assert native.cache.config.query_engine == 'native'
+    assert native.cache.engine is native.cache.index
+    assert native.templates() == client.templates()
+    assert native.templates(suffix='PD') == client.templates(suffix='PD')
+    assert native.ls_atlases(template='MNI152NLin6Asym') == client.ls_atlases(
+        template='MNI152NLin6Asym'
+    )
+    assert native.ls('MNI152Lin', suffix='T1w', extension='nii.gz') == client.ls(
+        'MNI152Lin', suffix='T1w', extension='nii.gz'
+    )
+    assert native.ls(None, suffix='T2w') == client.ls(None, suffix='T2w')
+    queries = [{'template': query.pop('template', None), **query} for query in map(dict, QUERIES)]
+    assert native.ls_many(queries) == client.ls_many(queries)
+    assert 'layout' not in native.cache.__dict__
+
+    # Metadata fields are delegated to PyBIDS
+    assert native.ls('MNI152Lin', Name=Query.ANY) == client.ls('MNI152Lin', Name=Query.ANY)
+
+    with pytest.raises(AttributeError):
+        _ = native.get_fieldmap
+
+
+def test_manifest(tmp_path, monkeypatch):
+    """Check the index is loaded from the skeleton's manifest."""
+    from concurrent.futures import ThreadPoolExecutor
+    from time import sleep
+    from zipfile import ZipFile
+
+    from templateflow.conf import _s3
+    from templateflow.conf import index as tfindex
+
+    home = tmp_path / 'manifest'
+    assert _s3.update(home, local=True, overwrite=True, silent=True, timeout=10)
+    assert (home / tfindex.MANIFEST).is_file()
+
+    walked = tfindex.TemplateFlowIndex.from_root(home)
+    with monkeypatch.context() as m:
+        m.setattr(tfindex, 'walk', None)  # Walking the tree would fail
+        loaded = tfindex.load_index(home)
+
+    assert len(loaded) == len(walked)
+    for query in QUERIES:
+        assert loaded.get(**query) == walked.get(**query)
+
+    # Unchanged manifests are not extracted again
+    mtime = (home / tfindex.MANIFEST).stat().st_mtime_ns
+    with monkeypatch.context() as m:
+        m.setattr(_s3, '_extract_replace', None)
+        assert _s3.update(home, local=True, overwrite=True, silent=True, timeout=10)
+    assert (home / tfindex.MANIFEST).stat().st_mtime_ns == mtime
+
+    description = home / 'tpl-MNI152Lin' / 'template_description.json'
+    size, checksum = loaded.expected(description)
+    assert size == description.stat().st_size
+    assert checksum.startswith('md5:')
+    assert walked.expected(description) == (None, None)
+
+    # PyBIDS clients read checksums from the manifest, without indexing the home
+    pybids = TemplateFlowClient(root=home, query_engine='pybids', layout_cache=False)
+    assert pybids.cache.expected(description) == (size, checksum)
+    assert 'index' not in pybids.cache.__dict__
+
+    # Threads racing to use the index first wait for it to be built once
+    native = TemplateFlowClient(root=home, query_engine='native', layout_cache=False)
+    built = []
+
+    def load_index(root):
+        built.append(root)
+        sleep(0.1)
+        return walked
+
+    with monkeypatch.context() as m, ThreadPoolExecutor(4) as pool:
+        m.setattr(tfindex, 'load_index', load_index)
+        assert set(pool.map(native.cache.expected, [description] * 4)) == {(None, None)}
+    assert len(built) == 1
+
+    # Manifests parsed with a different configuration are parsed again
+    manifest = tfindex.make_manifest(['tpl-MNI152Lin/tpl-MNI152Lin_res-01_T1w.nii.gz'])
+    manifest['config'] = 'outdated'
+    manifest['files']['tpl-MNI152Lin/tpl-MNI152Lin_res-01_T1w.nii.gz']['entities'] = {}
+    reparsed = tfindex.TemplateFlowIndex.from_manifest(home, manifest)
+    assert reparsed.get_resolutions(template='MNI152Lin') == [1]
+
+    # Skeletons without a manifest remove stale ones, and the tree is walked
+    skel = tmp_path / 'skel.zip'
+    with ZipFile(_s3.load_data('templateflow-skel.zip')) as src, ZipFile(skel, 'w') as zipref:
+        for info in src.infolist():
+            if info.filename != tfindex.MANIFEST:
+                zipref.writestr(info, src.read(info))
+    _s3._update_skeleton(skel, home, silent=True)
+    assert not (home / tfindex.MANIFEST).exists()
+    assert len(tfindex.load_index(home)) == len(walked)
+    pybids.cache.clear_layout()
+    assert pybids.cache.expected(description) == (None, None)
+    assert 'index' not in pybids.cache.__dict__
+
+
+def test_unlisted(tmp_path):
+    """Check template folders missing from the manifest are found, as PyBIDS does."""
+    from templateflow.conf import _s3
+    from templateflow.conf import index as tfindex
+
+    home = tmp_path / 'unlisted'
+    assert _s3.update(home, local=True, overwrite=True, silent=True, timeout=10)
+    assert (home / tfindex.MANIFEST).is_file()
+    custom = home / 'tpl-Custom'
+    (custom / 'cohort-1').mkdir(parents=True)
+    (custom / 'template_description.json').write_text('{}')
+    (custom / 'tpl-Custom_res-01_T1w.nii.gz').write_bytes(b'')
+    (custom / 'cohort-1' / 'tpl-Custom_cohort-1_res-01_T1w.nii.gz').write_bytes(b'')
+
+    pybids = TemplateFlowClient(root=home, query_engine='pybids', layout_cache=False)
+    for kwargs in ({'query_engine': 'native'}, {'lazy_index': True}):
+        native = TemplateFlowClient(root=home, layout_cache=False, **kwargs)
+        assert 'Custom' in native.templates()
+        assert native.templates() == pybids.templates()
+        for query in ({'suffix': 'T1w'}, {'cohort': 1}, {'resolution': 1, 'cohort': None}):
+            assert native.ls('Custom', **query) == pybids.ls('Custom', **query)
+        assert len(native.ls('Custom', suffix='T1w')) == 2
+
+
+def test_sharded(tmp_path, monkeypatch):
+    """Check templates are only indexed when queried."""
+    from templateflow.conf import _s3
+    from templateflow.conf import index as tfindex
+
+    home = tmp_path / 'sharded'
+    _s3.update(home, local=True, overwrite=True, silent=True, timeout=10)
+    full = tfindex.load_index(home)
+
+    for manifest in (True, False):
+        if not manifest:
+            (home / tfindex.MANIFEST).unlink()
+
+        sharded = tfindex.ShardedIndex(home)
+        assert sharded.get_templates() == full.get_templates()
+        assert sharded.loaded == []
+
+        query = {'resolution': 1, 'desc': 'brain', 'suffix': 'mask'}
+        assert sharded.get(template='MNI152NLin2009cAsym', **query) == full.get(
+            template='MNI152NLin2009cAsym', **query
+        )
+        assert sharded.get_atlases(template=['MNI152NLin6Asym', 'MNI152NLin2009cAsym']) == (
+            full.get_atlases(template=['MNI152NLin6Asym', 'MNI152NLin2009cAsym'])
+        )
+        assert sharded.loaded == ['MNI152NLin2009cAsym', 'MNI152NLin6Asym']
+        assert sharded.get(template='madeup') == []
+
+        # Queries not naming templates require all shards
+        assert sharded.get_templates(suffix='PD') == full.get_templates(suffix='PD')
+        assert sharded.get(**query) == full.get(**query)
+        assert len(sharded) == len(full)
+
+    with pytest.raises(ValueError, match='not a recognized entity'):
+        sharded.get(template='MNI152Lin', subject='01')
+
+    client = TemplateFlowClient(root=home, lazy_index=True)
+    assert client.cache.config.query_engine == 'native'
+    assert client.templates() == sorted(full.get_templates())
+    assert client.cache.index.loaded == []
+    assert client.ls('MNI152Lin', resolution=1, suffix='T1w') == [
+        home / 'tpl-MNI152Lin' / 'tpl-MNI152Lin_res-01_T1w.nii.gz'
+    ]
+    assert client.cache.index.loaded == ['MNI152Lin']
+
+
+def test_completions(tmp_path, monkeypatch):
+    """Check the summary used for shell completion is cached and kept up to date."""
+    from templateflow.conf import _s3
+    from templateflow.conf import index as tfindex
+
+    home = tmp_path / 'completions'
+    _s3.update(home, local=True, overwrite=True, silent=True, timeout=10)
+    full = tfindex.load_index(home)
+
+    completions = tfindex.load_completions(home)
+    assert (home / tfindex.COMPLETIONS).is_file()
+    assert sorted(completions) == sorted(full.get_templates())
+    assert completions['MNI152Lin']['resolution'] == ['1', '2']
+    assert 'template' not in completions['MNI152Lin']
+
+    with monkeypatch.context() as m:
+        m.setattr(tfindex, 'load_index', None)  # Indexing would fail
+        assert tfindex.load_completions(home) == completions
+
+    # New templates invalidate the cache
+    (home / 'tpl-Madeup').mkdir()
+    (home / 'tpl-Madeup' / 'tpl-Madeup_res-05_T1w.nii.gz').touch()
+    (home / tfindex.MANIFEST).unlink()
+    assert tfindex.load_completions(home)['Madeup'] == {
+        'extension': ['.nii.gz'],
+        'resolution': ['5'],
+        'suffix': ['T1w'],
+    }
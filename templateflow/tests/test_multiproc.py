@@ -25,3 +25,93 @@ def test_multi_proc_update(tmp_path, monkeypatch):
 
     for fut in futs:
         assert fut.result()
+
+
+def _get(root, s3_root):
+    from templateflow.client import TemplateFlowClient
+
+    client = TemplateFlowClient(
+        root=root, use_datalad=False, query_engine='native', s3_root=s3_root
+    )
+    return client.get('MNI152Lin', resolution=1, suffix='T1w', desc=None).read_bytes()
+
+
+def _die_locked(path):
+    from templateflow.conf._lock import FileLock
+
+    FileLock(path).acquire()
+    os._exit(0)
+
+
+def test_multi_proc_get(s3_server, s3_client):
+    """Check only one process downloads a file all of them need."""
+    from multiprocessing import get_context
+
+    client = s3_client()
+    root = client.cache.config.root
+    path = client.ls('MNI152Lin', resolution=1, suffix='T1w', desc=None)[0]
+    s3_server.serve({path: b'template'}, root)
+    s3_server.delay = 1
+
+    with ProcessPoolExecutor(max_workers=4, mp_context=get_context('spawn')) as executor:
+        futs = [executor.submit(_get, root, s3_server.url) for _ in range(4)]
+        assert [fut.result() for fut in futs] == [b'template'] * 4
+
+    assert len(s3_server.requests) == 1
+
+
+def test_stale_lock(tmp_path):
+    """Check locks held by processes that died are released."""
+    from multiprocessing import get_context
+    from threading import Thread
+
+    from templateflow.conf._lock import FileLock
+
+    lock = FileLock(tmp_path / 'locks' / 'file.lock')
+    proc = get_context('spawn').Process(target=_die_locked, args=(lock.path,))
+    proc.start()
+    proc.join()
+    assert lock.path.exists()
+
+    thread = Thread(target=lock.acquire, daemon=True)
+    thread.start()
+    thread.join(timeout=10)
+    assert lock.locked
+    lock.release()
+
+    assert not lock.path.exists()
+
+    # Locks cannot be created under a file, so they are skipped
+    lock.path.touch()
+    assert not FileLock(lock.path / 'nested.lock').acquire()
+
+
+def test_lock_cleanup(tmp_path):
+    """Check lock files are removed on release, without letting two holders in."""
+    from threading import Thread
+
+    from templateflow.conf._lock import FileLock
+
+    path = tmp_path / 'locks' / 'file.lock'
+    first, second, third = FileLock(path), FileLock(path), FileLock(path)
+    assert first.acquire()
+    waiting = Thread(target=second.acquire, daemon=True)
+    waiting.start()
+    waiting.join(timeout=0.2)
+    assert not second.locked
+
+    # The waiter locked the removed file, and moves on to a new one
+    first.release()
+    waiting.join(timeout=10)
+    assert second.locked
+    assert path.exists()
+
+    waiting = Thread(target=third.acquire, daemon=True)
+    waiting.start()
+    waiting.join(timeout=0.2)
+    assert not third.locked
+    second.release()
+    waiting.join(timeout=10)
+    assert third.locked
+    third.release()
+    assert not path.exists()
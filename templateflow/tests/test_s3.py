@@ -22,6 +22,7 @@
 #
 """Check S3-type repo tooling."""
 
+import json
 from importlib import reload
 from pathlib import Path
 
@@ -32,6 +33,7 @@ import templateflow
 import templateflow.conf._s3
 from templateflow import api as tf
 from templateflow import conf as tfc
+from templateflow.conf.cache import RetryPolicy
 
 from .data import load_data
 
@@ -47,6 +49,12 @@ def test_get_skel_file(tmp_path, monkeypatch):
             ok = True
             content = md5content
 
+            def iter_content(self, chunk_size=1):
+                yield self.content
+
+            def close(self):
+                pass
+
         return MockResponse()
 
     monkeypatch.setattr(requests, 'get', mock_get)
@@ -91,9 +99,231 @@ def test_update_s3(tmp_path, monkeypatch):
     assert tfc._s3.update(newhome, local=False, overwrite=False, timeout=10)
 
 
+def test_skeleton_delta(tmp_path, monkeypatch):
+    """Check skeletons are applied incrementally."""
+    import os
+    from zipfile import ZipFile
+
+    def _skeleton(name, members):
+        skel = tmp_path / name
+        with ZipFile(skel, 'w') as zipref:
+            for member, data in members.items():
+                zipref.writestr(member, data)
+        return skel
+
+    home = tmp_path / 'delta'
+    v1 = _skeleton(
+        'v1.zip',
+        {
+            'tpl-A/': b'',
+            'tpl-A/tpl-A_description.json': b'{}',
+            'tpl-A/tpl-A_T1w.nii.gz': b'',
+            'tpl-B/': b'',
+            'tpl-B/tpl-B_T1w.nii.gz': b'',
+        },
+    )
+    assert tfc._s3._update_skeleton(v1, home, overwrite=False, silent=True)
+    assert (home / tfc._s3.SKELETON_STATE).is_file()
+
+    # Unmodified folders are not even listed
+    with monkeypatch.context() as m:
+        m.setattr(os, 'listdir', None)
+        assert not tfc._s3._update_skeleton(v1, home, overwrite=False, silent=True)
+
+    # Files deleted since are restored
+    (home / 'tpl-A' / 'tpl-A_T1w.nii.gz').unlink()
+    assert tfc._s3._update_skeleton(v1, home, overwrite=False, silent=True)
+    assert (home / 'tpl-A' / 'tpl-A_T1w.nii.gz').is_file()
+
+    (home / 'tpl-B' / 'tpl-B_T1w.nii.gz').write_bytes(b'downloaded')
+    v2 = _skeleton(
+        'v2.zip',
+        {
+            'tpl-A/': b'',
+            'tpl-A/tpl-A_description.json': b'{"Name": "A"}',
+            'tpl-A/tpl-A_T2w.nii.gz': b'',
+        },
+    )
+    assert tfc._s3._update_skeleton(v2, home, overwrite=False, silent=True)
+    assert (home / 'tpl-A' / 'tpl-A_T2w.nii.gz').is_file()
+    # Placeholders dropped from the skeleton are removed, downloaded files are kept
+    assert not (home / 'tpl-A' / 'tpl-A_T1w.nii.gz').exists()
+    assert (home / 'tpl-B' / 'tpl-B_T1w.nii.gz').read_bytes() == b'downloaded'
+    # Changed files are only replaced when overwriting
+    assert (home / 'tpl-A' / 'tpl-A_description.json').read_bytes() == b'{}'
+    assert not tfc._s3._update_skeleton(v2, home, overwrite=False, silent=True)
+    assert tfc._s3._update_skeleton(v2, home, overwrite=True, silent=True)
+    assert (home / 'tpl-A' / 'tpl-A_description.json').read_bytes() == b'{"Name": "A"}'
+
+
+def test_skeleton_patch(tmp_path, monkeypatch, s3_server):
+    """Check skeletons are patched with deltas, or fetched whole if none is usable."""
+    from zipfile import ZipFile
+
+    published = s3_server.root / 'master'
+    published.mkdir()
+    monkeypatch.setattr(
+        tfc._s3, 'TF_SKEL_URL', f'{s3_server.url}/{{release}}/templateflow-skel.{{ext}}'.format
+    )
+    skeleton = published / 'templateflow-skel.zip'
+
+    def _publish(members, delta=False):
+        """Publish a skeleton, along with a delta from the one published before."""
+        earlier = tmp_path / 'earlier.zip'
+        if delta:
+            skeleton.replace(earlier)
+        with ZipFile(skeleton, 'w') as zipref:
+            for member in sorted(members):
+                zipref.writestr(member, members[member])
+        md5 = tfc._s3._file_md5(skeleton)
+        (published / 'templateflow-skel.md5').write_text(f'{md5}  -\n')
+        if delta:
+            base = tfc._s3._file_md5(earlier)
+            tfc._s3.make_delta(
+                earlier, skeleton, published / f'templateflow-skel.{base}.delta.zip'
+            )
+        s3_server.requests.clear()
+        return md5
+
+    def _update(**kwargs):
+        s3_server.requests.clear()
+        assert tfc._s3.update(home, local=False, silent=True, timeout=10, **kwargs)
+        return [path.rsplit('/', 1)[-1] for path, _ in s3_server.requests]
+
+    def _skeleton():
+        with ZipFile(home / tfc._s3.SKELETON) as zipref:
+            return {name: zipref.read(name) for name in zipref.namelist()}
+
+    home = tmp_path / 'patched'
+    v1 = {
+        'tpl-A/': b'',
+        'tpl-A/tpl-A_description.json': b'{}',
+        'tpl-A/tpl-A_T1w.nii.gz': b'',
+    }
+    v1_md5 = _publish(v1)
+    assert _update(overwrite=False, deltas=True) == [
+        'templateflow-skel.md5',
+        'templateflow-skel.zip',
+    ]
+    assert (home / tfc._s3.SKELETON).is_file()
+
+    # Skeletons are not fetched again while up-to-date, and local updates use them
+    s3_server.requests.clear()
+    assert not tfc._s3.update(home, local=False, overwrite=False, silent=True, timeout=10)
+    assert [path.rsplit('/', 1)[-1] for path, _ in s3_server.requests] == ['templateflow-skel.md5']
+    assert not tfc._s3.update(home, local=True, overwrite=False, silent=True, timeout=10)
+
+    v2 = {
+        'tpl-A/': b'',
+        'tpl-A/tpl-A_description.json': b'{"Name": "A"}',
+        'tpl-A/tpl-A_T2w.nii.gz': b'',
+    }
+    v2_md5 = _publish(v2, delta=True)
+    assert _update(overwrite=True, deltas=True) == [
+        'templateflow-skel.md5',
+        f'templateflow-skel.{v1_md5}.delta.zip',
+    ]
+    assert tfc._s3._file_md5(home / tfc._s3.SKELETON) == v2_md5
+    assert _skeleton() == v2
+    assert sorted(p.name for p in (home / 'tpl-A').iterdir()) == [
+        'tpl-A_T2w.nii.gz',
+        'tpl-A_description.json',
+    ]
+    assert (home / 'tpl-A' / 'tpl-A_description.json').read_bytes() == b'{"Name": "A"}'
+
+    # Without a delta from the current skeleton, the whole skeleton is fetched
+    v3 = {**v2, 'tpl-B/': b'', 'tpl-B/tpl-B_T1w.nii.gz': b''}
+    _publish(v3)
+    assert _update(overwrite=False, deltas=True) == [
+        'templateflow-skel.md5',
+        f'templateflow-skel.{v2_md5}.delta.zip',
+        'templateflow-skel.zip',
+    ]
+    assert (home / 'tpl-B' / 'tpl-B_T1w.nii.gz').is_file()
+
+    # Deltas rebuilding another skeleton than the one published are discarded
+    v4 = {**v3, 'tpl-B/tpl-B_T2w.nii.gz': b''}
+    v3_md5 = tfc._s3._file_md5(skeleton)
+    _publish(v4, delta=True)
+    with ZipFile(skeleton, 'a') as zipref:
+        zipref.writestr('tpl-B/tpl-B_PD.nii.gz', b'')
+    v4['tpl-B/tpl-B_PD.nii.gz'] = b''
+    (published / 'templateflow-skel.md5').write_text(f'{tfc._s3._file_md5(skeleton)}  -\n')
+    assert _update(overwrite=False, deltas=True) == [
+        'templateflow-skel.md5',
+        f'templateflow-skel.{v3_md5}.delta.zip',
+        'templateflow-skel.zip',
+    ]
+    assert _skeleton() == v4
+
+    # Deltas are only looked for when enabled
+    v5 = {**v4, 'tpl-C/': b''}
+    _publish(v5, delta=True)
+    assert _update(overwrite=False) == ['templateflow-skel.md5', 'templateflow-skel.zip']
+    assert _skeleton() == v5
+
+    # Once the package is upgraded, its skeleton supersedes the one fetched before
+    (home / tfc._s3.SKELETON_BASE).write_bytes(b'older package')
+    assert tfc._s3._cached_skeleton(home) == (None, None)
+    assert tfc._s3.update(home, local=True, overwrite=False, silent=True, timeout=10)
+    assert (home / 'tpl-MNI152Lin').is_dir()
+
+
+def test_update_ttl(tmp_path, monkeypatch, s3_server):
+    """Check upstream is only checked for updates once within the TTL."""
+    from zipfile import ZipFile
+
+    from templateflow.conf.cache import CacheConfig, TemplateFlowCache
+
+    published = s3_server.root / 'master'
+    published.mkdir()
+    monkeypatch.setattr(
+        tfc._s3, 'TF_SKEL_URL', f'{s3_server.url}/{{release}}/templateflow-skel.{{ext}}'.format
+    )
+
+    def _publish(md5, members):
+        (published / 'templateflow-skel.md5').write_text(f'{md5}  -\n')
+        with ZipFile(published / 'templateflow-skel.zip', 'w') as zipref:
+            for member in members:
+                zipref.writestr(member, b'')
+        s3_server.requests.clear()
+
+    def _update(ttl):
+        s3_server.requests.clear()
+        tfc._s3.update(home, local=False, overwrite=False, silent=True, timeout=10, ttl=ttl)
+        return [path.rsplit('/', 1)[-1] for path, _ in s3_server.requests]
+
+    home = tmp_path / 'ttl'
+    _publish('v1', ['tpl-A/', 'tpl-A/tpl-A_T1w.nii.gz'])
+    assert _update(ttl=60) == ['templateflow-skel.md5', 'templateflow-skel.zip']
+    check = json.loads((home / tfc._s3.UPDATE_CHECK).read_text())
+    assert check['md5'] == 'v1  -\n'
+    assert check['etag']
+
+    # Within the TTL, upstream is not checked at all
+    assert _update(ttl=60) == []
+
+    # Afterwards, the checksum is requested conditionally
+    assert _update(ttl=0) == ['templateflow-skel.md5']
+    assert json.loads((home / tfc._s3.UPDATE_CHECK).read_text())['checked'] > check['checked']
+
+    # Upstream changes are only picked up once the TTL expires
+    _publish('v2', ['tpl-A/', 'tpl-A/tpl-A_T1w.nii.gz', 'tpl-B/', 'tpl-B/tpl-B_T1w.nii.gz'])
+    assert _update(ttl=60) == []
+    assert not (home / 'tpl-B').exists()
+    assert _update(ttl=0)[-1] == 'templateflow-skel.zip'
+    assert (home / 'tpl-B' / 'tpl-B_T1w.nii.gz').is_file()
+
+    monkeypatch.setenv('TEMPLATEFLOW_UPDATE_TTL', '5')
+    cache = TemplateFlowCache(CacheConfig(root=home))
+    assert cache.config.update_ttl == 5
+    assert cache.manager.ttl == 5
+
+
 def mock_get(*args, **kwargs):
     class MockResponse:
         status_code = 400
+        ok = False
 
     return MockResponse()
 
@@ -134,8 +364,573 @@ def test_bad_skeleton(tmp_path, monkeypatch):
     path.write_bytes(error_file.read_bytes())
 
     monkeypatch.setattr(requests, 'get', mock_get)
+    monkeypatch.setattr(requests.Session, 'get', mock_get)
     with pytest.raises(RuntimeError):
         client.get('MNI152NLin2009cAsym', resolution='02', suffix='T1w', desc=None)
 
     # Running get clears bad files before attempting to download
     assert path.read_bytes() == b''
+
+
+def test_get_many(tmp_path, monkeypatch):
+    """Check batch queries fetch the union of their results once."""
+    client = templateflow.client.TemplateFlowClient(
+        root=tmp_path / 'get-many', use_datalad=False, query_engine='native'
+    )
+
+    fetched = []
+
+    def _fake_get(config, filepath, **kwargs):
+        fetched.append(filepath)
+        filepath.write_bytes(b'data')
+
+    monkeypatch.setattr(templateflow.client, '_s3_get', _fake_get)
+
+    queries = [
+        {'template': 'MNI152Lin', 'resolution': 1, 'suffix': 'T1w'},
+        {'template': 'MNI152Lin', 'resolution': 1, 'suffix': ['T1w', 'T2w']},
+        {'template': 'MNI152Lin', 'suffix': 'madeup'},
+    ]
+    listed = client.ls_many(queries)
+    assert [len(result) for result in listed] == [1, 2, 0]
+    assert 'template' in queries[0]  # Queries are not modified
+
+    results = client.get_many(queries)
+    assert results == [listed[0][0], listed[1], []]
+    assert sorted(fetched) == sorted(listed[1])
+
+    with pytest.raises(Exception, match='No results found'):
+        client.get_many(queries, raise_empty=True)
+
+    with pytest.raises(ValueError, match='does not specify a template'):
+        client.ls_many([{'suffix': 'T1w'}])
+
+
+def test_concurrent_get(tmp_path, monkeypatch):
+    """Check missing files are downloaded concurrently and failures reported together."""
+    from itertools import count
+    from threading import Barrier
+
+    monkeypatch.setenv('TEMPLATEFLOW_MAX_WORKERS', '4')
+    client = templateflow.client.TemplateFlowClient(
+        root=tmp_path / 'concurrent', use_datalad=False, query_engine='native'
+    )
+    assert client.cache.config.max_workers == 4
+
+    query = {'resolution': 1, 'suffix': ['T1w', 'T2w', 'PD', 'mask'], 'desc': [None, 'brain']}
+    paths = client.ls('MNI152NLin2009cAsym', **query)
+    assert len(paths) >= 4
+    failing = paths[1]
+    barrier = Barrier(4, timeout=5)
+    calls = count()
+
+    def _fake_get(config, filepath, **kwargs):
+        if next(calls) < barrier.parties:
+            barrier.wait()  # Times out unless four downloads are in flight
+        if filepath == failing:
+            raise RuntimeError('Failed to download with status code 503')
+        filepath.write_bytes(b'data')
+
+    monkeypatch.setattr(templateflow.client, '_s3_get', _fake_get)
+
+    with pytest.raises(RuntimeError, match='code 503') as excinfo:
+        client.get('MNI152NLin2009cAsym', **query)
+    assert str(failing) in str(excinfo.value)
+    assert not barrier.broken
+    assert [p for p in paths if p.read_bytes() == b'data'] == [p for p in paths if p != failing]
+
+    # Sequential downloads report failures in the same way
+    client.cache.config.max_workers = 1
+    calls = count(barrier.parties)
+    with pytest.raises(RuntimeError, match=f'{failing}: Failed'):
+        client.get('MNI152NLin2009cAsym', **query)
+
+
+def test_sessions(tmp_path, monkeypatch):
+    """Check network operations draw on per-thread sessions sharing one pool."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from requests.adapters import HTTPAdapter
+
+    monkeypatch.setenv('TEMPLATEFLOW_RETRIES', '5')
+    client = templateflow.client.TemplateFlowClient(
+        root=tmp_path / 'sessions', use_datalad=False, max_workers=16, query_engine='native'
+    )
+    cache = client.cache
+    assert cache.session is cache.session
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        other = executor.submit(lambda: cache.session).result()
+    assert other is not cache.session
+
+    adapter = cache.session.get_adapter(cache.config.s3_root)
+    assert isinstance(adapter, HTTPAdapter)
+    assert adapter is other.get_adapter('https://doi.org')
+    assert adapter.max_retries.total == 0  # Retries are handled by the policy
+    assert cache.config.retry.retries == 5
+    assert adapter._pool_maxsize == 16
+
+    # Downloads go through the session handed by the cache
+    urls = []
+
+    class MockSession:
+        def get(self, url, **kwargs):
+            urls.append(url)
+            return mock_get()
+
+    path = client.ls('MNI152Lin', resolution=1, suffix='T1w', desc=None)[0]
+    monkeypatch.setattr(requests, 'get', None)
+    with pytest.raises(RuntimeError, match='code 400'):
+        templateflow.client._s3_get(cache.config, path, session=MockSession())
+    assert urls == [f'{cache.config.s3_root}/tpl-MNI152Lin/tpl-MNI152Lin_res-01_T1w.nii.gz']
+
+    assert tfc._s3._get_skeleton_file(timeout=10, session=MockSession()) is None
+    assert len(urls) == 2
+
+    cache.sessions.close()
+    assert cache.session.get_adapter(cache.config.s3_root) is not adapter
+
+
+def test_resume(s3_server, s3_client):
+    """Check interrupted downloads are resumed and only moved into place when complete."""
+    from hashlib import md5
+
+    client = s3_client(retry=RetryPolicy(retries=0))
+    path = client.ls('MNI152Lin', resolution=1, suffix='T1w', desc=None)[0]
+    relpath = path.relative_to(client.cache.config.root).as_posix()
+    part = templateflow.client._part_file(path)
+    content = bytes(range(256)) * 1000
+    s3_server.serve({relpath: content})
+
+    s3_server.limit = 150_000
+    with pytest.raises(RuntimeError, match='Could not fetch'):
+        client.get('MNI152Lin', resolution=1, suffix='T1w', desc=None)
+    assert path.read_bytes() == b''  # The placeholder is left untouched
+    received = part.stat().st_size
+    assert 0 < received <= 150_000
+    assert part.read_bytes() == content[:received]
+
+    s3_server.limit = None
+    assert client.get('MNI152Lin', resolution=1, suffix='T1w', desc=None) == path
+    assert path.read_bytes() == content
+    assert not part.exists()
+    assert not templateflow.client._part_etag(part).exists()
+    assert s3_server.requests[-1] == (f'/{relpath}', f'bytes={received}-')
+
+    # Partial downloads that cannot be resumed start over
+    etag = f'"{md5(content, usedforsecurity=False).hexdigest()}"'
+    path.write_bytes(b'')
+    part.write_bytes(content + b'extra')
+    templateflow.client._part_etag(part).write_text(etag)
+    assert client.get('MNI152Lin', resolution=1, suffix='T1w', desc=None) == path
+    assert path.read_bytes() == content
+    assert s3_server.requests[-2:] == [
+        (f'/{relpath}', f'bytes={len(content) + 5}-'),
+        (f'/{relpath}', None),
+    ]
+    assert not part.exists()
+
+    # Partial downloads of a file that changed since are not spliced onto the new one
+    path.write_bytes(b'')
+    s3_server.limit = 150_000
+    with pytest.raises(RuntimeError, match='Could not fetch'):
+        client.get('MNI152Lin', resolution=1, suffix='T1w', desc=None)
+    assert templateflow.client._part_etag(part).read_text() == etag
+    part_size = part.stat().st_size
+    s3_server.limit = None
+    s3_server.serve({relpath: content[::-1]})
+    assert client.get('MNI152Lin', resolution=1, suffix='T1w', desc=None) == path
+    assert path.read_bytes() == content[::-1]
+    assert s3_server.requests[-1][1] == f'bytes={part_size}-'
+
+    # Partial downloads of unknown origin are started over
+    path.write_bytes(b'')
+    part.write_bytes(content[:100])
+    assert client.get('MNI152Lin', resolution=1, suffix='T1w', desc=None) == path
+    assert path.read_bytes() == content[::-1]
+    assert s3_server.requests[-1][1] is None
+
+
+def test_checksum(monkeypatch, s3_server, s3_client):
+    """Check downloads are verified against the manifest and refetched if corrupt."""
+    from hashlib import md5, sha256
+
+    from templateflow.conf.cache import STATE_DIR
+
+    client = s3_client(max_workers=1)
+    query = {'resolution': 1, 'suffix': 'T1w', 'desc': None}
+    path = client.ls('MNI152Lin', **query)[0]
+    relpath = path.relative_to(client.cache.config.root)
+    part = templateflow.client._part_file(path)
+    quarantined = client.cache.config.root / STATE_DIR / 'quarantine' / relpath
+    content = bytes(range(256)) * 40
+    s3_server.serve({relpath: content})
+
+    checksum = f'sha256:{sha256(content).hexdigest()}'
+    monkeypatch.setattr(client.cache, 'expected', lambda p: (len(content), checksum))
+
+    # A corrupt partial download is quarantined once complete, and fetched again
+    part.write_bytes(b'garbage')
+    templateflow.client._part_etag(part).write_text(
+        f'"{md5(content, usedforsecurity=False).hexdigest()}"'
+    )
+    with pytest.warns(UserWarning, match='does not match'):
+        assert client.get('MNI152Lin', **query) == path
+    assert path.read_bytes() == content
+    assert quarantined.read_bytes() == b'garbage' + content[7:]
+    assert [r for _, r in s3_server.requests] == ['bytes=7-', None]
+
+    # Corrupt files are not moved into place
+    path.write_bytes(b'')
+    s3_server.serve({relpath: content[::-1]})
+    with (
+        pytest.warns(UserWarning, match='does not match'),
+        pytest.raises(RuntimeError, match='still mismatched'),
+    ):
+        client.get('MNI152Lin', **query)
+    assert path.read_bytes() == b''
+    assert quarantined.read_bytes() == content[::-1]
+    assert not part.exists()
+
+    # Files the manifest holds no checksum for are verified against their ETag
+    monkeypatch.setattr(client.cache, 'expected', lambda p: (None, None))
+    part.write_bytes(b'garbage')
+    templateflow.client._part_etag(part).write_text(
+        f'"{md5(content[::-1], usedforsecurity=False).hexdigest()}"'
+    )
+    with pytest.warns(UserWarning, match='does not match md5:'):
+        assert client.get('MNI152Lin', **query) == path
+    assert path.read_bytes() == content[::-1]
+
+
+def test_multipart(monkeypatch, s3_server, s3_client):
+    """Check large files are downloaded as byte ranges in parallel."""
+    from hashlib import sha256
+    from threading import Lock
+
+    monkeypatch.setattr(templateflow.client, 'MULTIPART_CHUNKSIZE', 4096)
+    client = s3_client(multipart_threshold=10000)
+    query = {'resolution': 1, 'suffix': ['T1w', 'T2w'], 'desc': None}
+    large, small = client.ls('MNI152Lin', **query)
+    content = bytes(range(256)) * 100
+    s3_server.serve({large: content, small: content[:9999]}, client.cache.config.root)
+
+    checksum = f'sha256:{sha256(content).hexdigest()}'
+    monkeypatch.setattr(
+        client.cache, 'expected', lambda p: (None, checksum if p == large else None)
+    )
+
+    assert client.get('MNI152Lin', **query) == [large, small]
+    assert large.read_bytes() == content
+    assert small.read_bytes() == content[:9999]
+
+    ranges = sorted(r for p, r in s3_server.requests if r and p.endswith(large.name))
+    # The first range is read from the response that revealed the size
+    assert len(ranges) == 6
+    assert 'bytes=0-4095' not in ranges
+    assert 'bytes=24576-25599' in ranges
+    assert not any(r for p, r in s3_server.requests if p.endswith(small.name))
+
+    # Failed pieces are reported, and the preallocated file is discarded
+    large.write_bytes(b'')
+    s3_server.limit = 100
+    with pytest.raises(RuntimeError, match='Could not fetch'):
+        client.get('MNI152Lin', **query)
+    assert large.read_bytes() == b''
+    assert not templateflow.client._part_file(large).exists()
+    s3_server.limit = None
+
+    # Files downloaded concurrently share the bound on ranges fetched at once
+    class _Slots:
+        def __init__(self, slots):
+            self.slots, self.lock, self.held, self.peak = slots, Lock(), 0, 0
+
+        def __enter__(self):
+            self.slots.acquire()
+            with self.lock:
+                self.held += 1
+                self.peak = max(self.peak, self.held)
+
+        def __exit__(self, *exc_info):
+            with self.lock:
+                self.held -= 1
+            self.slots.release()
+
+    slots = _Slots(templateflow.client._range_slots(2))
+    monkeypatch.setattr(templateflow.client, '_range_slots', lambda max_workers: slots)
+    client = s3_client(multipart_threshold=9000, max_workers=2)
+    monkeypatch.setattr(client.cache, 'expected', lambda p: (None, None))
+    for path in (large, small):
+        path.write_bytes(b'')
+    s3_server.delay = 0.01
+    assert client.get('MNI152Lin', **query) == [large, small]
+    assert large.read_bytes() == content
+    assert 0 < slots.peak <= 2
+    s3_server.delay = 0
+
+
+def test_mirrors(monkeypatch, s3_server, s3_mirror, s3_client):
+    """Check downloads prefer the fastest mirror, fail over, and hedge slow requests."""
+    from time import monotonic
+
+    monkeypatch.setenv('TEMPLATEFLOW_S3_MIRRORS', s3_mirror.url)
+    client = s3_client(retry=RetryPolicy(retries=0))
+    assert client.cache.config.s3_mirrors == [s3_mirror.url]
+    assert client.cache.mirrors.roots == [s3_server.url, s3_mirror.url]
+
+    query = {'resolution': 1, 'desc': None}
+    t1w, t2w, pd = (
+        client.ls('MNI152Lin', suffix=suffix, **query)[0] for suffix in ('T1w', 'T2w', 'PD')
+    )
+    for state in (s3_server, s3_mirror):
+        state.serve({p: p.name.encode() for p in (t1w, t2w, pd)}, client.cache.config.root)
+
+    # Mirrors are probed before the first download, and the fastest one is used
+    monkeypatch.setattr(requests, 'head', None)  # Probes go through the pooled sessions
+    s3_server.delay = 0.2
+    assert client.get('MNI152Lin', suffix='T1w', **query) == t1w
+    assert t1w.read_bytes() == t1w.name.encode()
+    assert [p for p, _ in s3_server.requests] == ['/']
+    assert [p for p, _ in s3_mirror.requests] == [
+        '/',
+        f'/{t1w.relative_to(client.cache.config.root)}',
+    ]
+    assert client.cache.mirrors.ranked() == [s3_mirror.url, s3_server.url]
+
+    # Failing mirrors are skipped, and ranked last
+    s3_server.delay = 0
+    s3_mirror.status = 503
+    assert client.get('MNI152Lin', suffix='T2w', **query) == t2w
+    assert t2w.read_bytes() == t2w.name.encode()
+    assert client.cache.mirrors.ranked() == [s3_server.url, s3_mirror.url]
+
+    s3_server.status = 503
+    with pytest.raises(RuntimeError, match='status code 503'):
+        client.get('MNI152Lin', suffix='PD', **query)
+
+    # Slow requests are sent to the next mirror as well
+    s3_server.status = s3_mirror.status = None
+    s3_server.delay = 2
+    client.cache.config.hedge_after = 0.1
+    start = monotonic()
+    assert client.get('MNI152Lin', suffix='PD', **query) == pd
+    assert monotonic() - start < 1.5
+    assert pd.read_bytes() == pd.name.encode()
+    assert s3_mirror.requests[-1][0].endswith(pd.name)
+
+    # Probes of mirrors failing transiently are retried
+    from templateflow.conf._http import MirrorSet
+
+    s3_server.delay = 0
+    s3_server.status = 503
+    s3_server.requests.clear()
+    mirrors = MirrorSet(
+        [s3_server.url, s3_mirror.url],
+        sessions=client.cache.sessions,
+        retry=RetryPolicy(retries=1, backoff=0),
+    )
+    assert mirrors.ranked() == [s3_mirror.url, s3_server.url]
+    assert [p for p, _ in s3_server.requests] == ['/', '/']
+
+    # A list of roots configures mirrors too
+    config = tfc.cache.CacheConfig(s3_root=['https://a.org', 'https://b.org'], s3_mirrors=[])
+    assert (config.s3_root, config.s3_mirrors) == ('https://a.org', ['https://b.org'])
+
+
+def test_blob_store(tmp_path, monkeypatch, s3_server, s3_client):
+    """Check homes sharing a blob store download each file once."""
+    from hashlib import md5
+
+    from templateflow.conf._blobs import BlobStore
+
+    monkeypatch.setenv('TEMPLATEFLOW_BLOB_STORE', str(tmp_path / 'blobs'))
+    clients = [s3_client(home) for home in ('home-a', 'home-b')]
+    assert clients[0].cache.config.blob_store == tmp_path / 'blobs'
+
+    query = {'resolution': 1, 'suffix': 'T1w', 'desc': None}
+    relpath = clients[0].ls('MNI152Lin', **query)[0].relative_to(clients[0].cache.config.root)
+    s3_server.serve({relpath: b'shared'})
+    checksum = f'md5:{md5(b"shared", usedforsecurity=False).hexdigest()}'
+    for client in clients:
+        monkeypatch.setattr(client.cache, 'expected', lambda p: (None, checksum))
+
+    paths = [client.get('MNI152Lin', **query) for client in clients]
+    assert [p.read_bytes() for p in paths] == [b'shared', b'shared']
+    assert len(s3_server.requests) == 1
+
+    blob = BlobStore(tmp_path / 'blobs').path(checksum)
+    assert blob.stat().st_nlink == 3
+    assert paths[0].stat().st_ino == paths[1].stat().st_ino == blob.stat().st_ino
+
+    # Files the manifest holds no checksum for are shared by their ETag
+    s3_server.serve({relpath: b'unlisted'})
+    for path in paths:
+        path.unlink()  # Not truncated, which would modify the blob
+        path.touch()
+    for client in clients:
+        monkeypatch.setattr(client.cache, 'expected', lambda p: (None, None))
+    s3_server.requests.clear()
+    paths = [client.get('MNI152Lin', **query) for client in clients]
+    assert [p.read_bytes() for p in paths] == [b'unlisted', b'unlisted']
+    assert paths[0].stat().st_ino == paths[1].stat().st_ino
+    # The second home only needed the response headers
+    assert len(s3_server.requests) == 2
+    assert blob.read_bytes() == b'shared'
+
+
+def test_layers(tmp_path, s3_server, s3_client):
+    """Check files held by read-only layers are used in place, and only misses downloaded."""
+    site, project = tmp_path / 'site', tmp_path / 'project'
+    client = s3_client(layers=[str(site), project])
+    assert client.cache.config.layers == [site, project]
+
+    query = {'resolution': 1, 'desc': None}
+    t1w, t2w, pd = (client.ls('MNI152Lin', suffix=s, **query)[0] for s in ('T1w', 'T2w', 'PD'))
+    for layer, path, data in (
+        (site, t1w, b'site'),
+        (project, t1w, b'project'),
+        (site, t2w, b''),  # Skeleton placeholders are skipped
+        (project, t2w, b'project'),
+    ):
+        layered = layer / path.relative_to(client.cache.config.root)
+        layered.parent.mkdir(parents=True, exist_ok=True)
+        layered.write_bytes(data)
+    s3_server.serve({pd: b'downloaded'}, client.cache.config.root)
+
+    assert client.get('MNI152Lin', suffix='T1w', **query) == site / t1w.relative_to(
+        client.cache.config.root
+    )
+    assert client.get_many(
+        [{'template': 'MNI152Lin', 'suffix': s, **query} for s in ('T2w', 'PD')]
+    ) == [
+        project / t2w.relative_to(client.cache.config.root),
+        pd,
+    ]
+    assert pd.read_bytes() == b'downloaded'
+    assert [p for p, _ in s3_server.requests] == [f'/{pd.relative_to(client.cache.config.root)}']
+    assert t1w.read_bytes() == t2w.read_bytes() == b''
+
+
+def test_revalidate(s3_server, s3_mirror, s3_client):
+    """Check only files that changed upstream are downloaded again."""
+    import os
+
+    from templateflow.conf._validators import ValidatorStore
+
+    client = s3_client()
+    query = {'resolution': 1, 'suffix': ['T1w', 'T2w', 'PD'], 'desc': None}
+    t1w, t2w, pd = paths = client.ls('MNI152Lin', **query)
+    relpaths = [p.relative_to(client.cache.config.root).as_posix() for p in paths]
+    s3_server.serve(dict.fromkeys(relpaths, b'v1'))
+
+    assert client.get('MNI152Lin', **query) == paths
+    assert ValidatorStore(client.cache.config.root).get(relpaths[0])[0].startswith('"')
+    assert client.revalidate('MNI152Lin', **query) == []
+
+    # Files without validators are compared by modification time
+    ValidatorStore(client.cache.config.root).set(relpaths[1], None, None, s3_server.url)
+    os.utime(t2w, (0, 0))
+    s3_server.serve({relpaths[0]: b'v2'})
+    s3_server.requests.clear()
+    assert sorted(client.revalidate('MNI152Lin', **query)) == [t1w, t2w]
+    assert t1w.read_bytes() == b'v2'
+    assert pd.read_bytes() == b'v1'
+    assert sorted(p for p, r in s3_server.requests) == sorted(
+        [f'/{relpath}' for relpath in relpaths] + [f'/{relpaths[0]}', f'/{relpaths[1]}']
+    )
+
+    # Files are revalidated against the server they were downloaded from
+    validators = ValidatorStore(client.cache.config.root)
+    etag, last_modified, root = validators.get(relpaths[2])
+    assert root == s3_server.url
+    validators.set(relpaths[2], etag, last_modified, s3_mirror.url)
+    s3_mirror.serve({relpaths[2]: b'v1'})
+    mirrored = s3_client(s3_mirrors=[s3_mirror.url])
+    s3_server.requests.clear()
+    assert mirrored.revalidate('MNI152Lin', **query) == []
+    assert [p for p, _ in s3_mirror.requests] == [f'/{relpaths[2]}']
+    assert sorted(p for p, _ in s3_server.requests) == sorted(f'/{r}' for r in relpaths[:2])
+
+    # Validators recorded from servers no longer in use are discarded
+    s3_server.requests.clear()
+    assert client.revalidate('MNI152Lin', **query) == [paths[2]]
+    assert [p for p, _ in s3_server.requests].count(f'/{relpaths[2]}') == 2
+    assert validators.get(relpaths[2])[2] == s3_server.url
+
+
+def test_validators_schema(tmp_path):
+    """Check validators recorded with an outdated schema are discarded."""
+    import json
+
+    from templateflow.conf._validators import VALIDATORS, ValidatorStore
+
+    sidecar = tmp_path / VALIDATORS / 'tpl-A' / 'a.nii.gz.json'
+    sidecar.parent.mkdir(parents=True)
+    sidecar.write_text(json.dumps({'version': 0, 'etag': '"old"'}))
+
+    store = ValidatorStore(tmp_path)
+    assert store.get('tpl-A/a.nii.gz') == (None, None, None)
+    store.set('tpl-A/a.nii.gz', '"new"', None, 'https://a.org')
+    assert ValidatorStore(tmp_path).get('tpl-A/a.nii.gz') == ('"new"', None, 'https://a.org')
+    assert [p.name for p in sidecar.parent.iterdir()] == ['a.nii.gz.json']
+
+    # Unusable records are reported, and treated as missing
+    sidecar.write_text('{"version"')
+    with pytest.warns(UserWarning, match='Could not read the validators'):
+        assert store.get('tpl-A/a.nii.gz') == (None, None, None)
+
+    (tmp_path / VALIDATORS / 'tpl-B').write_text('')
+    with pytest.warns(UserWarning, match='Could not record the validators'):
+        store.set('tpl-B/b.nii.gz', '"new"', None, 'https://a.org')
+
+
+def test_progress(monkeypatch, capsys, s3_server, s3_client):
+    """Check progress is aggregated over all downloads, and reported to callbacks."""
+    from hashlib import md5, sha256
+
+    reports = []
+    client = s3_client(progress=reports.append)
+    query = {'resolution': 1, 'suffix': ['T1w', 'T2w'], 'desc': None}
+    paths = client.ls('MNI152Lin', **query)
+    s3_server.serve(
+        {path: b'x' * 100_000 * i for i, path in enumerate(paths, 1)}, client.cache.config.root
+    )
+
+    sizes = {paths[0]: None, paths[1]: 200_000}
+    monkeypatch.setattr(client.cache, 'expected', lambda p: (sizes[p], None))
+    client.get('MNI152Lin', **query)
+    assert (reports[0].files_done, reports[0].files_total, reports[0].bytes_total) == (0, 2, None)
+    final = reports[-1]
+    assert final.finished
+    assert (final.files_done, final.bytes_done, final.bytes_total) == (2, 300_000, 300_000)
+    assert final.eta == 0
+    assert capsys.readouterr().err == ''
+
+    # Bytes of downloads quarantined and fetched again are only counted once
+    reports.clear()
+    paths[0].write_bytes(b'')
+    part = templateflow.client._part_file(paths[0])
+    part.write_bytes(b'garbage')
+    templateflow.client._part_etag(part).write_text(
+        f'"{md5(b"x" * 100_000, usedforsecurity=False).hexdigest()}"'
+    )
+    checksum = f'sha256:{sha256(b"x" * 100_000).hexdigest()}'
+    monkeypatch.setattr(client.cache, 'expected', lambda p: (None, checksum))
+    with pytest.warns(UserWarning, match='does not match'):
+        client.get('MNI152Lin', **query)
+    assert (reports[-1].bytes_done, reports[-1].bytes_total) == (100_000, 100_000)
+    monkeypatch.setattr(client.cache, 'expected', lambda p: (sizes[p], None))
+
+    # A single progress bar is shown by default, and nothing in quiet mode
+    for path in paths:
+        path.write_bytes(b'')
+    client.cache.config.progress = True
+    client.get('MNI152Lin', **query)
+    assert capsys.readouterr().err.count('Downloading') >= 1
+
+    for path in paths:
+        path.write_bytes(b'')
+    monkeypatch.setenv('TEMPLATEFLOW_PROGRESS', '0')
+    quiet = s3_client()
+    assert quiet.cache.config.progress is False
+    quiet.get('MNI152Lin', **query)
+    assert capsys.readouterr().err == ''